@@ -0,0 +1,290 @@
+"""Bulk catalog import and incremental sync from a supplier feed.
+
+Reads CSV or JSON-lines feeds as a stream (one row at a time) and loads them
+into PostgreSQL in batches:
+
+1. ``COPY`` each batch into a temporary staging table.
+2. ``INSERT ... SELECT ... ON CONFLICT (sku) DO UPDATE ... WHERE ... IS DISTINCT
+   FROM ...``, which inserts new SKUs and rewrites only rows whose fields
+   actually changed. Unchanged rows are never touched, so a stock feed every
+   few minutes writes only the deltas.
+3. If anything changed, bump ``catalog_meta.version`` in the same transaction.
+   Process-local caches (the search index) poll that version and resync.
+
+Feed columns: ``sku, anchor, name, price`` (decimal, or ``price_cents``),
+``stock`` and an optional ``image_url``.
+
+Usage::
+
+    python -m app.catalog_sync supplier.csv [--format jsonl] [--batch-size 5000] [--delete-missing]
+
+Afterwards, product images not yet prepared for WhatsApp are fetched and
+stored under content-hashed names (``app.media``); ``--skip-media`` skips it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import IO, Iterable, Iterator, NamedTuple, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models import CatalogMeta
+from app.utils import logger
+
+CATALOG_VERSION_KEY = "version"
+_STAGING = "products_staging"
+_FIELDS = ("sku", "anchor", "name", "price_cents", "stock", "image_url")
+
+
+class FeedRow(NamedTuple):
+    sku: str
+    anchor: str
+    name: str
+    price_cents: int
+    stock: int
+    image_url: Optional[str]
+
+
+class ImportStats(NamedTuple):
+    read: int
+    rejected: int
+    inserted: int
+    updated: int
+    deleted: int
+    version: Optional[int]
+    seconds: float
+
+    @property
+    def unchanged(self) -> int:
+        return self.read - self.rejected - self.inserted - self.updated
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.read / self.seconds if self.seconds > 0 else 0.0
+
+
+def _price_cents(record: dict) -> int:
+    if record.get("price_cents") not in (None, ""):
+        return int(record["price_cents"])
+    price = Decimal(str(record["price"]).replace(",", "").replace("$", "").strip())
+    return int((price * 100).to_integral_value())
+
+
+def normalize_record(record: dict) -> FeedRow:
+    """Validate one feed record; raises ValueError/KeyError on bad input."""
+    sku = str(record["sku"]).strip()
+    anchor = str(record["anchor"]).strip().lower()
+    name = str(record["name"]).strip()
+    if not (sku and anchor and name):
+        raise ValueError("sku, anchor and name are required")
+    try:
+        price_cents = _price_cents(record)
+    except InvalidOperation as exc:
+        raise ValueError(f"bad price {record.get('price')!r}") from exc
+    stock = int(record.get("stock") or 0)
+    if price_cents < 0 or stock < 0:
+        raise ValueError("price and stock must be non-negative")
+    image_url = str(record.get("image_url") or "").strip() or None
+    return FeedRow(sku, anchor, name, price_cents, stock, image_url)
+
+
+def _records(handle: IO[str], fmt: str) -> Iterator[dict]:
+    if fmt == "csv":
+        yield from csv.DictReader(handle)
+    elif fmt == "jsonl":
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f"Unknown feed format {fmt!r}; use csv or jsonl")
+
+
+class FeedReader:
+    """Iterates valid rows of a feed, counting rejected records as it goes."""
+
+    def __init__(self, handle: IO[str], fmt: str) -> None:
+        self.handle = handle
+        self.fmt = fmt
+        self.read = 0
+        self.rejected = 0
+
+    def __iter__(self) -> Iterator[FeedRow]:
+        for number, record in enumerate(_records(self.handle, self.fmt), start=1):
+            self.read += 1
+            try:
+                yield normalize_record(record)
+            except (KeyError, TypeError, ValueError) as exc:
+                self.rejected += 1
+                logger.warning("Feed record %s rejected: %s", number, exc)
+
+
+def detect_format(path: str) -> str:
+    return "jsonl" if Path(path).suffix.lower() in {".jsonl", ".ndjson", ".json"} else "csv"
+
+
+def staging_csv(rows: Iterable[FeedRow]) -> io.StringIO:
+    """Render rows as COPY-ready CSV (empty field = NULL)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+    buffer.seek(0)
+    return buffer
+
+
+def _batches(rows: Iterable[FeedRow], size: int) -> Iterator[list[FeedRow]]:
+    batch: list[FeedRow] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_UPSERT_SQL = f"""
+WITH upserted AS (
+    INSERT INTO products ({", ".join(_FIELDS)})
+    SELECT DISTINCT ON (sku) {", ".join(_FIELDS)}
+    FROM {_STAGING}
+    ORDER BY sku, seq DESC
+    ON CONFLICT (sku) DO UPDATE SET
+        anchor = EXCLUDED.anchor,
+        name = EXCLUDED.name,
+        price_cents = EXCLUDED.price_cents,
+        stock = EXCLUDED.stock,
+        image_url = EXCLUDED.image_url
+    WHERE (products.anchor, products.name, products.price_cents, products.stock, products.image_url)
+        IS DISTINCT FROM
+        (EXCLUDED.anchor, EXCLUDED.name, EXCLUDED.price_cents, EXCLUDED.stock, EXCLUDED.image_url)
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+"""
+
+_BUMP_VERSION_SQL = """
+INSERT INTO catalog_meta (key, value) VALUES (%s, 1)
+ON CONFLICT (key) DO UPDATE SET value = catalog_meta.value + 1
+RETURNING value
+"""
+
+
+def import_feed(
+    engine: Engine,
+    reader: FeedReader,
+    *,
+    batch_size: int = 5000,
+    delete_missing: bool = False,
+) -> ImportStats:
+    """Upsert a whole feed in one transaction and bump the catalog version on change."""
+    started = time.perf_counter()
+    inserted = updated = deleted = 0
+    version = None
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(
+            f"CREATE TEMP TABLE {_STAGING} (seq BIGSERIAL, sku TEXT, anchor TEXT, name TEXT, "
+            "price_cents INTEGER, stock INTEGER, image_url TEXT) ON COMMIT DROP"
+        )
+        if delete_missing:
+            cursor.execute("CREATE TEMP TABLE feed_skus (sku TEXT PRIMARY KEY) ON COMMIT DROP")
+
+        copy_sql = f"COPY {_STAGING} ({', '.join(_FIELDS)}) FROM STDIN WITH (FORMAT csv)"
+        for batch in _batches(reader, batch_size):
+            cursor.copy_expert(copy_sql, staging_csv(batch))
+            cursor.execute(_UPSERT_SQL)
+            batch_inserted, batch_updated = cursor.fetchone()
+            inserted += batch_inserted
+            updated += batch_updated
+            if delete_missing:
+                cursor.execute(
+                    f"INSERT INTO feed_skus SELECT DISTINCT sku FROM {_STAGING} ON CONFLICT DO NOTHING"
+                )
+            cursor.execute(f"TRUNCATE {_STAGING}")
+
+        if delete_missing:
+            cursor.execute(
+                "DELETE FROM products WHERE sku IS NOT NULL "
+                "AND NOT EXISTS (SELECT 1 FROM feed_skus WHERE feed_skus.sku = products.sku)"
+            )
+            deleted = cursor.rowcount
+
+        if inserted or updated or deleted:
+            cursor.execute(_BUMP_VERSION_SQL, (CATALOG_VERSION_KEY,))
+            version = cursor.fetchone()[0]
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    return ImportStats(
+        reader.read, reader.rejected, inserted, updated, deleted, version, time.perf_counter() - started
+    )
+
+
+def catalog_version(db: Session) -> Optional[int]:
+    """Current catalog version, or None if it cannot be read (e.g. table missing)."""
+    try:
+        return db.query(CatalogMeta.value).filter(CatalogMeta.key == CATALOG_VERSION_KEY).scalar()
+    except SQLAlchemyError as exc:
+        db.rollback()
+        logger.warning("Catalog version unavailable: %s", exc)
+        return None
+
+
+def _main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.catalog_sync", description=__doc__.split("\n")[0])
+    parser.add_argument("feed", help="CSV or JSON-lines supplier feed ('-' for stdin)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument(
+        "--delete-missing", action="store_true", help="Full sync: delete SKUs absent from the feed"
+    )
+    parser.add_argument("--skip-media", action="store_true", help="Do not pre-warm product images")
+    args = parser.parse_args(argv)
+
+    from app.database import catalog_engine
+
+    fmt = args.format or ("csv" if args.feed == "-" else detect_format(args.feed))
+    handle = sys.stdin if args.feed == "-" else open(args.feed, encoding="utf-8", newline="")
+    try:
+        stats = import_feed(
+            catalog_engine,
+            FeedReader(handle, fmt),
+            batch_size=args.batch_size,
+            delete_missing=args.delete_missing,
+        )
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+    print(
+        f"read={stats.read} rejected={stats.rejected} inserted={stats.inserted} "
+        f"updated={stats.updated} unchanged={stats.unchanged} deleted={stats.deleted} "
+        f"version={stats.version} in {stats.seconds:.2f}s ({stats.rows_per_second:,.0f} rows/s)"
+    )
+    if not args.skip_media:
+        from app.media import warm_catalog_images
+
+        media = warm_catalog_images(catalog_engine)
+        print(f"images: ready={media.ready} prepared={media.prepared} failed={media.failed}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main(sys.argv[1:]))
@@ -13,6 +13,9 @@ DB_CATALOG_PASSWORD = config("DB_CATALOG_PASSWORD")
 DB_CHAT_NAME = config("DB_CHAT_NAME", default="postgres")
 DB_CATALOG_NAME = config("DB_CATALOG_NAME", default="my_catalog_db")
 
+CONVERSATION_PARTITIONING = config("CONVERSATION_PARTITIONING", cast=bool, default=False)
+CONVERSATION_RETENTION_MONTHS = config("CONVERSATION_RETENTION_MONTHS", cast=int, default=0)
+
 chat_url = URL.create(
     drivername="postgresql+psycopg2",
     username=DB_USER,
@@ -0,0 +1,56 @@
+"""Compact catalog context for grounding LLM sales replies.
+
+The top-k products for the customer's message come from the in-memory search
+index (no DB round trip). They are rendered as a token-budgeted
+``producto | precio | stock`` table and passed to the model, so it can quote
+real prices instead of refusing or asking for another turn. The rendered
+table is cached per retrieved product set, so a repeated question costs a
+dict lookup.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+
+from decouple import config
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.search import CatalogEntry, get_catalog_index
+from app.utils import logger
+
+GROUNDING_TOP_K = config("GROUNDING_TOP_K", cast=int, default=5)
+GROUNDING_TOKEN_BUDGET = config("GROUNDING_TOKEN_BUDGET", cast=int, default=160)
+
+_HEADER = "Catálogo disponible (producto | precio USD | stock):"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for Spanish/English text)."""
+    return max(1, (len(text) + 3) // 4)
+
+
+@lru_cache(maxsize=1024)
+def format_catalog_context(entries: tuple[CatalogEntry, ...], budget_tokens: int) -> str:
+    lines = [_HEADER]
+    used = estimate_tokens(_HEADER)
+    for entry in entries:
+        line = f"{entry.name} | {entry.price_cents / 100.0:.2f} | {entry.stock}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget_tokens:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines) if len(lines) > 1 else ""
+
+
+def catalog_context_for(db_catalog: Session, text: str) -> str:
+    """Catalog table relevant to ``text``, or an empty string if nothing matches."""
+    try:
+        hits = get_catalog_index(db_catalog).search(text, limit=GROUNDING_TOP_K)
+    except SQLAlchemyError as exc:
+        logger.error("Catalog grounding unavailable: %s", exc)
+        return ""
+    if not hits:
+        return ""
+    return format_catalog_context(tuple(hit.entry for hit in hits), GROUNDING_TOKEN_BUDGET)
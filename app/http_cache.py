@@ -0,0 +1,211 @@
+"""HTTP caching and compression helpers.
+
+* ``conversation_validators`` / ``not_modified``: ETag and Last-Modified for
+  the conversation views, derived from the newest conversation row (one
+  primary-key index lookup). Unchanged pages are answered with ``304`` before
+  any counting or rendering.
+* ``CompressionMiddleware``: pure ASGI brotli/gzip for HTML, JSON, CSS and JS.
+  Brotli needs the optional ``brotli`` package; without it only gzip is offered.
+* ``CachedStaticFiles``: ``StaticFiles`` that marks content-addressed files
+  (named by the hash of their bytes, see ``utils.write_content_addressed``)
+  as immutable for a year. An optional ``on_response(name, status)`` callback
+  sees every file served (``media.record_public_fetch`` counts them).
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import re
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Optional
+
+from fastapi import Request, Response
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.models import Conversation
+
+try:  # optional dependency
+    import brotli
+except ImportError:  # pragma: no cover - exercised only without brotli installed
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_CACHE_CONTROL = "public, max-age=300"
+PRIVATE_REVALIDATE = "private, no-cache"
+
+_CONTENT_ADDRESSED_RE = re.compile(r"^(?:[a-z]+_)?[0-9a-f]{32,64}\.[a-z0-9]+$")
+_COMPRESSIBLE_TYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+)
+
+
+def conversation_validators(db: Session) -> tuple[str, Optional[datetime]]:
+    """Weak ETag and Last-Modified of the conversation list, from the newest row."""
+    newest = (
+        db.query(Conversation.id, Conversation.created_at)
+        .order_by(Conversation.id.desc())
+        .limit(1)
+        .first()
+    )
+    if newest is None:
+        return 'W/"conversations-0"', None
+    last_modified = newest.created_at if isinstance(newest.created_at, datetime) else None
+    return f'W/"conversations-{newest.id}"', last_modified
+
+
+def _http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": PRIVATE_REVALIDATE}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+
+def _opaque(tag: str) -> str:
+    return tag.strip().removeprefix("W/")
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Evaluate If-None-Match (weak comparison), else If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or _opaque(etag) in {
+            _opaque(tag) for tag in if_none_match.split(",")
+        }
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime]) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+class CachedStaticFiles(StaticFiles):
+    """Static files with Cache-Control; content-addressed names are immutable."""
+
+    def __init__(self, *args, on_response: Optional[Callable[[str, int], None]] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.on_response = on_response
+
+    def file_response(self, full_path, stat_result, scope, status_code=200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        name = os.path.basename(full_path)
+        if _CONTENT_ADDRESSED_RE.match(name):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers.setdefault("Cache-Control", STATIC_CACHE_CONTROL)
+        if self.on_response is not None:
+            self.on_response(name, response.status_code)
+        return response
+
+
+def _choose_encoding(accept_encoding: str) -> Optional[str]:
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip()] = quality
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+class CompressionMiddleware:
+    """Compress text responses of at least ``minimum_size`` bytes.
+
+    Non-compressible responses (PDFs, images, files already encoded) pass
+    through unbuffered; compressible ones are small and are buffered whole so
+    Content-Length stays exact.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = _choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        chunks: list[bytes] = []
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if (
+                    message["status"] < 200
+                    or message["status"] in (204, 304)
+                    or "content-encoding" in headers
+                    or not content_type.startswith(_COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start["headers"])
+            if len(body) >= self.minimum_size:
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+            headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -4,6 +4,7 @@ import base64
 import json
 import logging
 import mimetypes
+import threading
 import time
 from pathlib import Path
 
@@ -11,6 +12,16 @@ from decouple import config
 from openai import BadRequestError, OpenAI
 
 from app.catalog import hardware_anchors_prompt_list
+from app.tracing import set_span_attributes, span, traced
+from app.usage import current_policy, record_usage
+from app.vision_gate import (
+    GateDecision,
+    append_sample,
+    image_features,
+    load_gate_model,
+    prefilter,
+    vision_gate_enabled,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,15 +31,27 @@ _SYS_PROMPT_SALES = (
     "Eres asistente de ventas de la ferretería Freund. Habla español, claro y breve. "
     "Solo atiende consultas de FERRETERÍA (herramientas, materiales, precios, stock, cotizaciones). "
     "Si el usuario pide algo fuera de ese ámbito, redirígelo con 1 oración a nuestro catálogo. "
-    "No inventes precios ni stock; usa solo lo indicado por el usuario o reglas del sistema. "
+    "No inventes precios ni stock; usa solo la tabla de catálogo provista, lo indicado por el "
+    "usuario o reglas del sistema. "
     "Responde en 1–2 oraciones máximo."
 )
 
+SALES_MODEL = "gpt-4o-mini"
+
 _OPENAI_MAX_TOKENS = 160
 _OPENAI_TEMP = 0.2
 _OPENAI_STOP = ["\n\n"]
 _TRIM_LEN = 3000
 
+_VISION_ESCALATE_BELOW = config("VISION_ESCALATE_BELOW", cast=float, default=0.5)
+_VISION_GATE_SAMPLES_PATH = config("VISION_GATE_SAMPLES_PATH", default="")
+
+_gate_failed = False  # set once the local gate has raised; it is skipped from then on
+
+_tier_lock = threading.Lock()
+_tier_stats: dict[str, dict[str, float]] = {}
+_tier_outcomes: dict[str, int] = {}
+
 _DEV_PROMPT_VISION = (
     "Developer message\n"
     "# Role and Objective\n"
@@ -71,24 +94,31 @@ def _trim(text: str, limit: int = _TRIM_LEN) -> str:
     return trimmed if len(trimmed) <= limit else trimmed[-limit:]
 
 
-def llm_sales_reply(user_text: str, *, max_retries: int = 3) -> str:
+@traced(model=SALES_MODEL)
+def llm_sales_reply(user_text: str, *, catalog_context: str = "", max_retries: int = 3) -> str:
     text = _trim(user_text)
     if not text:
         return ""
 
+    messages = [{"role": "system", "content": _SYS_PROMPT_SALES}]
+    if catalog_context:
+        messages.append({"role": "system", "content": catalog_context})
+    messages.append({"role": "user", "content": text})
+
+    policy = current_policy()
+    max_tokens = min(_OPENAI_MAX_TOKENS, policy.max_tokens or _OPENAI_MAX_TOKENS)
     client = get_openai_client()
     for attempt in range(1, max_retries + 1):
         try:
-            completion = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": _SYS_PROMPT_SALES},
-                    {"role": "user", "content": text},
-                ],
-                max_tokens=_OPENAI_MAX_TOKENS,
-                temperature=_OPENAI_TEMP,
-                stop=_OPENAI_STOP,
-            )
+            with span("openai.chat.completions", model=SALES_MODEL, attempt=attempt, budget=policy.level):
+                completion = client.chat.completions.create(
+                    model=SALES_MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=_OPENAI_TEMP,
+                    stop=_OPENAI_STOP,
+                )
+            record_usage(SALES_MODEL, completion)
             return (completion.choices[0].message.content or "").strip()
         except Exception:
             if attempt < max_retries:
@@ -136,11 +166,11 @@ def _to_data_url(local_path: str) -> str:
     return f"data:{mime};base64,{encoded}"
 
 
-def _responses_call_image_gpt5nano(image_ref: str, *, detail: str = "low"):
-    client = get_openai_client()
-    return client.responses.create(
-        model="gpt-5-nano",
-        input=[
+def vision_request_body(model: str, image_ref: str, *, detail: str = "low") -> dict:
+    """Responses API request for one image (also the body of a Batch API line)."""
+    return {
+        "model": model,
+        "input": [
             {
                 "role": "system",
                 "content": [
@@ -156,42 +186,123 @@ def _responses_call_image_gpt5nano(image_ref: str, *, detail: str = "low"):
                 ],
             },
         ],
-        reasoning={"effort": "minimal"},
-        text={"verbosity": "low"},
-        max_output_tokens=180,
-    )
+        "reasoning": {"effort": "minimal"},
+        "text": {"verbosity": "low"},
+        "max_output_tokens": 180,
+    }
+
+
+def _responses_call_image_gpt5nano(image_ref: str, *, detail: str = "low"):
+    return get_openai_client().responses.create(**vision_request_body("gpt-5-nano", image_ref, detail=detail))
 
 
 def _responses_call_image_gpt5(image_ref: str, *, detail: str = "low"):
-    client = get_openai_client()
-    return client.responses.create(
-        model="gpt-5",
-        input=[
-            {
-                "role": "system",
-                "content": [
-                    {"type": "input_text", "text": _DEV_PROMPT_VISION},
-                    {"type": "input_text", "text": _vision_class_prompt()},
-                ],
-            },
-            {
-                "role": "user",
-                "content": [
-                    {"type": "input_text", "text": "Clasifica esta imagen y responde SOLO JSON válido."},
-                    {"type": "input_image", "image_url": image_ref, "detail": detail},
-                ],
-            },
-        ],
-        reasoning={"effort": "minimal"},
-        text={"verbosity": "low"},
-        max_output_tokens=180,
-    )
+    return get_openai_client().responses.create(**vision_request_body("gpt-5", image_ref, detail=detail))
+
+
+def _record_tier(tier: str, started: float) -> None:
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _tier_lock:
+        stats = _tier_stats.setdefault(tier, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
 
 
+def _count_outcome(outcome: str) -> None:
+    with _tier_lock:
+        _tier_outcomes[outcome] = _tier_outcomes.get(outcome, 0) + 1
+
+
+def vision_tier_stats() -> dict:
+    """Per-tier call volume and latency since process start."""
+    with _tier_lock:
+        tiers = {
+            tier: {
+                "calls": stats["calls"],
+                "avg_ms": round(stats["total_ms"] / stats["calls"], 2) if stats["calls"] else 0.0,
+                "max_ms": round(stats["max_ms"], 2),
+            }
+            for tier, stats in _tier_stats.items()
+        }
+        return {"tiers": tiers, "outcomes": dict(_tier_outcomes)}
+
+
+def _call_vision_tier(call, tier: str, image_ref: str, detail: str, attempt: int = 1) -> dict:
+    with span(f"vision.{tier}", model=tier, attempt=attempt, detail=detail) as current:
+        started = time.perf_counter()
+        try:
+            response = call(image_ref, detail=detail)
+        finally:
+            _record_tier(tier, started)
+        record_usage(tier, response)
+        raw = getattr(response, "output_text", "").strip()
+        result = _parse_strict_json(raw)
+        if current is not None:
+            current.set_attribute("app.confidence", result["confidence"])
+    result["model"] = tier
+    logger.info("[Vision OK %s] anchor=%r conf=%.2f", tier, result["anchor"], result["confidence"])
+    return result
+
+
+def _gate_decision(features: dict) -> GateDecision | None:
+    """The local gate's decision, or None if it cannot run (e.g. an unreadable gate model)."""
+    global _gate_failed
+    if _gate_failed:
+        return None
+    try:
+        return prefilter(features, load_gate_model())
+    except Exception as exc:
+        _gate_failed = True
+        logger.error("Vision gate failed, sending images to the remote tiers until restart: %s", exc)
+        return None
+
+
+@traced("vision.local", model="local")
+def _local_prefilter(local_path: str) -> tuple[dict | None, dict | None]:
+    """Return (features, rejected_result); features are also kept for gate training."""
+    if not (vision_gate_enabled() or _VISION_GATE_SAMPLES_PATH):
+        return None, None
+    started = time.perf_counter()
+    features = image_features(local_path)
+    decision = _gate_decision(features) if features and vision_gate_enabled() else None
+    if decision is not None:
+        _record_tier("local", started)
+    if decision is not None and decision.verdict == "reject":
+        logger.info("[Vision local] rejected reason=%s score=%.2f", decision.reason, decision.product_score)
+        _count_outcome(f"local_reject:{decision.reason}")
+        return features, {
+            "anchor": None,
+            "description": "",
+            "confidence": round(1.0 - decision.product_score, 2),
+            "model": "local",
+        }
+    return features, None
+
+
+def _keep_sample(features: dict | None, result: dict) -> dict:
+    if features and _VISION_GATE_SAMPLES_PATH:
+        try:
+            append_sample(_VISION_GATE_SAMPLES_PATH, features, result)
+        except OSError as exc:
+            logger.warning("[Vision] could not append gate sample: %s", exc)
+    return result
+
+
+@traced()
 def llm_classify_image(
     image_reference: str, *, max_retries: int = 3, force_detail: str = "low"
 ) -> dict:
+    """Tiered classification: local pre-filter → gpt-5-nano → gpt-5.
+
+    gpt-5 is used when nano fails, or when nano's confidence is below
+    ``VISION_ESCALATE_BELOW``; the more confident of the two answers wins.
+    Under budget pressure low-confidence answers are not escalated; with the
+    budget exhausted gpt-5 is not called at all.
+    """
     last_err = None
+    policy = current_policy()
+    set_span_attributes(budget=policy.level)
 
     use_data_url = False
     try:
@@ -199,6 +310,12 @@ def llm_classify_image(
     except Exception:
         use_data_url = False
 
+    features = None
+    if use_data_url:
+        features, rejected = _local_prefilter(image_reference)
+        if rejected is not None:
+            return rejected
+
     try:
         image_ref = _to_data_url(image_reference) if use_data_url else image_reference
         if use_data_url:
@@ -210,16 +327,22 @@ def llm_classify_image(
     for attempt in range(1, max_retries + 1):
         logger.info("[Vision attempt %s] steps: (1) gpt-5-nano → (2) gpt-5", attempt)
 
+        nano_result = None
         try:
-            response = _responses_call_image_gpt5nano(image_ref, detail=force_detail)
-            raw = getattr(response, "output_text", "").strip()
-            result = _parse_strict_json(raw)
+            nano_result = _call_vision_tier(
+                _responses_call_image_gpt5nano, "gpt-5-nano", image_ref, force_detail, attempt
+            )
+            if nano_result["confidence"] >= _VISION_ESCALATE_BELOW:
+                _count_outcome("nano")
+                return _keep_sample(features, nano_result)
+            if not policy.allow_escalation:
+                _count_outcome("nano_budget")
+                return _keep_sample(features, nano_result)
             logger.info(
-                "[Vision OK nano] anchor=%r conf=%.2f",
-                result["anchor"],
-                result["confidence"],
+                "[Vision] nano conf=%.2f below %.2f; escalating to gpt-5",
+                nano_result["confidence"],
+                _VISION_ESCALATE_BELOW,
             )
-            return result
         except BadRequestError as exc:
             logger.warning("[nano 400] %s", exc)
             last_err = exc
@@ -227,16 +350,19 @@ def llm_classify_image(
             logger.warning("[nano fail] %s: %s", type(exc).__name__, exc)
             last_err = exc
 
+        if not policy.allow_gpt5:
+            if attempt < max_retries:
+                time.sleep(2 ** (attempt - 1))
+            continue
+
         try:
-            response = _responses_call_image_gpt5(image_ref, detail=force_detail)
-            raw = getattr(response, "output_text", "").strip()
-            result = _parse_strict_json(raw)
-            logger.info(
-                "[Vision OK gpt-5] anchor=%r conf=%.2f",
-                result["anchor"],
-                result["confidence"],
+            result = _call_vision_tier(
+                _responses_call_image_gpt5, "gpt-5", image_ref, force_detail, attempt
             )
-            return result
+            if nano_result is not None and nano_result["confidence"] > result["confidence"]:
+                result = nano_result
+            _count_outcome("escalated" if nano_result is not None else "gpt-5")
+            return _keep_sample(features, result)
         except BadRequestError as exc:
             logger.warning("[gpt-5 400] %s", exc)
             last_err = exc
@@ -244,8 +370,13 @@ def llm_classify_image(
             logger.warning("[gpt-5 fail] %s: %s", type(exc).__name__, exc)
             last_err = exc
 
+        if nano_result is not None:
+            _count_outcome("nano")
+            return _keep_sample(features, nano_result)
+
         if attempt < max_retries:
             time.sleep(2 ** (attempt - 1))
 
     logger.error("[Vision FALLBACK] returning defaults after retries. last_err=%s", last_err)
-    return {"anchor": None, "description": "", "confidence": 0.0}
\ No newline at end of file
+    _count_outcome("fallback")
+    return {"anchor": None, "description": "", "confidence": 0.0, "model": None}
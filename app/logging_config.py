@@ -0,0 +1,101 @@
+"""Non-blocking, structured logging.
+
+Records are put on an in-memory queue by a ``QueueHandler`` and written by a
+``QueueListener`` thread, so request handlers never wait on stderr or a log
+shipper. Output is one JSON object per line (``LOG_FORMAT=json``, the
+default) or the classic text format (``LOG_FORMAT=text``). When tracing is
+on, records logged inside a span carry its ``trace_id`` and ``span_id``.
+"""
+
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Optional
+
+from decouple import config
+
+from app.tracing import current_trace_ids
+
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+LOG_FORMAT = config("LOG_FORMAT", default="json")
+
+_TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+# LogRecord attributes that are not user-supplied ``extra`` fields.
+_RESERVED = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                payload[key] = value
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _ContextQueueHandler(QueueHandler):
+    """Resolves message, traceback and trace ids on the caller's thread; no I/O."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)  # other handlers keep the caller's record, traceback included
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        ids = current_trace_ids()
+        if ids is not None:
+            record.trace_id, record.span_id = ids
+        return record
+
+
+def configure_logging(
+    *, level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream: Optional[IO[str]] = None
+) -> QueueListener:
+    """Route the root logger through a queue; calling again replaces the setup."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(_TEXT_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, _ContextQueueHandler)]:
+        root.removeHandler(handler)
+    root.addHandler(_ContextQueueHandler(log_queue))
+    root.setLevel(level.upper())
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -1,57 +1,157 @@
+import os
+import time
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import NamedTuple, Optional
 
 from decouple import config
-from fastapi import Depends, FastAPI, Query, Request
-from fastapi.responses import JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi import Depends, FastAPI, HTTPException, Path, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import func, or_
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from app.catalog import HARDWARE_ANCHORS
 from app.database import (
-    CatalogBase,
+    CONVERSATION_PARTITIONING,
+    CONVERSATION_RETENTION_MONTHS,
     CatalogSessionLocal,
-    ChatBase,
     ChatSessionLocal,
     catalog_engine,
     chat_engine,
 )
-from app.llm_logic import llm_classify_image, llm_sales_reply
+from app.grounding import catalog_context_for
+from app.http_cache import (
+    CachedStaticFiles,
+    CompressionMiddleware,
+    conversation_validators,
+    not_modified,
+    not_modified_response,
+    validator_headers,
+)
+from app.llm_logic import SALES_MODEL, llm_classify_image, llm_sales_reply, vision_tier_stats
+from app.media import get_media_manager, record_public_fetch
+from app.migrations import ensure_schema
 from app.models import Conversation, Product
+from app.ordering import KeyedLocks, SenderDebouncer
+from app.partitions import drop_expired_partitions, ensure_conversation_partitions
+from app.profiler import PROFILE_MAX_SECONDS, Profile, get_profiler
+from app.replies import get_reply_registry, render_reply
+from app.search import SearchHit, get_catalog_index, words
 from app.security import LimitBodySizeMiddleware, validate_twilio_signature, verify_admin
 from app.services.pdf import generate_pdf
+from app.state import MemoryStateBackend, get_state_backend
+from app.stats import cached_stats_summary, record_conversation
+from app.templating import environment, precompile_templates, templates
+from app.tracing import (
+    OTEL_ENABLED,
+    configure_tracing,
+    instrument_engine,
+    set_span_attributes,
+    shutdown_tracing,
+    traced,
+)
+from app.usage import get_usage_ledger, message_usage, track_usage, usage_summary
 from app.utils import download_twilio_media_to_public, logger, send_message
+from app.vision_batch import VISION_BATCH_CONCURRENCY, batch_job_status, results_path, start_batch_job
 
-PUBLIC_BASE_URL = config("PUBLIC_BASE_URL", default="")
 MAX_REQUEST_BODY_BYTES = config("MAX_REQUEST_BODY_BYTES", cast=int, default=1_048_576)
+MAX_WEBHOOK_BODY_BYTES = config("MAX_WEBHOOK_BODY_BYTES", cast=int, default=MAX_REQUEST_BODY_BYTES)
+MAX_ADMIN_BODY_BYTES = config("MAX_ADMIN_BODY_BYTES", cast=int, default=MAX_REQUEST_BODY_BYTES)
+COMPRESS_MIN_BYTES = config("COMPRESS_MIN_BYTES", cast=int, default=500)
 
-HARDWARE_MENU = (
-    "¿Qué necesitas? Ejemplos: martillos, taladros, brocas, lijas, tornillos, pintura, mangueras, "
-    "tubería PVC, guantes, cascos, silicón."
-)
-REPLY_DONT_KNOW = "Puedo ayudarte con productos de ferretería. " + HARDWARE_MENU
 TRIM_LEN = 3000
+# Accent-folded whole words, so "equivale" or "valeria" do not trigger a catalog search.
+CATALOG_QUERY_WORDS = frozenset(
+    {
+        "precio", "precios", "cuesta", "cuestan", "cuanto", "cuanta", "cuantos", "cuantas", "costo",
+        "costos", "vale", "valen", "tienen", "venden", "stock", "disponible", "disponibles",
+    }
+)  # fmt: skip
+CATALOG_SEARCH_LIMIT = 3
+WEBHOOK_DEDUP_TTL_SECONDS = config("WEBHOOK_DEDUP_TTL_SECONDS", cast=int, default=86_400)
+WEB_CONCURRENCY = config("WEB_CONCURRENCY", cast=int, default=1)
+SENDER_DEBOUNCE_SECONDS = config("SENDER_DEBOUNCE_SECONDS", cast=float, default=0.0)
+SENDER_DEBOUNCE_MAX_SECONDS = config(
+    "SENDER_DEBOUNCE_MAX_SECONDS", cast=float, default=SENDER_DEBOUNCE_SECONDS * 3
+)
+
+
+class InboundMessage(NamedTuple):
+    body: str
+    num_media: int = 0
+    media_url: str = ""
+    media_content_type: str = ""
+    sids: tuple[str, ...] = ()  # Twilio MessageSids answered by this turn
+
+    @property
+    def has_image(self) -> bool:
+        return self.num_media > 0 and self.media_content_type.startswith("image/")
+
+
+def _merge_burst(burst: list[InboundMessage]) -> list[InboundMessage]:
+    """Images keep their own turn (in order); all text is merged into one final turn."""
+    images = [message for message in burst if message.has_image]
+    rest = [message for message in burst if not message.has_image]
+    texts = [message.body for message in rest if message.body]
+    if texts or not images:
+        sids = tuple(sid for message in rest for sid in message.sids)
+        images.append(InboundMessage(_trim_tail("\n".join(texts)), sids=sids))
+    return images
+
+
+def _trim_tail(text: str) -> str:
+    return text if len(text) <= TRIM_LEN else text[-TRIM_LEN:]
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
+    if OTEL_ENABLED and configure_tracing():
+        instrument_engine(chat_engine, "chat")
+        instrument_engine(catalog_engine, "catalog")
     try:
-        ChatBase.metadata.create_all(bind=chat_engine)
-        CatalogBase.metadata.create_all(bind=catalog_engine)
-        logger.info("Database tables ensured on startup for both DBs.")
+        ensure_schema()
     except Exception as exc:
-        logger.error("DB init failed at startup: %s", exc)
+        logger.error("Schema check failed at startup: %s", exc)
+    compiled = precompile_templates(environment)
+    logger.info(
+        "Compiled %s page templates; reply locales: %s", len(compiled), ", ".join(get_reply_registry().locales())
+    )
+    if CONVERSATION_PARTITIONING:
+        try:
+            ensure_conversation_partitions(chat_engine)
+            if CONVERSATION_RETENTION_MONTHS > 0:
+                drop_expired_partitions(chat_engine, CONVERSATION_RETENTION_MONTHS)
+        except Exception as exc:
+            logger.error("Partition maintenance failed at startup: %s", exc)
+    if WEB_CONCURRENCY > 1 and isinstance(get_state_backend(), MemoryStateBackend):
+        logger.warning(
+            "WEB_CONCURRENCY=%s with STATE_BACKEND=memory: webhook dedup is per worker. "
+            "Use STATE_BACKEND=sqlite (one host) or postgres (several pods).",
+            WEB_CONCURRENCY,
+        )
     yield
+    get_usage_ledger().flush()
+    shutdown_tracing()
 
 
 app = FastAPI(lifespan=lifespan)
-app.add_middleware(LimitBodySizeMiddleware, max_bytes=MAX_REQUEST_BODY_BYTES)
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-app.mount("/public", StaticFiles(directory="public"), name="public")
-templates = Jinja2Templates(directory="app/templates")
+app.add_middleware(
+    LimitBodySizeMiddleware,
+    max_bytes=MAX_REQUEST_BODY_BYTES,
+    route_limits={
+        "/message": MAX_WEBHOOK_BODY_BYTES,
+        "/api/": MAX_ADMIN_BODY_BYTES,
+        "/conversations": MAX_ADMIN_BODY_BYTES,
+    },
+)
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESS_MIN_BYTES)
+app.mount("/static", CachedStaticFiles(directory="app/static"), name="static")
+app.mount("/public", CachedStaticFiles(directory="public", on_response=record_public_fetch), name="public")
+sender_locks = KeyedLocks()
+sender_debouncer: SenderDebouncer[InboundMessage] = SenderDebouncer(
+    SENDER_DEBOUNCE_SECONDS, max_wait=SENDER_DEBOUNCE_MAX_SECONDS
+)
 
 
 def get_chat_db():
@@ -89,6 +189,9 @@ async def list_conversations(
     db: Session = Depends(get_chat_db),
     _: str = Depends(verify_admin),
 ):
+    etag, last_modified = conversation_validators(db)
+    if not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
     query = db.query(Conversation)
     if q:
         q_lower = f"%{q.lower()}%"
@@ -107,10 +210,10 @@ async def list_conversations(
         .all()
     )
     total_pages = (total + per_page - 1) // per_page if per_page > 0 else 1
-    return templates.TemplateResponse(
+    response = templates.TemplateResponse(
+        request,
         "conversations.html",
         {
-            "request": request,
             "items": items,
             "total": total,
             "page": page,
@@ -119,16 +222,22 @@ async def list_conversations(
             "q": q or "",
         },
     )
+    response.headers.update(validator_headers(etag, last_modified))
+    return response
 
 
 @app.get("/api/conversations")
 async def api_list_conversations(
+    request: Request,
     q: Optional[str] = Query(None),
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=200),
     db: Session = Depends(get_chat_db),
     _: str = Depends(verify_admin),
 ):
+    etag, last_modified = conversation_validators(db)
+    if not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
     query = db.query(Conversation)
     if q:
         q_lower = f"%{q.lower()}%"
@@ -147,9 +256,18 @@ async def api_list_conversations(
         .all()
     )
     total_pages = (total + per_page - 1) // per_page if per_page > 0 else 1
-    return {
+    payload = {
         "items": [
-            {"id": item.id, "sender": item.sender, "message": item.message, "response": item.response}
+            {
+                "id": item.id,
+                "created_at": item.created_at.isoformat() if item.created_at else None,
+                "sender": item.sender,
+                "message": item.message,
+                "response": item.response,
+                "branch": item.branch,
+                "model": item.model,
+                "latency_ms": item.latency_ms,
+            }
             for item in items
         ],
         "total": total,
@@ -158,103 +276,339 @@ async def api_list_conversations(
         "total_pages": total_pages,
         "q": q or "",
     }
+    return JSONResponse(payload, headers=validator_headers(etag, last_modified))
+
+
+@app.get("/stats")
+def stats_page(
+    request: Request,
+    hours: int = Query(24, ge=1, le=24 * 31),
+    db: Session = Depends(get_chat_db),
+    _: str = Depends(verify_admin),
+):
+    return templates.TemplateResponse(
+        request, "stats.html", {"title": "Stats", "stats": cached_stats_summary(db, hours=hours)}
+    )
+
+
+@app.get("/api/stats")
+def api_stats(
+    hours: int = Query(24, ge=1, le=24 * 31),
+    top: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_chat_db),
+    _: str = Depends(verify_admin),
+):
+    return cached_stats_summary(db, hours=hours, top_senders=top)
+
+
+@app.get("/api/vision/stats")
+def api_vision_stats(_: str = Depends(verify_admin)):
+    return vision_tier_stats()
+
+
+_BATCH_NAME = "^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$"
+
+
+@app.post("/api/vision/batch", status_code=202)
+def api_vision_batch_start(
+    name: str = Query(..., pattern=_BATCH_NAME),
+    source: str = Query(..., min_length=1),
+    mode: str = Query("direct", pattern="^(direct|batch)$"),
+    concurrency: int = Query(VISION_BATCH_CONCURRENCY, ge=1, le=64),
+    model: str = Query("gpt-5-nano", pattern="^gpt-5(-nano|-mini)?$"),
+    retry_below: float = Query(0.0, ge=0.0, le=1.0),
+    _: str = Depends(verify_admin),
+):
+    try:
+        job = start_batch_job(
+            name, source, mode=mode, concurrency=concurrency, model=model, retry_below=retry_below
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if job is None:
+        raise HTTPException(status_code=409, detail=f"Batch {name!r} is already running")
+    return job.as_dict()
+
+
+@app.get("/api/vision/batch/{name}")
+def api_vision_batch_status(name: str = Path(..., pattern=_BATCH_NAME), _: str = Depends(verify_admin)):
+    status = batch_job_status(name)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No such batch")
+    return status
+
+
+@app.get("/api/vision/batch/{name}/results")
+def api_vision_batch_results(name: str = Path(..., pattern=_BATCH_NAME), _: str = Depends(verify_admin)):
+    path = results_path(name)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="No results for this batch")
+
+    def lines():
+        with path.open("rb") as handle:
+            yield from handle
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/api/media/stats")
+def api_media_stats(top: int = Query(20, ge=1, le=500), _: str = Depends(verify_admin)):
+    return get_media_manager().stats(top=top)
+
+
+@app.get("/api/usage")
+def api_usage(_: str = Depends(verify_admin)):
+    return usage_summary()
+
+
+@app.post("/api/profile/start")
+def api_profile_start(
+    seconds: int = Query(30, ge=1, le=PROFILE_MAX_SECONDS),
+    _: str = Depends(verify_admin),
+):
+    profiler = get_profiler()
+    if not profiler.start(seconds):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return {"running": True, "seconds": seconds, "interval_ms": profiler.interval * 1000}
+
+
+@app.post("/api/profile/stop")
+def api_profile_stop(
+    fmt: str = Query("speedscope", alias="format", pattern="^(speedscope|collapsed)$"),
+    _: str = Depends(verify_admin),
+):
+    profile = get_profiler().stop()
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile has been recorded")
+    return _profile_response(profile, fmt)
+
+
+@app.get("/api/profile")
+def api_profile_result(
+    fmt: str = Query("speedscope", alias="format", pattern="^(speedscope|collapsed)$"),
+    _: str = Depends(verify_admin),
+):
+    profiler = get_profiler()
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="Profile still running; stop it or wait")
+    profile = profiler.last_profile
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile has been recorded")
+    return _profile_response(profile, fmt)
+
+
+def _profile_response(profile: Profile, fmt: str):
+    if fmt == "collapsed":
+        return PlainTextResponse(
+            profile.to_collapsed(),
+            headers={"Content-Disposition": 'attachment; filename="profile.collapsed.txt"'},
+        )
+    return JSONResponse(
+        profile.to_speedscope(name=f"pid {os.getpid()}"),
+        headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'},
+    )
 
 
 @app.post("/message")
+@traced()
 async def reply(
     request: Request,
     db_chat: Session = Depends(get_chat_db),
     db_catalog: Session = Depends(get_catalog_db),
 ):
+    await validate_twilio_signature(request)
     form = await request.form()
-    await validate_twilio_signature(request, form)
 
     body = str(form.get("Body", "")).strip()
     sender = str(form.get("From", ""))
     num_media = _safe_int(str(form.get("NumMedia", "0")))
     media_url = form.get("MediaUrl0")
     media_content_type = form.get("MediaContentType0")
+    message_sid = str(form.get("MessageSid") or form.get("SmsMessageSid") or "")
+
+    # Twilio retries webhooks on timeouts; only the first delivery of a SID is handled.
+    state = get_state_backend()
+    claim = f"twilio:sid:{message_sid}" if message_sid else None
+    if claim and not await run_in_threadpool(state.add_if_absent, claim, ttl=WEBHOOK_DEDUP_TTL_SECONDS):
+        logger.info("Duplicate webhook for %s ignored.", message_sid)
+        return JSONResponse({"ok": True, "duplicate": True})
+
+    inbound = InboundMessage(
+        _trim_tail(body),
+        num_media,
+        str(media_url or ""),
+        str(media_content_type or ""),
+        sids=(message_sid,) if message_sid else (),
+    )
 
-    if len(body) > TRIM_LEN:
-        body = body[-TRIM_LEN:]
+    pending = [inbound]  # turns not answered yet
+    try:
+        burst = await sender_debouncer.submit(sender, inbound)
+        if burst is None:
+            return JSONResponse({"ok": True, "merged": True})
+
+        pending = _merge_burst(burst)
+        async with sender_locks.hold(sender):
+            while pending:
+                await run_in_threadpool(_handle_message, db_chat, db_catalog, sender, pending[0])
+                pending.pop(0)
+    except Exception:
+        # Release the SIDs of every unanswered turn, merged followers included, so a redelivery
+        # of any of them is handled again instead of dropped as a duplicate.
+        for sid in {sid for message in pending for sid in message.sids}:
+            await run_in_threadpool(state.delete, f"twilio:sid:{sid}")
+        raise
+    return JSONResponse({"ok": True})
+
+
+@traced("handle_message")
+@track_usage
+def _handle_message(
+    db_chat: Session, db_catalog: Session, sender: str, message: InboundMessage
+) -> None:
+    started = time.perf_counter()
+    body = message.body
+    media_url = message.media_url
     lower = body.lower()
 
-    if num_media > 0 and media_content_type and str(media_content_type).startswith("image/"):
+    if message.has_image:
         try:
             local_path, _, public_url = download_twilio_media_to_public(
                 str(media_url), out_dir="public"
             )
         except Exception as exc:
             logger.error("Failed downloading media: %s", exc)
-            msg = "Recibí tu imagen, pero tuve un problema al procesarla. ¿Puedes describir el producto?"
-            _send_and_store(db_chat, sender, body, msg)
-            return JSONResponse({"ok": True})
+            msg = render_reply("image_error", key=sender)
+            _send_and_store(db_chat, sender, body, msg, branch="image_error", started=started)
+            return
 
         image_ref_for_llm = local_path if local_path else (public_url or "")
         result = llm_classify_image(image_ref_for_llm, max_retries=3, force_detail="low")
         anchor = (result.get("anchor") or "").strip().lower()
         description = result.get("description") or ""
+        vision_model = result.get("model")
 
         if anchor in HARDWARE_ANCHORS:
             product = db_catalog.query(Product).filter(Product.anchor == anchor).first()
             if product:
-                price_usd = product.price_cents / 100.0
-                reply_text = (
-                    f"Puedo venderte: {description} ({anchor}). "
-                    f"Tenemos {product.name}: ${price_usd:.2f}, stock {product.stock}."
+                reply_text = render_reply(
+                    "image_catalog", key=sender, description=description, anchor=anchor, product=product
                 )
-                media_list = [product.image_url] if product.image_url else None
-                _send_and_store(db_chat, sender, body, reply_text, media_urls=media_list)
-                return JSONResponse({"ok": True})
+                _send_and_store(
+                    db_chat,
+                    sender,
+                    body,
+                    reply_text,
+                    media_urls=_product_media(product.image_url),
+                    branch="image_catalog",
+                    model=vision_model,
+                    started=started,
+                )
+                return
 
-            reply_text = (
-                f"Identifiqué {description} ({anchor}). "
-                "Aún no lo tengo cargado en inventario. ¿Deseas una cotización?"
+            reply_text = render_reply("image_not_stocked", key=sender, description=description, anchor=anchor)
+            _send_and_store(
+                db_chat,
+                sender,
+                body,
+                reply_text,
+                branch="image_not_stocked",
+                model=vision_model,
+                started=started,
             )
-            _send_and_store(db_chat, sender, body, reply_text)
-            return JSONResponse({"ok": True})
+            return
 
-        reply_text = (
-            "Gracias por la imagen. No identifiqué un producto de ferretería de nuestro catálogo. "
-            + HARDWARE_MENU
+        reply_text = render_reply("image_unknown", key=sender)
+        _send_and_store(
+            db_chat,
+            sender,
+            body,
+            reply_text,
+            branch="image_unknown",
+            model=vision_model,
+            started=started,
         )
-        _send_and_store(db_chat, sender, body, reply_text)
-        return JSONResponse({"ok": True})
+        return
 
     if "precio" in lower and "martillo" in lower:
         product = db_catalog.query(Product).filter(Product.anchor == "martillo").first()
         if product:
-            price_usd = product.price_cents / 100.0
-            msg = f"El {product.name} cuesta ${price_usd:.2f} y hay {product.stock} en stock."
-            media_list = [product.image_url] if product.image_url else None
-            _send_and_store(db_chat, sender, body, msg, media_urls=media_list)
+            msg = render_reply("price", key=sender, product=product)
+            _send_and_store(
+                db_chat,
+                sender,
+                body,
+                msg,
+                media_urls=_product_media(product.image_url),
+                branch="price",
+                started=started,
+            )
         else:
             _send_and_store(
-                db_chat, sender, body, "Martillo disponible. ¿Deseas una cotización?"
+                db_chat,
+                sender,
+                body,
+                render_reply("price_not_stocked", key=sender),
+                branch="price",
+                started=started,
             )
-        return JSONResponse({"ok": True})
+        return
 
     if any(keyword in lower for keyword in ("cotización", "cotizacion", "presupuesto")):
-        content = "Detalle de Cotización:\nMartillo demo $3.00, 4 unidades."
-        _, pdf_name = generate_pdf(content, out_dir="public")
-        media_url = f"{PUBLIC_BASE_URL}/public/{pdf_name}" if PUBLIC_BASE_URL else None
-        msg = (
-            "Te envío la cotización en PDF adjunta."
-            if media_url
-            else "Generé la cotización (revisa /public)."
-        )
+        _, pdf_name = generate_pdf(render_reply("quote_document"), out_dir="public")
+        media_url = get_media_manager().public_url(pdf_name)
+        msg = render_reply("quote_sent" if media_url else "quote_saved", key=sender)
         _send_and_store(
             db_chat,
             sender,
             body,
             msg,
             media_urls=[media_url] if media_url else None,
+            branch="quote",
+            started=started,
         )
-        return JSONResponse({"ok": True})
+        return
 
-    chat_response = llm_sales_reply(body) or REPLY_DONT_KNOW
-    _send_and_store(db_chat, sender, body, chat_response)
-    return JSONResponse({"ok": True})
+    if CATALOG_QUERY_WORDS.intersection(words(body)):
+        hits = _catalog_search(db_catalog, body)
+        if hits:
+            msg = render_reply("catalog_search", key=sender, items=[hit.entry for hit in hits])
+            _send_and_store(
+                db_chat,
+                sender,
+                body,
+                msg,
+                media_urls=_product_media(hits[0].entry.image_url),
+                branch="catalog_search",
+                started=started,
+            )
+            return
+
+    chat_response = llm_sales_reply(body, catalog_context=catalog_context_for(db_catalog, body))
+    _send_and_store(
+        db_chat,
+        sender,
+        body,
+        chat_response or render_reply("dont_know", key=sender),
+        branch="llm" if chat_response else "llm_fallback",
+        model=SALES_MODEL,
+        started=started,
+    )
+
+
+def _product_media(image_url: Optional[str]) -> Optional[list[str]]:
+    url = get_media_manager().outbound_url(image_url)
+    return [url] if url else None
+
+
+def _catalog_search(db_catalog: Session, text: str) -> list[SearchHit]:
+    try:
+        hits = get_catalog_index(db_catalog).search(text, limit=CATALOG_SEARCH_LIMIT)
+    except SQLAlchemyError as exc:
+        logger.error("Catalog search unavailable: %s", exc)
+        return []
+    # Drop weak partial matches trailing far behind the best hit.
+    return [hit for hit in hits if hit.score >= hits[0].score * 0.5] if hits else []
 
 
 def _send_and_store(
@@ -264,18 +618,37 @@ def _send_and_store(
     reply_text: str,
     *,
     media_urls=None,
+    branch: Optional[str] = None,
+    model: Optional[str] = None,
+    started: Optional[float] = None,
 ) -> None:
+    set_span_attributes(branch=branch, model=model)
     try:
         send_message(to_number, reply_text, media_urls=media_urls)
     except Exception as exc:
+        # Twilio does not redeliver the inbound message, so keep it with the undelivered reply.
         logger.error("Failed to send WA message: %s", exc)
-    _store(db, to_number, user_msg, reply_text)
+        branch = "send_error"
+        set_span_attributes(branch=branch)
+    latency_ms = int((time.perf_counter() - started) * 1000) if started is not None else None
+    _store(
+        db,
+        to_number,
+        user_msg,
+        reply_text,
+        branch=branch,
+        model=model,
+        latency_ms=latency_ms,
+        **(message_usage() or {}),
+    )
 
 
-def _store(db: Session, sender: str, message: str, response: str) -> None:
+def _store(db: Session, sender: str, message: str, response: str, **details) -> None:
     try:
-        conversation = Conversation(sender=sender, message=message, response=response)
+        conversation = Conversation(sender=sender, message=message, response=response, **details)
         db.add(conversation)
+        db.flush()
+        record_conversation(db, conversation)
         db.commit()
         logger.info("Conversation stored in database.")
     except SQLAlchemyError as exc:
@@ -0,0 +1,353 @@
+"""Outbound media: product images re-hosted under content-hashed URLs.
+
+Twilio downloads every media URL we attach to a message. Before this, a reply
+sent ``product.image_url`` as-is, so each message made Twilio fetch the
+original image again: sometimes a multi-megabyte photo, sometimes a page that
+is not an image at all (which fails the whole message).
+
+``MediaManager`` keeps one validated, size-optimized copy of each source image
+in ``public/`` under a name derived from its bytes
+(``product_<sha256>.jpg``, see ``utils.write_content_addressed``). ``/public``
+serves such names as immutable, so Twilio and any CDN in front of us can cache
+them for a year. The source URL to file name map lives in the state backend,
+so all workers and pods agree on it, with a per-process dict in front.
+
+* ``python -m app.catalog_sync`` pre-warms every product image after an import
+  (``warm_catalog_images``), so replies normally find the copy ready.
+* An image not yet prepared is fetched in the background and its reply goes
+  out with the original URL. A source that cannot be used is remembered for
+  ``MEDIA_RETRY_SECONDS``, and during that time replies go out without media
+  instead of failing.
+* Sends per file and ``/public`` fetches per file are counted per process
+  (``GET /api/media/stats``). A healthy cache shows few fetches per send.
+
+Resizing and re-encoding need Pillow (see ``requirements-optional.txt``).
+Without it, sources are only checked to be JPEG or PNG within Twilio's size
+limit, and are stored unchanged.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, NamedTuple, Optional
+
+import requests
+from decouple import config
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.state import StateBackend, get_state_backend
+from app.utils import logger, write_content_addressed
+
+try:
+    from PIL import Image, UnidentifiedImageError
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+MEDIA_DIR = "public"
+MEDIA_MAX_DIMENSION = config("MEDIA_MAX_DIMENSION", cast=int, default=1600)
+MEDIA_JPEG_QUALITY = config("MEDIA_JPEG_QUALITY", cast=int, default=82)
+MEDIA_MAX_SOURCE_BYTES = config("MEDIA_MAX_SOURCE_BYTES", cast=int, default=20 * 1024 * 1024)
+MEDIA_RETRY_SECONDS = config("MEDIA_RETRY_SECONDS", cast=float, default=3600)
+MEDIA_WARM_CONCURRENCY = config("MEDIA_WARM_CONCURRENCY", cast=int, default=8)
+
+TWILIO_MAX_IMAGE_BYTES = 5 * 1024 * 1024  # WhatsApp image limit
+_SIGNATURES = {b"\xff\xd8\xff": ".jpg", b"\x89PNG\r\n\x1a\n": ".png"}
+_FAILED = "!"  # state value prefix for a source that could not be used
+
+
+class MediaError(Exception):
+    """A source URL that cannot be sent as WhatsApp media."""
+
+
+class WarmStats(NamedTuple):
+    ready: int  # already prepared
+    prepared: int
+    failed: int
+
+
+def _sniff(data: bytes) -> Optional[str]:
+    for signature, suffix in _SIGNATURES.items():
+        if data.startswith(signature):
+            return suffix
+    return None
+
+
+def optimize_image(data: bytes, *, max_dimension: int = MEDIA_MAX_DIMENSION) -> tuple[bytes, str]:
+    """Validate ``data`` and return ``(bytes, suffix)`` fit for WhatsApp.
+
+    With Pillow, images are downscaled to ``max_dimension``, transparency is
+    flattened onto white and the result is saved as a progressive JPEG without
+    metadata. A small JPEG or PNG original is kept if re-encoding would not
+    make it smaller.
+    """
+    suffix = _sniff(data)
+    if Image is None:
+        if suffix is None:
+            raise MediaError("not a JPEG or PNG image")
+        if len(data) > TWILIO_MAX_IMAGE_BYTES:
+            raise MediaError(f"{len(data)} bytes is over the WhatsApp image limit")
+        return data, suffix
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            size = image.size
+            if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+                rgba = image.convert("RGBA")
+                flat = Image.new("RGB", rgba.size, (255, 255, 255))
+                flat.paste(rgba, mask=rgba.getchannel("A"))
+            else:
+                flat = image.convert("RGB")
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as exc:
+        raise MediaError(f"unreadable image: {exc}") from exc
+
+    flat.thumbnail((max_dimension, max_dimension))
+    out = io.BytesIO()
+    flat.save(out, "JPEG", quality=MEDIA_JPEG_QUALITY, optimize=True, progressive=True)
+    encoded = out.getvalue()
+    if suffix and max(size) <= max_dimension and len(data) <= min(len(encoded), TWILIO_MAX_IMAGE_BYTES):
+        return data, suffix
+    if len(encoded) > TWILIO_MAX_IMAGE_BYTES:
+        raise MediaError(f"{len(encoded)} bytes after optimizing is over the WhatsApp image limit")
+    return encoded, ".jpg"
+
+
+class MediaManager:
+    def __init__(
+        self,
+        state: StateBackend,
+        *,
+        out_dir: str = MEDIA_DIR,
+        public_base: str = "",
+        max_source_bytes: int = MEDIA_MAX_SOURCE_BYTES,
+        retry_seconds: float = MEDIA_RETRY_SECONDS,
+    ) -> None:
+        self.state = state
+        self.out_dir = out_dir
+        self.public_base = public_base.rstrip("/")
+        self.max_source_bytes = max_source_bytes
+        self.retry_seconds = retry_seconds
+        self._names: dict[str, str] = {}  # source URL -> file name, this process
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._sends: Counter[str] = Counter()
+        self._fetches: Counter[str] = Counter()
+        self._revalidations: Counter[str] = Counter()
+
+    @staticmethod
+    def _key(source_url: str) -> str:
+        return f"media:src:{hashlib.sha1(source_url.encode()).hexdigest()}"
+
+    def public_url(self, filename: str) -> Optional[str]:
+        """URL of a file in ``out_dir``, counted as one send."""
+        if not self.public_base:
+            return None
+        with self._lock:
+            self._sends[filename] += 1
+        return f"{self.public_base}/public/{filename}"
+
+    def lookup(self, source_url: str) -> Optional[str]:
+        """Prepared file name for ``source_url``, ``"!..."`` if it failed, or None."""
+        name = self._names.get(source_url)
+        if name is not None:
+            return name
+        stored = self.state.get(self._key(source_url))
+        if stored is None:
+            return None
+        if stored.startswith(_FAILED):
+            return stored  # not cached here: retried after its TTL
+        if not os.path.exists(os.path.join(self.out_dir, stored)):
+            return None  # mapped by a process with another public/ volume
+        self._names[source_url] = stored
+        return stored
+
+    def _read_source(self, source_url: str) -> bytes:
+        local_prefix = f"{self.public_base}/public/"
+        if self.public_base and source_url.startswith(local_prefix):
+            path = os.path.join(self.out_dir, os.path.basename(source_url[len(local_prefix) :]))
+            try:
+                with open(path, "rb") as handle:
+                    return handle.read(self.max_source_bytes + 1)
+            except OSError as exc:
+                raise MediaError(f"missing local file: {exc}") from exc
+        if not source_url.startswith(("http://", "https://")):
+            raise MediaError("not an http(s) URL")
+        try:
+            with requests.get(source_url, stream=True, timeout=(5, 20)) as response:
+                response.raise_for_status()
+                chunks, total = [], 0
+                for chunk in response.iter_content(64 * 1024):
+                    total += len(chunk)
+                    if total > self.max_source_bytes:
+                        raise MediaError(f"source is larger than {self.max_source_bytes} bytes")
+                    chunks.append(chunk)
+        except requests.RequestException as exc:
+            raise MediaError(f"download failed: {exc}") from exc
+        return b"".join(chunks)
+
+    def prepare(self, source_url: str) -> str:
+        """Download, validate and store ``source_url``; returns the file name.
+
+        Raises ``MediaError`` (and remembers the failure) if it cannot be used.
+        """
+        try:
+            data = self._read_source(source_url)
+            if len(data) > self.max_source_bytes:
+                raise MediaError(f"source is larger than {self.max_source_bytes} bytes")
+            optimized, suffix = optimize_image(data)
+        except MediaError as exc:
+            self.state.set(self._key(source_url), f"{_FAILED}{exc}"[:200], ttl=self.retry_seconds)
+            logger.warning("Product image %s not usable: %s", source_url, exc)
+            raise
+        _, filename = write_content_addressed(optimized, self.out_dir, suffix, prefix="product_")
+        self.state.set(self._key(source_url), filename)
+        self._names[source_url] = filename
+        logger.info(
+            "Prepared product image %s -> %s (%s -> %s bytes)", source_url, filename, len(data), len(optimized)
+        )
+        return filename
+
+    def _prepare_quietly(self, source_url: str) -> None:
+        try:
+            self.prepare(source_url)
+        except MediaError:
+            pass
+        except Exception as exc:
+            logger.error("Preparing product image %s failed: %s", source_url, exc)
+        finally:
+            with self._lock:
+                self._pending.discard(source_url)
+
+    def prepare_later(self, source_url: str) -> None:
+        with self._lock:
+            if source_url in self._pending:
+                return
+            self._pending.add(source_url)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="media")
+        self._executor.submit(self._prepare_quietly, source_url)
+
+    def outbound_url(self, source_url: Optional[str]) -> Optional[str]:
+        """URL to attach for a product image, or None to send no media.
+
+        Prepared images get their content-hashed URL. Unknown ones are queued
+        for preparation and sent with the source URL this time.
+        """
+        if not source_url:
+            return None
+        name = self.lookup(source_url)
+        if name is None:
+            self.prepare_later(source_url)
+            return source_url
+        if name.startswith(_FAILED):
+            return None
+        return self.public_url(name) or source_url
+
+    def warm(self, source_urls: Iterable[str], *, concurrency: int = MEDIA_WARM_CONCURRENCY) -> WarmStats:
+        """Prepare every source not ready yet, ``concurrency`` at a time."""
+        missing, ready = [], 0
+        for url in dict.fromkeys(url for url in source_urls if url):
+            name = self.lookup(url)
+            if name is None:
+                missing.append(url)
+            elif not name.startswith(_FAILED):
+                ready += 1
+        prepared = failed = 0
+
+        def _one(url: str) -> bool:
+            try:
+                self.prepare(url)
+                return True
+            except MediaError:
+                return False
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="media-warm") as pool:
+            for ok in pool.map(_one, missing):
+                prepared += ok
+                failed += not ok
+        return WarmStats(ready, prepared, failed)
+
+    def record_fetch(self, filename: str, status_code: int) -> None:
+        """Hook for ``CachedStaticFiles``: one ``/public`` response."""
+        with self._lock:
+            if status_code == 304:
+                self._revalidations[filename] += 1
+            else:
+                self._fetches[filename] += 1
+
+    def stats(self, top: int = 20) -> dict:
+        """Sends and ``/public`` fetches per file since process start."""
+        with self._lock:
+            names = set(self._sends) | set(self._fetches) | set(self._revalidations)
+            files = sorted(
+                (
+                    {
+                        "file": name,
+                        "sends": self._sends[name],
+                        "fetches": self._fetches[name],
+                        "revalidations": self._revalidations[name],
+                    }
+                    for name in names
+                ),
+                key=lambda row: (-row["fetches"], -row["sends"], row["file"]),
+            )
+            return {
+                "sources_cached": len(self._names),
+                "pending": len(self._pending),
+                "sends": sum(self._sends.values()),
+                "fetches": sum(self._fetches.values()),
+                "revalidations": sum(self._revalidations.values()),
+                "files": files[:top],
+            }
+
+
+_manager: Optional[MediaManager] = None
+
+
+def get_media_manager() -> MediaManager:
+    global _manager
+    if _manager is None:
+        _manager = MediaManager(get_state_backend(), public_base=config("PUBLIC_BASE_URL", default=""))
+    return _manager
+
+
+def record_public_fetch(filename: str, status_code: int) -> None:
+    get_media_manager().record_fetch(filename, status_code)
+
+
+def catalog_image_urls(engine: Engine) -> list[str]:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT DISTINCT image_url FROM products WHERE image_url IS NOT NULL AND image_url <> ''")
+        )
+        return [row[0] for row in rows]
+
+
+def warm_catalog_images(
+    engine: Engine, manager: Optional[MediaManager] = None, *, concurrency: int = MEDIA_WARM_CONCURRENCY
+) -> WarmStats:
+    """Prepare the image of every product in the catalog that is not ready yet."""
+    return (manager or get_media_manager()).warm(catalog_image_urls(engine), concurrency=concurrency)
+
+
+def _main(argv: list[str]) -> int:
+    if argv != ["warm"]:
+        print("Usage: python -m app.media warm", file=sys.stderr)
+        return 2
+    from app.database import catalog_engine
+
+    stats = warm_catalog_images(catalog_engine)
+    print(f"ready={stats.ready} prepared={stats.prepared} failed={stats.failed}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main(sys.argv[1:]))
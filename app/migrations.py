@@ -0,0 +1,215 @@
+"""Versioned schema migrations for the chat and catalog databases (Alembic).
+
+Each database has its own Alembic environment under ``migrations/`` and its
+own ``alembic_version`` table. ``alembic.ini`` names them ``chat`` and
+``catalog``::
+
+    python -m app.migrations upgrade            # both databases to head
+    python -m app.migrations verify             # exit 1 unless both are at head
+    alembic -n catalog revision -m "add foo"    # new revision
+
+Before this, tables were made by ``create_all``, so an existing database may
+already hold some of the objects a revision creates. Revisions therefore use
+the ``*_if_missing`` helpers below to bring any such database to the same
+state as a fresh one.
+
+At startup ``SCHEMA_MODE`` decides what happens:
+
+* ``verify`` (default) reads ``alembic_version`` once per database and logs
+  an error if it is not at head. Migrations are run beforehand, as a deploy
+  step (one job, not every pod).
+* ``migrate`` upgrades both databases, serialized across processes by a
+  PostgreSQL advisory lock. For local development.
+* ``off`` does nothing.
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Optional
+
+import sqlalchemy as sa
+from alembic import command, context, op
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from decouple import config
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.utils import logger
+
+SCHEMA_MODE = config("SCHEMA_MODE", default="verify")
+DATABASES = ("chat", "catalog")
+
+_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+_LOCK_KEYS = {"chat": 7_301_001, "catalog": 7_301_002}  # pg_advisory_lock ids
+
+
+def _engine(name: str) -> Engine:
+    from app import database
+
+    return {"chat": database.chat_engine, "catalog": database.catalog_engine}[name]
+
+
+def _metadata(name: str) -> sa.MetaData:
+    import app.models  # noqa: F401  (registers the tables)
+    from app.database import CatalogBase, ChatBase
+
+    return {"chat": ChatBase, "catalog": CatalogBase}[name].metadata
+
+
+def alembic_config(name: str, connection: Optional[Connection] = None) -> Config:
+    cfg = Config(str(_INI), ini_section=name)
+    if connection is not None:
+        cfg.attributes["connection"] = connection
+    return cfg
+
+
+def head_revision(name: str) -> Optional[str]:
+    return ScriptDirectory.from_config(alembic_config(name)).get_current_head()
+
+
+def current_revision(engine: Engine) -> Optional[str]:
+    """One ``SELECT`` on ``alembic_version``; None if it is missing or empty."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(sa.text("SELECT version_num FROM alembic_version")).scalar()
+    except SQLAlchemyError:
+        return None
+
+
+def upgrade(name: str, revision: str = "head", *, engine: Optional[Engine] = None) -> None:
+    with (engine or _engine(name)).connect() as conn:
+        command.upgrade(alembic_config(name, conn), revision)
+        conn.commit()
+
+
+def verify_schema(names=DATABASES, *, engines: Optional[dict[str, Engine]] = None) -> bool:
+    """Fast-start check: every database is at its head revision."""
+    ok = True
+    for name in names:
+        engine = (engines or {}).get(name) or _engine(name)
+        current, head = current_revision(engine), head_revision(name)
+        if current != head:
+            ok = False
+            logger.error(
+                "%s database schema is at %s, code expects %s; run `python -m app.migrations upgrade`.",
+                name,
+                current or "no revision",
+                head,
+            )
+    return ok
+
+
+def ensure_schema(mode: str = SCHEMA_MODE) -> None:
+    if mode == "migrate":
+        for name in DATABASES:
+            upgrade(name)
+        logger.info("Database schemas upgraded to head.")
+    elif mode == "verify":
+        if verify_schema():
+            logger.info("Database schemas are at head.")
+    elif mode != "off":
+        raise ValueError(f"Unknown SCHEMA_MODE {mode!r}; use verify, migrate or off")
+
+
+# --- Alembic env.py -------------------------------------------------------
+
+
+def run_environment(name: str) -> None:
+    """Body of ``migrations/<name>/env.py``."""
+    if context.is_offline_mode():
+        raise RuntimeError("Revisions inspect the live schema; offline (--sql) mode is not supported.")
+    metadata = _metadata(name)
+    connection = context.config.attributes.get("connection")
+    if connection is not None:
+        _run_online(name, connection, metadata)
+        return
+    with _engine(name).connect() as conn:
+        _run_online(name, conn, metadata)
+        conn.commit()
+
+
+def _run_online(name: str, connection: Connection, metadata: sa.MetaData) -> None:
+    postgres = connection.dialect.name == "postgresql"
+    if postgres:
+        # Several pods or jobs may migrate at once; only one runs, the rest then find head.
+        connection.execute(sa.text("SELECT pg_advisory_lock(:key)"), {"key": _LOCK_KEYS[name]})
+        connection.commit()
+    try:
+        context.configure(connection=connection, target_metadata=metadata, transaction_per_migration=True)
+        with context.begin_transaction():
+            context.run_migrations()
+    finally:
+        if postgres:
+            connection.execute(sa.text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEYS[name]})
+
+
+# --- Helpers for revision scripts -----------------------------------------
+
+
+def create_table_if_missing(name: str, *columns, **kw) -> None:
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, *columns, **kw)
+
+
+def add_column_if_missing(table: str, column: sa.Column) -> None:
+    existing = {info["name"] for info in sa.inspect(op.get_bind()).get_columns(table)}
+    if column.name not in existing:
+        op.add_column(table, column)
+
+
+def create_index_online(name: str, table: str, columns: list[str], *, unique: bool = False) -> None:
+    """Build an index without blocking writes (``CREATE INDEX CONCURRENTLY`` on PostgreSQL).
+
+    Runs outside the migration transaction. An INVALID index left by an
+    interrupted earlier build is dropped and rebuilt. Partitioned tables cannot
+    be indexed concurrently, so they get a plain ``CREATE INDEX``.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        op.create_index(name, table, columns, unique=unique, if_not_exists=True)
+        return
+    with op.get_context().autocommit_block():
+        invalid = bind.execute(
+            sa.text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ),
+            {"name": name},
+        ).scalar()
+        if invalid:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+        partitioned = bind.execute(
+            sa.text("SELECT relkind = 'p' FROM pg_class WHERE relname = :table"), {"table": table}
+        ).scalar()
+        op.create_index(
+            name,
+            table,
+            columns,
+            unique=unique,
+            if_not_exists=True,
+            postgresql_concurrently=not partitioned,
+        )
+
+
+def _main(argv: list[str]) -> int:
+    action = argv[0] if argv else ""
+    names = argv[1:] or list(DATABASES)
+    if action not in {"upgrade", "verify", "current"} or not set(names) <= set(DATABASES):
+        print("Usage: python -m app.migrations upgrade|verify|current [chat|catalog]", file=sys.stderr)
+        return 2
+    if action == "upgrade":
+        for name in names:
+            upgrade(name)
+        return 0
+    if action == "current":
+        for name in names:
+            print(f"{name}: {current_revision(_engine(name)) or '-'} (head {head_revision(name)})")
+        return 0
+    return 0 if verify_schema(names) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main(sys.argv[1:]))
@@ -1,24 +1,77 @@
-from sqlalchemy import Column, Integer, String
+from datetime import datetime, timezone
 
-from app.database import CatalogBase, ChatBase
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, String, func
+
+from app.database import CONVERSATION_PARTITIONING, CatalogBase, ChatBase
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
 
 
 class Conversation(ChatBase):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_sender_created_at", "sender", "created_at"),
+        Index("ix_conversations_branch_created_at", "branch", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"} if CONVERSATION_PARTITIONING else {},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    # Partitioned tables need the partition key in the primary key.
+    created_at = Column(
+        DateTime(timezone=True),
+        primary_key=CONVERSATION_PARTITIONING,
+        nullable=False,
+        index=True,
+        default=_utcnow,
+        server_default=func.now(),
+    )
     sender = Column(String)
     message = Column(String)
     response = Column(String)
+    branch = Column(String(32), nullable=True)
+    model = Column(String(64), nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    cost_micros = Column(BigInteger, nullable=True)  # OpenAI spend in millionths of a USD
+    latency_ms = Column(Integer, nullable=True)
 
     def __repr__(self) -> str:
-        return f"<Conversation id={self.id} sender={self.sender!r}>"
+        return f"<Conversation id={self.id} sender={self.sender!r} branch={self.branch!r}>"
+
+
+class ConversationHourlyStat(ChatBase):
+    """Rollup: conversations per hour and reply branch, maintained by ``app.stats``."""
+
+    __tablename__ = "conversation_hourly_stats"
+
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    branch = Column(String(32), primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+    latency_ms_total = Column(BigInteger, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0, server_default="0")
+    completion_tokens = Column(BigInteger, nullable=False, default=0, server_default="0")
+    cost_micros = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+
+class SenderStat(ChatBase):
+    """Rollup: conversations per sender, maintained by ``app.stats``."""
+
+    __tablename__ = "sender_stats"
+
+    sender = Column(String, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0, index=True)
+    cost_micros = Column(BigInteger, nullable=False, default=0, server_default="0")
+    first_seen = Column(DateTime(timezone=True), nullable=False)
+    last_seen = Column(DateTime(timezone=True), nullable=False, index=True)
 
 
 class Product(CatalogBase):
     __tablename__ = "products"
 
     id = Column(Integer, primary_key=True)
+    sku = Column(String(64), unique=True, nullable=True)
     anchor = Column(String, index=True, nullable=False)
     name = Column(String, nullable=False)
     price_cents = Column(Integer, nullable=False, default=0)
@@ -26,4 +79,13 @@ class Product(CatalogBase):
     image_url = Column(String, nullable=True)
 
     def __repr__(self) -> str:
-        return f"<Product id={self.id} anchor={self.anchor!r} name={self.name!r}>"
\ No newline at end of file
+        return f"<Product id={self.id} anchor={self.anchor!r} name={self.name!r}>"
+
+
+class CatalogMeta(CatalogBase):
+    """Catalog-wide counters; ``version`` is bumped by every import that changes rows."""
+
+    __tablename__ = "catalog_meta"
+
+    key = Column(String(64), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
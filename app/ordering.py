@@ -0,0 +1,88 @@
+"""Per-sender ordering and burst merging for inbound WhatsApp messages.
+
+Messages from the same ``From`` number are handled one at a time, in arrival
+order, while different senders run concurrently. An optional debounce window
+collects a quick burst (text + photo + "precio?") so it is answered as one
+turn instead of several racing LLM calls.
+
+Both structures are process-local; with several workers, ordering holds for
+messages that land on the same worker.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class KeyedLocks:
+    """FIFO asyncio locks created per key on demand and dropped once idle."""
+
+    def __init__(self) -> None:
+        self._locks: dict[str, tuple[asyncio.Lock, list[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = (asyncio.Lock(), [0])
+        lock, users = entry
+        users[0] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            users[0] -= 1
+            if users[0] == 0:
+                del self._locks[key]
+
+
+class _Burst(Generic[T]):
+    __slots__ = ("items", "generation", "started")
+
+    def __init__(self) -> None:
+        self.items: list[T] = []
+        self.generation = 0
+        self.started = time.monotonic()
+
+
+class SenderDebouncer(Generic[T]):
+    """Merge items submitted under one key within ``window`` seconds.
+
+    The submitter of the last item in a quiet window receives the whole
+    burst; earlier submitters receive ``None``. A burst is flushed after at
+    most ``max_wait`` seconds even if messages keep arriving. A window of 0
+    disables merging and every item is returned on its own.
+    """
+
+    def __init__(self, window: float, max_wait: Optional[float] = None) -> None:
+        self.window = window
+        self.max_wait = max_wait if max_wait is not None else window * 3
+        self._bursts: dict[str, _Burst[T]] = {}
+
+    async def submit(self, key: str, item: T) -> Optional[list[T]]:
+        if self.window <= 0:
+            return [item]
+
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = self._bursts[key] = _Burst()
+        burst.items.append(item)
+        burst.generation += 1
+        generation = burst.generation
+
+        await asyncio.sleep(self.window)
+
+        if self._bursts.get(key) is not burst:
+            return None  # already flushed by an earlier submitter
+        if burst.generation != generation and time.monotonic() - burst.started < self.max_wait:
+            return None  # a newer message will flush the burst
+        del self._bursts[key]
+        return burst.items
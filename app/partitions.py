@@ -0,0 +1,106 @@
+"""Monthly range partitions for the ``conversations`` table (PostgreSQL).
+
+With ``CONVERSATION_PARTITIONING=True`` the table is created as
+``PARTITION BY RANGE (created_at)``. On startup, the current month's
+partition and the next few are created, plus a DEFAULT partition as a safety
+net. Retention (``CONVERSATION_RETENTION_MONTHS``) drops whole expired
+partitions rather than running row-by-row DELETEs.
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.utils import logger
+
+_TABLE = "conversations"
+_PARTITION_RE = re.compile(rf"^{_TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{_TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = _PARTITION_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def ensure_conversation_partitions(
+    engine: Engine, *, months_ahead: int = 2, today: Optional[date] = None
+) -> list[str]:
+    """Create partitions from the current month through ``months_ahead``."""
+    current = month_start(today or _today())
+    created = []
+    with engine.begin() as conn:
+        for offset in range(months_ahead + 1):
+            start = add_months(current, offset)
+            name = partition_name(start)
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {_TABLE} "
+                    f"FOR VALUES FROM ('{start.isoformat()}') "
+                    f"TO ('{add_months(start, 1).isoformat()}')"
+                )
+            )
+            created.append(name)
+        conn.execute(
+            text(f"CREATE TABLE IF NOT EXISTS {_TABLE}_default PARTITION OF {_TABLE} DEFAULT")
+        )
+    logger.info("Conversation partitions ensured: %s", ", ".join(created))
+    return created
+
+
+def list_conversation_partitions(engine: Engine) -> list[str]:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+                "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+                "WHERE parent.relname = :table"
+            ),
+            {"table": _TABLE},
+        )
+        return [row[0] for row in rows]
+
+
+def expired_partitions(
+    names: list[str], retention_months: int, today: Optional[date] = None
+) -> list[str]:
+    """Partitions whose whole month is older than the retention window."""
+    cutoff = add_months(month_start(today or _today()), -retention_months)
+    return sorted(
+        name for name in names if (month := partition_month(name)) is not None and month < cutoff
+    )
+
+
+def drop_expired_partitions(
+    engine: Engine, retention_months: int, *, today: Optional[date] = None
+) -> list[str]:
+    expired = expired_partitions(list_conversation_partitions(engine), retention_months, today)
+    if expired:
+        with engine.begin() as conn:
+            for name in expired:
+                conn.execute(text(f"ALTER TABLE {_TABLE} DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+        logger.info("Dropped expired conversation partitions: %s", ", ".join(expired))
+    return expired
@@ -0,0 +1,164 @@
+"""In-process sampling profiler.
+
+A daemon thread snapshots every thread's Python stack with
+``sys._current_frames()`` every ``PROFILE_INTERVAL_MS`` and counts identical
+stacks. Nothing is instrumented, so the cost is one stack walk per thread per
+tick, and only while a profile is running. Results export to speedscope JSON
+(https://www.speedscope.app) or to collapsed stacks for ``flamegraph.pl``.
+
+The profile covers the worker process that received the start request. With
+several uvicorn workers, start and stop go to whichever process answers.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple, Optional
+
+from decouple import config
+
+PROFILE_INTERVAL_MS = config("PROFILE_INTERVAL_MS", cast=float, default=10.0)
+PROFILE_MAX_SECONDS = config("PROFILE_MAX_SECONDS", cast=int, default=300)
+
+_MAX_DEPTH = 128
+
+Frame = tuple[str, str, int]  # (function, file, first line)
+
+
+class Profile(NamedTuple):
+    samples: Counter  # stack (root → leaf, tuple of Frame) → hits
+    interval: float
+    started: float
+    duration: float
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.samples.values())
+
+    def to_collapsed(self) -> str:
+        """``thread;outer;inner count`` lines (flamegraph.pl / speedscope input)."""
+        lines = []
+        for stack, count in self.samples.most_common():
+            names = ";".join(f"{name} ({file.rsplit('/', 1)[-1]}:{line})" for name, file, line in stack)
+            lines.append(f"{names} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str = "profile") -> dict:
+        frames: list[dict] = []
+        index: dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, count in self.samples.most_common():
+            ids = []
+            for frame in stack:
+                position = index.get(frame)
+                if position is None:
+                    position = index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(position)
+            samples.append(ids)
+            weights.append(round(count * self.interval, 6))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "app.profiler",
+            "name": name,
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": round(self.duration, 6),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+def _stack(frame, thread_name: str) -> tuple[Frame, ...]:
+    frames = []
+    while frame is not None and len(frames) < _MAX_DEPTH:
+        code = frame.f_code
+        frames.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    frames.append((f"thread:{thread_name}", "", 0))
+    frames.reverse()
+    return tuple(frames)
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000.0) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._samples: Counter = Counter()
+        self._started = 0.0
+        self._stopped = 0.0
+        self.last: Optional[Profile] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float) -> bool:
+        """Sample for ``seconds`` in the background; False if already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self._samples = Counter()
+            self._started = time.monotonic()
+            self._thread = threading.Thread(
+                target=self._run, args=(self._started + seconds,), name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    @property
+    def last_profile(self) -> Optional[Profile]:
+        """The finished profile, read without stopping anything; None while running."""
+        with self._lock:
+            if self._thread is None:
+                return self.last
+            if self._thread.is_alive():
+                return None
+            return self._profile()
+
+    def stop(self) -> Optional[Profile]:
+        """Stop early (or collect a finished run) and return the profile."""
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return self.last
+            self._stop.set()
+            thread.join()
+            self._thread = None
+            self.last = self._profile()
+            return self.last
+
+    def _profile(self) -> Profile:
+        return Profile(self._samples, self.interval, self._started, self._stopped - self._started)
+
+    def _run(self, deadline: float) -> None:
+        own = threading.get_ident()
+        samples = self._samples
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    samples[_stack(frame, names.get(ident, str(ident)))] += 1
+            self._stop.wait(self.interval)
+        self._stopped = time.monotonic()
+
+
+_profiler = SamplingProfiler()
+
+
+def get_profiler() -> SamplingProfiler:
+    return _profiler
@@ -0,0 +1,103 @@
+"""Localized WhatsApp reply templates, compiled once per process.
+
+Each locale is a JSON file in ``app/locales`` that maps an intent
+(``price``, ``image_unknown``, ...) to a Jinja template string. An intent can
+also map to a list of variants. A sender always gets the same variant, picked
+from a hash of their number.
+
+All templates are compiled when the registry loads. Templates whose only
+variables are other constant intents (``hardware_menu``) are rendered right
+then, so replying with them is a dict lookup. Intents missing from a locale
+fall back to ``REPLY_LOCALE``.
+"""
+
+from __future__ import annotations
+
+import json
+import zlib
+from pathlib import Path
+from typing import Optional, Union
+
+from decouple import config
+from jinja2 import Environment, StrictUndefined, Template, meta
+
+REPLY_LOCALE = config("REPLY_LOCALE", default="es")
+LOCALE_DIR = Path(__file__).resolve().parent / "locales"
+
+Compiled = Union[str, Template]  # a pre-rendered constant or a compiled template
+
+
+def _money(cents: int) -> str:
+    return f"{cents / 100.0:.2f}"
+
+
+def _text_environment() -> Environment:
+    env = Environment(autoescape=False, undefined=StrictUndefined, keep_trailing_newline=True)
+    env.filters["money"] = _money
+    return env
+
+
+class ReplyRegistry:
+    def __init__(self, catalogs: dict[str, dict[str, Union[str, list[str]]]], default_locale: str) -> None:
+        if default_locale not in catalogs:
+            raise ValueError(f"No reply templates for default locale {default_locale!r}")
+        self.default_locale = default_locale
+        self._env = _text_environment()
+        self._replies: dict[str, dict[str, list[Compiled]]] = {
+            locale: self._compile(catalog) for locale, catalog in catalogs.items()
+        }
+
+    def _compile(self, catalog: dict[str, Union[str, list[str]]]) -> dict[str, list[Compiled]]:
+        pending = {
+            intent: [value] if isinstance(value, str) else list(value) for intent, value in catalog.items()
+        }
+        constants: dict[str, str] = {}
+        compiled: dict[str, list[Compiled]] = {}
+        while pending:  # resolve constants that reference other constants
+            progress = False
+            for intent, variants in list(pending.items()):
+                if len(variants) == 1 and self._variables(variants[0]) <= constants.keys():
+                    constants[intent] = self._env.from_string(variants[0]).render(constants)
+                    compiled[intent] = [constants[intent]]
+                    del pending[intent]
+                    progress = True
+            if not progress:
+                break
+        for intent, variants in pending.items():
+            compiled[intent] = [self._env.from_string(variant, globals=constants) for variant in variants]
+        return compiled
+
+    def _variables(self, source: str) -> set[str]:
+        return meta.find_undeclared_variables(self._env.parse(source))
+
+    def locales(self) -> list[str]:
+        return sorted(self._replies)
+
+    def render(self, intent: str, *, locale: Optional[str] = None, key: str = "", **context) -> str:
+        """Reply text for ``intent``; ``key`` (e.g. the sender) picks a stable variant."""
+        replies = self._replies.get(locale or self.default_locale, {})
+        variants = replies.get(intent) or self._replies[self.default_locale].get(intent)
+        if variants is None:
+            raise KeyError(f"Unknown reply intent {intent!r}")
+        chosen = variants[zlib.crc32(key.encode()) % len(variants)] if len(variants) > 1 else variants[0]
+        return chosen if isinstance(chosen, str) else chosen.render(context)
+
+
+def load_catalogs(directory: Path = LOCALE_DIR) -> dict[str, dict]:
+    return {
+        path.stem: json.loads(path.read_text(encoding="utf-8")) for path in sorted(directory.glob("*.json"))
+    }
+
+
+_registry: Optional[ReplyRegistry] = None
+
+
+def get_reply_registry() -> ReplyRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ReplyRegistry(load_catalogs(), REPLY_LOCALE)
+    return _registry
+
+
+def render_reply(intent: str, **context) -> str:
+    return get_reply_registry().render(intent, **context)
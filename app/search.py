@@ -0,0 +1,351 @@
+"""In-memory fuzzy search over the product catalog.
+
+Product names and anchors are accent-folded and tokenized into an inverted
+index scored with BM25. Query words that are not in the vocabulary
+("percutor" → "percutora", "silicon" → "silicón") are expanded through a
+trigram index over the vocabulary. Per-term BM25 impacts are cached, so a
+query is a set intersection plus scoring of the surviving candidates. Adding
+or removing a document shifts the document count and average length that
+every impact depends on, so each such change drops all cached impacts. They
+are recomputed lazily for the terms the next queries use.
+
+The index is process-local and is updated incrementally: `refresh_catalog_index`
+diffs the catalog rows against the indexed entries and re-indexes only the
+products that changed. A refresh runs as soon as the catalog version (bumped
+by `app.catalog_sync`) changes, and at least every `CATALOG_INDEX_TTL_SECONDS`
+to pick up manual edits.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Iterable, NamedTuple, Optional
+
+from decouple import config
+from sqlalchemy.orm import Session
+
+from app.catalog_sync import catalog_version
+from app.models import Product
+from app.utils import logger
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    {
+        "a", "al", "con", "cual", "cuanto", "cuanta", "cuantos", "cuesta", "cuestan", "de", "del",
+        "el", "en", "es", "hay", "la", "las", "lo", "los", "me", "mi", "necesito", "para", "por",
+        "precio", "precios", "que", "quiero", "se", "su", "tiene", "tienen", "un", "una", "unos",
+        "vale", "venden", "y", "o",
+    }
+)  # fmt: skip
+_ANCHOR_BOOST = 2
+_MIN_SIMILARITY = 0.45
+_MAX_EXPANSIONS = 4
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents: "Silicón" → "silicon"."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def words(text: str) -> list[str]:
+    """Folded word tokens, stopwords included."""
+    return _TOKEN_RE.findall(fold(text))
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in words(text) if token not in _STOPWORDS]
+
+
+def trigrams(token: str) -> set[str]:
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class CatalogEntry(NamedTuple):
+    id: int
+    anchor: str
+    name: str
+    price_cents: int
+    stock: int
+    image_url: Optional[str]
+
+
+class SearchHit(NamedTuple):
+    entry: CatalogEntry
+    score: float
+
+
+class CatalogSearchIndex:
+    def __init__(self, *, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._entries: dict[int, CatalogEntry] = {}
+        self._doc_terms: dict[int, Counter] = {}
+        self._doc_len: dict[int, int] = {}
+        self._postings: dict[str, dict[int, int]] = {}
+        self._total_len = 0
+        self._trigram_vocab: dict[str, set[str]] = {}
+        self._impacts: dict[str, dict[int, float]] = {}
+        self._ranked_cache: dict[str, list[tuple[int, float]]] = {}
+        self._doc_set_cache: dict[str, frozenset[int]] = {}
+        self._expansions: dict[str, tuple[tuple[str, float], ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, product_id: int) -> Optional[CatalogEntry]:
+        return self._entries.get(product_id)
+
+    def entries(self) -> list[CatalogEntry]:
+        return list(self._entries.values())
+
+    def rebuild(self, entries: Iterable[CatalogEntry]) -> None:
+        fresh = CatalogSearchIndex(k1=self.k1, b=self.b)
+        for entry in entries:
+            fresh._add(entry)
+        with self._lock:
+            self._entries = fresh._entries
+            self._doc_terms = fresh._doc_terms
+            self._doc_len = fresh._doc_len
+            self._postings = fresh._postings
+            self._total_len = fresh._total_len
+            self._trigram_vocab = fresh._trigram_vocab
+            self._impacts = {}
+            self._ranked_cache = {}
+            self._doc_set_cache = {}
+            self._expansions = {}
+
+    def upsert(self, entry: CatalogEntry) -> None:
+        with self._lock:
+            current = self._entries.get(entry.id)
+            if current == entry:
+                return
+            if current is not None:
+                if (current.name, current.anchor) == (entry.name, entry.anchor):
+                    self._entries[entry.id] = entry  # price/stock only: postings unchanged
+                    return
+                self._remove(entry.id)
+            self._add(entry)
+
+    def remove(self, product_id: int) -> None:
+        with self._lock:
+            self._remove(product_id)
+
+    def _terms(self, entry: CatalogEntry) -> Counter:
+        terms = Counter(tokenize(entry.name))
+        for token in tokenize(entry.anchor):
+            terms[token] += _ANCHOR_BOOST
+        return terms
+
+    def _add(self, entry: CatalogEntry) -> None:
+        terms = self._terms(entry)
+        self._entries[entry.id] = entry
+        self._doc_terms[entry.id] = terms
+        self._doc_len[entry.id] = length = sum(terms.values())
+        self._total_len += length
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                for gram in trigrams(term):
+                    self._trigram_vocab.setdefault(gram, set()).add(term)
+                self._expansions.clear()
+            postings[entry.id] = tf
+            self._doc_set_cache.pop(term, None)
+        self._drop_impacts()
+
+    def _remove(self, product_id: int) -> None:
+        if self._entries.pop(product_id, None) is None:
+            return
+        terms = self._doc_terms.pop(product_id)
+        self._total_len -= self._doc_len.pop(product_id)
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            self._doc_set_cache.pop(term, None)
+            if not postings:
+                del self._postings[term]
+                for gram in trigrams(term):
+                    vocab = self._trigram_vocab.get(gram)
+                    if vocab is not None:
+                        vocab.discard(term)
+                        if not vocab:
+                            del self._trigram_vocab[gram]
+                self._expansions.clear()
+        self._drop_impacts()
+
+    def _drop_impacts(self) -> None:
+        """Forget every cached impact: IDF and average length changed for all terms."""
+        self._impacts.clear()
+        self._ranked_cache.clear()
+
+    def _term_impacts(self, term: str) -> dict[int, float]:
+        impacts = self._impacts.get(term)
+        if impacts is None:
+            postings = self._postings.get(term, {})
+            count = len(self._entries) or 1
+            avg_len = (self._total_len / count) or 1.0
+            idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            k1, b = self.k1, self.b
+            doc_len = self._doc_len
+            impacts = {}
+            for doc_id, tf in postings.items():
+                length_norm = k1 * (1.0 - b + b * doc_len[doc_id] / avg_len)
+                impacts[doc_id] = idf * tf * (k1 + 1.0) / (tf + length_norm)
+            self._impacts[term] = impacts
+        return impacts
+
+    def _expand(self, token: str) -> tuple[tuple[str, float], ...]:
+        """Vocabulary terms similar to ``token`` with their trigram Jaccard weights."""
+        cached = self._expansions.get(token)
+        if cached is not None:
+            return cached
+        if token in self._postings:
+            result: tuple[tuple[str, float], ...] = ((token, 1.0),)
+        else:
+            grams = trigrams(token)
+            shared: Counter = Counter()
+            for gram in grams:
+                shared.update(self._trigram_vocab.get(gram, ()))
+            scored = []
+            for term, overlap in shared.items():
+                similarity = overlap / (len(grams) + len(term) + 1 - overlap)
+                if similarity >= _MIN_SIMILARITY:
+                    scored.append((term, similarity))
+            result = tuple(heapq.nlargest(_MAX_EXPANSIONS, scored, key=lambda item: item[1]))
+        self._expansions[token] = result
+        return result
+
+    def _doc_set(self, term: str) -> frozenset[int]:
+        doc_set = self._doc_set_cache.get(term)
+        if doc_set is None:
+            doc_set = self._doc_set_cache[term] = frozenset(self._postings[term])
+        return doc_set
+
+    def _ranked(self, term: str) -> list[tuple[int, float]]:
+        ranked = self._ranked_cache.get(term)
+        if ranked is None:
+            ranked = sorted(self._term_impacts(term).items(), key=lambda item: -item[1])
+            self._ranked_cache[term] = ranked
+        return ranked
+
+    def search(self, query: str, limit: int = 5) -> list[SearchHit]:
+        """Top ``limit`` products for ``query``.
+
+        Products matching every recognised query word are scored first (a
+        C-level set intersection, smallest posting list first); only when that
+        yields fewer than ``limit`` products does scoring fall back to any-word
+        matches.
+        """
+        with self._lock:
+            groups = [group for group in map(self._expand, dict.fromkeys(tokenize(query))) if group]
+            if not groups:
+                return []
+
+            if len(groups) == 1 and len(groups[0]) == 1:
+                term, _ = groups[0][0]
+                return [
+                    SearchHit(self._entries[doc_id], score)
+                    for doc_id, score in self._ranked(term)[:limit]
+                ]
+
+            doc_sets = []
+            for group in groups:
+                if len(group) == 1:
+                    doc_sets.append(self._doc_set(group[0][0]))
+                else:
+                    doc_sets.append(frozenset().union(*(self._doc_set(term) for term, _ in group)))
+            doc_sets.sort(key=len)
+            candidates = doc_sets[0]
+            for doc_set in doc_sets[1:]:
+                candidates = candidates & doc_set
+            if len(candidates) < limit:
+                candidates = frozenset().union(*doc_sets)
+
+            lookups = [
+                (self._term_impacts(term).get, weight) for group in groups for term, weight in group
+            ]
+            scores = [
+                (sum(get(doc_id, 0.0) * weight for get, weight in lookups), doc_id)
+                for doc_id in candidates
+            ]
+            best = heapq.nlargest(limit, scores)
+            return [SearchHit(self._entries[doc_id], score) for score, doc_id in best]
+
+
+def _entry_from_row(row) -> CatalogEntry:
+    return CatalogEntry(
+        int(row.id), row.anchor, row.name, int(row.price_cents), int(row.stock), row.image_url
+    )
+
+
+def load_catalog_entries(db: Session) -> list[CatalogEntry]:
+    rows = db.query(
+        Product.id, Product.anchor, Product.name, Product.price_cents, Product.stock, Product.image_url
+    ).all()
+    return [_entry_from_row(row) for row in rows]
+
+
+def refresh_catalog_index(index: CatalogSearchIndex, entries: Iterable[CatalogEntry]) -> int:
+    """Apply only the differences between ``entries`` and the index; returns changes."""
+    seen: set[int] = set()
+    changed = 0
+    for entry in entries:
+        seen.add(entry.id)
+        if index.get(entry.id) != entry:
+            index.upsert(entry)
+            changed += 1
+    for entry in index.entries():
+        if entry.id not in seen:
+            index.remove(entry.id)
+            changed += 1
+    return changed
+
+
+_catalog_index: CatalogSearchIndex | None = None
+_catalog_index_version: Optional[int] = None
+_catalog_index_synced_at = 0.0
+_catalog_index_polled_at = 0.0
+_catalog_index_lock = threading.Lock()
+
+
+def get_catalog_index(db: Session) -> CatalogSearchIndex:
+    """Process-wide index.
+
+    The catalog version is polled at most every ``CATALOG_VERSION_POLL_SECONDS``
+    (one primary-key lookup); the index is resynced when the version moved or
+    ``CATALOG_INDEX_TTL_SECONDS`` elapsed since the last sync.
+    """
+    global _catalog_index, _catalog_index_version, _catalog_index_synced_at, _catalog_index_polled_at
+    ttl = config("CATALOG_INDEX_TTL_SECONDS", cast=float, default=300.0)
+    poll = config("CATALOG_VERSION_POLL_SECONDS", cast=float, default=5.0)
+    with _catalog_index_lock:
+        now = time.monotonic()
+        if _catalog_index is None:
+            version = catalog_version(db)
+            index = CatalogSearchIndex()
+            index.rebuild(load_catalog_entries(db))
+            _catalog_index, _catalog_index_version = index, version
+            _catalog_index_synced_at = _catalog_index_polled_at = now
+            logger.info("Catalog search index built with %s products (version %s).", len(index), version)
+        elif now - _catalog_index_polled_at >= poll:
+            _catalog_index_polled_at = now
+            version = catalog_version(db)
+            if version != _catalog_index_version or now - _catalog_index_synced_at >= ttl:
+                changed = refresh_catalog_index(_catalog_index, load_catalog_entries(db))
+                _catalog_index_version, _catalog_index_synced_at = version, now
+                if changed:
+                    logger.info(
+                        "Catalog search index refreshed to version %s: %s products changed.",
+                        version,
+                        changed,
+                    )
+        return _catalog_index
@@ -2,46 +2,134 @@
 
 from __future__ import annotations
 
+import base64
+import hmac
 import secrets
-from typing import Mapping
+from functools import lru_cache
+from hashlib import sha1, sha256
+from typing import Iterable, Mapping
+from urllib.parse import parse_qs, parse_qsl, urlparse
 
-from decouple import config
+from decouple import Csv, config
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
-from twilio.request_validator import RequestValidator
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from twilio.request_validator import add_port, remove_port
 
 _http_basic = HTTPBasic(auto_error=False)
 
+_FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
 
-def _twilio_auth_token() -> str:
-    return config("TWILIO_AUTH_TOKEN", default="")
 
+@lru_cache
+def _twilio_auth_tokens() -> tuple[str, ...]:
+    """Active token first, then any previous tokens still valid during rotation."""
+    primary = config("TWILIO_AUTH_TOKEN", default="")
+    previous = config("TWILIO_AUTH_TOKENS_PREVIOUS", cast=Csv(), default="")
+    return tuple(dict.fromkeys(token for token in (primary, *previous) if token))
 
+
+@lru_cache
+def _public_base_url() -> str:
+    return config("PUBLIC_BASE_URL", default="").strip().rstrip("/")
+
+
+@lru_cache
 def twilio_signature_enabled() -> bool:
     return config("TWILIO_VALIDATE_SIGNATURE", cast=bool, default=True)
 
 
 def _webhook_url(request: Request) -> str:
-    public_base = config("PUBLIC_BASE_URL", default="").strip().rstrip("/")
+    public_base = _public_base_url()
     if public_base:
-        return f"{public_base}{request.url.path}"
+        query = request.url.query
+        return f"{public_base}{request.url.path}" + (f"?{query}" if query else "")
     return str(request.url)
 
 
-async def validate_twilio_signature(request: Request, form: Mapping[str, object]) -> None:
+@lru_cache(maxsize=64)
+def _url_variants(url: str) -> tuple[bytes, ...]:
+    """Twilio may sign the URL with or without the default port; accept both."""
+    parsed = urlparse(url)
+    return tuple(
+        dict.fromkeys(variant.encode("utf-8") for variant in (remove_port(parsed), add_port(parsed)))
+    )
+
+
+class TwilioSignatureVerifier:
+    """Reusable ``X-Twilio-Signature`` checker with precomputed HMAC keys.
+
+    Each token's HMAC-SHA1 key schedule is computed once; per request the
+    prepared MAC is copied and fed the URL plus the sorted raw form pairs,
+    so no ``RequestValidator`` or intermediate params dict is built.
+    """
+
+    def __init__(self, tokens: Iterable[str]) -> None:
+        self._macs = tuple(hmac.new(token.encode("utf-8"), digestmod=sha1) for token in tokens)
+
+    def __bool__(self) -> bool:
+        return bool(self._macs)
+
+    def verify(self, url: str, body: bytes, signature: str, *, form_encoded: bool = True) -> bool:
+        if not signature or not self._macs:
+            return False
+
+        if form_encoded:
+            pairs = parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True)
+            payload = "".join(f"{key}{value}" for key, value in sorted(set(pairs))).encode("utf-8")
+        else:
+            # Non-form bodies (JSON) are covered by the bodySHA256 query param instead.
+            expected_hash = parse_qs(urlparse(url).query).get("bodySHA256", [""])[0]
+            if not hmac.compare_digest(sha256(body).hexdigest(), expected_hash):
+                return False
+            payload = b""
+
+        expected = signature.strip().encode("utf-8")
+        for mac in self._macs:
+            for variant in _url_variants(url):
+                candidate = mac.copy()
+                candidate.update(variant)
+                candidate.update(payload)
+                if hmac.compare_digest(base64.b64encode(candidate.digest()), expected):
+                    return True
+        return False
+
+
+@lru_cache(maxsize=8)
+def _verifier_for(tokens: tuple[str, ...]) -> TwilioSignatureVerifier:
+    return TwilioSignatureVerifier(tokens)
+
+
+def get_signature_verifier() -> TwilioSignatureVerifier:
+    return _verifier_for(_twilio_auth_tokens())
+
+
+async def validate_twilio_signature(request: Request) -> None:
+    """Verify the webhook signature against the raw body, before form parsing.
+
+    Anything that cannot carry a valid Twilio signature (missing header,
+    multipart or other non-form bodies without ``bodySHA256``) is rejected
+    without reading the body, so large uploads are never materialized.
+    """
     if not twilio_signature_enabled():
         return
 
-    auth_token = _twilio_auth_token()
-    if not auth_token:
+    verifier = get_signature_verifier()
+    if not verifier:
         raise HTTPException(status_code=500, detail="TWILIO_AUTH_TOKEN is not configured")
 
     signature = request.headers.get("X-Twilio-Signature", "")
-    params = {key: str(value) for key, value in form.items()}
-    validator = RequestValidator(auth_token)
-    if not validator.validate(_webhook_url(request), params, signature):
+    if not signature:
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+
+    content_type = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    form_encoded = content_type == _FORM_CONTENT_TYPE
+    if not form_encoded and "bodySHA256" not in request.url.query:
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+
+    body = await request.body()
+    if not verifier.verify(_webhook_url(request), body, signature, form_encoded=form_encoded):
         raise HTTPException(status_code=403, detail="Invalid Twilio signature")
 
 
@@ -70,21 +158,87 @@ def verify_admin(credentials: HTTPBasicCredentials | None = Depends(_http_basic)
     return credentials.username
 
 
-class LimitBodySizeMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, max_bytes: int) -> None:
-        super().__init__(app)
+class RequestBodyTooLarge(Exception):
+    """Raised into the app once the body passes its cap; only ``LimitBodySizeMiddleware`` handles it."""
+
+
+class LimitBodySizeMiddleware:
+    """Pure ASGI body-size cap enforced while the body streams in.
+
+    ``Content-Length`` is checked up front, and bytes are counted as they pass
+    through ``receive`` so chunked uploads are cut off at the cap instead of
+    being buffered. Whatever the app answers to a cut-off body (FastAPI turns
+    body-parsing errors into a 400) is replaced by the 413. ``route_limits``
+    maps path prefixes to their own caps; the longest matching prefix wins,
+    otherwise ``max_bytes`` applies.
+    """
+
+    def __init__(
+        self, app: ASGIApp, max_bytes: int, route_limits: Mapping[str, int] | None = None
+    ) -> None:
+        self.app = app
         self.max_bytes = max_bytes
+        self.route_limits = sorted(
+            (route_limits or {}).items(), key=lambda item: len(item[0]), reverse=True
+        )
+
+    def limit_for(self, path: str) -> int:
+        for prefix, limit in self.route_limits:
+            if path.startswith(prefix):
+                return limit
+        return self.max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next):
-        if request.method in {"POST", "PUT", "PATCH"}:
-            content_length = request.headers.get("content-length")
-            if content_length is not None:
+        limit = self.limit_for(scope["path"])
+        for name, value in scope["headers"]:
+            if name == b"content-length":
                 try:
-                    if int(content_length) > self.max_bytes:
-                        return JSONResponse(
-                            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
-                            content={"detail": "Request body too large"},
-                        )
+                    too_large = int(value) > limit
                 except ValueError:
-                    pass
-        return await call_next(request)
\ No newline at end of file
+                    too_large = False
+                if too_large:
+                    await _reject_too_large(scope, receive, send)
+                    return
+                break
+
+        received = 0
+        exceeded = response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise RequestBodyTooLarge()
+            return message
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal response_started
+            if exceeded and not response_started:
+                return  # the app's answer to the cut-off body; the 413 goes out instead
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except RequestBodyTooLarge:
+            if response_started:
+                raise
+        if exceeded and not response_started:
+            await _reject_too_large(scope, receive, send)
+
+
+async def _reject_too_large(scope: Scope, receive: Receive, send: Send) -> None:
+    response = JSONResponse(
+        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+        content={"detail": "Request body too large"},
+        headers={"Connection": "close"},
+    )
+    await response(scope, receive, send)
@@ -1,11 +1,28 @@
+import hashlib
 import os
-import uuid
 
 from fpdf import FPDF
 
+from app.tracing import traced
+from app.utils import write_file_atomic
 
+# Part of every quote's file name: bump it when the layout below changes.
+_LAYOUT_VERSION = "1"
+
+
+@traced()
 def generate_pdf(content: str, out_dir: str = ".") -> tuple[str, str]:
-    os.makedirs(out_dir, exist_ok=True)
+    """Render ``content`` to ``cotizacion_<hash>.pdf``; returns (path, file name).
+
+    The name hashes the render inputs rather than the bytes, which carry
+    fpdf's creation date. The same quote therefore keeps one file and one
+    immutable URL, and an existing file is reused without rendering again.
+    """
+    digest = hashlib.sha256(f"{_LAYOUT_VERSION}\n{content}".encode()).hexdigest()[:32]
+    filename = f"cotizacion_{digest}.pdf"
+    file_path = os.path.join(out_dir, filename)
+    if os.path.exists(file_path):
+        return file_path, filename
 
     class PDF(FPDF):
         def header(self):
@@ -15,10 +32,9 @@ def generate_pdf(content: str, out_dir: str = ".") -> tuple[str, str]:
             self.ln(20)
 
     pdf = PDF()
+    pdf.set_title("Cotizacion")
     pdf.add_page()
     pdf.set_font("Arial", size=12)
     pdf.multi_cell(0, 10, content)
-    filename = f"cotizacion_{uuid.uuid4().hex}.pdf"
-    file_path = os.path.join(out_dir, filename)
-    pdf.output(file_path)
-    return file_path, filename
\ No newline at end of file
+    write_file_atomic(pdf.output(dest="S").encode("latin-1"), out_dir, filename)
+    return file_path, filename
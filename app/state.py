@@ -0,0 +1,233 @@
+"""Shared key/value state for dedup, caches and rate limits.
+
+The module-level clients (`_openai_client`, `_twilio_client`) and lru_cache'd
+config are safe to keep per process, but anything that must agree across
+uvicorn workers or pods lives behind a `StateBackend`:
+
+- ``memory``: process-local, the default for a single worker and for tests
+- ``sqlite``: a WAL-mode SQLite file shared by every worker on one host
+- ``postgres``: the chat database, shared by every pod
+
+Select one with ``STATE_BACKEND`` (``STATE_SQLITE_PATH`` for the SQLite file).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from decouple import config
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+
+from app.utils import logger
+
+_STATE_TABLE = "app_state"
+
+
+def _expires_at(ttl: Optional[float]) -> Optional[float]:
+    return None if ttl is None else time.time() + ttl
+
+
+class StateBackend(ABC):
+    """Atomic key/value operations with optional per-key TTL (seconds)."""
+
+    @abstractmethod
+    def add_if_absent(self, key: str, value: str = "1", ttl: Optional[float] = None) -> bool:
+        """Store ``value`` only if ``key`` is missing or expired; True if stored."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add ``amount`` to an integer counter; ``ttl`` applies when it is created."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+
+class MemoryStateBackend(StateBackend):
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[str, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float) -> Optional[tuple[str, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def add_if_absent(self, key: str, value: str = "1", ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._live(key, time.time()) is not None:
+                return False
+            self._data[key] = (value, _expires_at(ttl))
+            return True
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._live(key, time.time())
+            return None if entry is None else entry[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, _expires_at(ttl))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                entry = ("0", _expires_at(ttl))
+            total = int(entry[0]) + amount
+            self._data[key] = (str(total), entry[1])
+            return total
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLStateBackend(StateBackend):
+    """State table shared through a SQL database (SQLite or PostgreSQL).
+
+    Every operation is a single upsert statement, so concurrent workers never
+    observe a half-applied update.
+    """
+
+    def __init__(self, engine: Engine) -> None:
+        self.engine = engine
+
+    def add_if_absent(self, key: str, value: str = "1", ttl: Optional[float] = None) -> bool:
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                text(
+                    f"INSERT INTO {_STATE_TABLE} (key, value, expires_at) VALUES (:key, :value, :exp) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                    f"WHERE {_STATE_TABLE}.expires_at IS NOT NULL AND {_STATE_TABLE}.expires_at <= :now "
+                    "RETURNING key"
+                ),
+                {"key": key, "value": value, "exp": _expires_at(ttl), "now": time.time()},
+            ).first()
+        return row is not None
+
+    def get(self, key: str) -> Optional[str]:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text(
+                    f"SELECT value FROM {_STATE_TABLE} "
+                    "WHERE key = :key AND (expires_at IS NULL OR expires_at > :now)"
+                ),
+                {"key": key, "now": time.time()},
+            ).scalar()
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"INSERT INTO {_STATE_TABLE} (key, value, expires_at) VALUES (:key, :value, :exp) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+                ),
+                {"key": key, "value": value, "exp": _expires_at(ttl)},
+            )
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        expired = f"{_STATE_TABLE}.expires_at IS NOT NULL AND {_STATE_TABLE}.expires_at <= :now"
+        with self.engine.begin() as conn:
+            value = conn.execute(
+                text(
+                    f"INSERT INTO {_STATE_TABLE} (key, value, expires_at) VALUES (:key, :amount, :exp) "
+                    "ON CONFLICT (key) DO UPDATE SET "
+                    f"value = CASE WHEN {expired} THEN excluded.value "
+                    f"ELSE CAST(CAST({_STATE_TABLE}.value AS BIGINT) + :delta AS TEXT) END, "
+                    f"expires_at = CASE WHEN {expired} THEN excluded.expires_at "
+                    f"ELSE {_STATE_TABLE}.expires_at END "
+                    "RETURNING value"
+                ),
+                {
+                    "key": key,
+                    "amount": str(amount),
+                    "delta": amount,
+                    "exp": _expires_at(ttl),
+                    "now": time.time(),
+                },
+            ).scalar_one()
+        return int(value)
+
+    def delete(self, key: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DELETE FROM {_STATE_TABLE} WHERE key = :key"), {"key": key})
+
+    def purge_expired(self) -> int:
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                text(f"DELETE FROM {_STATE_TABLE} WHERE expires_at IS NOT NULL AND expires_at <= :now"),
+                {"now": time.time()},
+            )
+        return result.rowcount
+
+
+class SQLiteStateBackend(SQLStateBackend):
+    """SQLite file in WAL mode, shared by all worker processes on one host."""
+
+    def __init__(self, path: str) -> None:
+        engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+
+        @event.listens_for(engine, "connect")
+        def _configure(dbapi_conn, _record) -> None:
+            cursor = dbapi_conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        super().__init__(engine)
+        # A standalone file outside the Alembic-managed databases: it makes its own table.
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {_STATE_TABLE} ("
+                    "key VARCHAR(255) PRIMARY KEY, value TEXT NOT NULL, expires_at DOUBLE PRECISION)"
+                )
+            )
+
+
+class PostgresStateBackend(SQLStateBackend):
+    """State table in the chat database, shared by every pod.
+
+    The table is created by the chat migrations (revision 0004).
+    """
+
+    def __init__(self, engine: Optional[Engine] = None) -> None:
+        if engine is None:
+            from app.database import chat_engine
+
+            engine = chat_engine
+        super().__init__(engine)
+
+
+_state_backend: StateBackend | None = None
+
+
+def get_state_backend() -> StateBackend:
+    global _state_backend
+    if _state_backend is None:
+        kind = config("STATE_BACKEND", default="memory").strip().lower()
+        if kind == "memory":
+            _state_backend = MemoryStateBackend()
+        elif kind == "sqlite":
+            _state_backend = SQLiteStateBackend(config("STATE_SQLITE_PATH", default="state.sqlite3"))
+        elif kind == "postgres":
+            _state_backend = PostgresStateBackend()
+        else:
+            raise ValueError(f"Unknown STATE_BACKEND {kind!r}; use memory, sqlite or postgres")
+        logger.info("State backend: %s", type(_state_backend).__name__)
+    return _state_backend
@@ -0,0 +1,232 @@
+"""Incremental conversation rollups and the cached stats summary.
+
+Every stored conversation bumps two rollup rows in the same transaction:
+``conversation_hourly_stats`` (hour bucket × reply branch, with summed
+latency, OpenAI tokens and cost) and ``sender_stats`` (per-sender count, cost
+and first/last seen). The dashboard reads only these tables, so its cost grows
+with the number of buckets shown rather than with the size of ``conversations``.
+
+Existing history can be folded into the rollups once with::
+
+    python -m app.stats rebuild
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from decouple import config
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from app.models import Conversation, ConversationHourlyStat, SenderStat
+from app.utils import logger
+
+STATS_CACHE_SECONDS = config("STATS_CACHE_SECONDS", cast=float, default=30.0)
+UNKNOWN_BRANCH = "unknown"
+
+_UPSERT_HOURLY = text(
+    """
+    INSERT INTO conversation_hourly_stats
+        (bucket, branch, count, latency_ms_total, prompt_tokens, completion_tokens, cost_micros)
+    VALUES (:bucket, :branch, 1, :latency_ms, :prompt_tokens, :completion_tokens, :cost_micros)
+    ON CONFLICT (bucket, branch) DO UPDATE SET
+        count = conversation_hourly_stats.count + 1,
+        latency_ms_total = conversation_hourly_stats.latency_ms_total + excluded.latency_ms_total,
+        prompt_tokens = conversation_hourly_stats.prompt_tokens + excluded.prompt_tokens,
+        completion_tokens = conversation_hourly_stats.completion_tokens + excluded.completion_tokens,
+        cost_micros = conversation_hourly_stats.cost_micros + excluded.cost_micros
+    """
+)
+_UPSERT_SENDER = text(
+    """
+    INSERT INTO sender_stats (sender, count, cost_micros, first_seen, last_seen)
+    VALUES (:sender, 1, :cost_micros, :seen, :seen)
+    ON CONFLICT (sender) DO UPDATE SET
+        count = sender_stats.count + 1,
+        cost_micros = sender_stats.cost_micros + excluded.cost_micros,
+        last_seen = excluded.last_seen
+    """
+)
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def record_conversation(db: Session, conversation: Conversation) -> None:
+    """Add ``conversation`` to the rollups; the caller commits."""
+    created_at = conversation.created_at or datetime.now(timezone.utc)
+    cost_micros = conversation.cost_micros or 0
+    db.execute(
+        _UPSERT_HOURLY,
+        {
+            "bucket": hour_bucket(created_at),
+            "branch": conversation.branch or UNKNOWN_BRANCH,
+            "latency_ms": conversation.latency_ms or 0,
+            "prompt_tokens": conversation.prompt_tokens or 0,
+            "completion_tokens": conversation.completion_tokens or 0,
+            "cost_micros": cost_micros,
+        },
+    )
+    db.execute(
+        _UPSERT_SENDER,
+        {"sender": conversation.sender or "", "cost_micros": cost_micros, "seen": created_at},
+    )
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def stats_summary(
+    db: Session, *, hours: int = 24, top_senders: int = 10, now: Optional[datetime] = None
+) -> dict:
+    """Per-hour counts, per-branch totals and top senders, read from the rollups only."""
+    since = hour_bucket(now or datetime.now(timezone.utc)) - timedelta(hours=hours - 1)
+    rows = (
+        db.query(
+            ConversationHourlyStat.bucket,
+            ConversationHourlyStat.branch,
+            ConversationHourlyStat.count,
+            ConversationHourlyStat.latency_ms_total,
+            ConversationHourlyStat.prompt_tokens,
+            ConversationHourlyStat.completion_tokens,
+            ConversationHourlyStat.cost_micros,
+        )
+        .filter(ConversationHourlyStat.bucket >= since)
+        .order_by(ConversationHourlyStat.bucket)
+        .all()
+    )
+
+    hourly: dict[str, dict[str, int]] = {}
+    branches: dict[str, dict[str, float]] = {}
+    for bucket, branch, count, latency_total, prompt_tokens, completion_tokens, cost in rows:
+        hourly.setdefault(_as_utc(bucket).isoformat(), {})[branch] = count
+        totals = branches.setdefault(
+            branch, {"count": 0, "latency_ms_total": 0, "tokens": 0, "cost_micros": 0}
+        )
+        totals["count"] += count
+        totals["latency_ms_total"] += latency_total
+        totals["tokens"] += (prompt_tokens or 0) + (completion_tokens or 0)
+        totals["cost_micros"] += cost or 0
+
+    total = sum(item["count"] for item in branches.values())
+    llm_calls = sum(branches.get(name, {}).get("count", 0) for name in ("llm", "llm_fallback"))
+    fallbacks = branches.get("llm_fallback", {}).get("count", 0)
+
+    senders = (
+        db.query(SenderStat.sender, SenderStat.count, SenderStat.cost_micros, SenderStat.last_seen)
+        .order_by(SenderStat.count.desc())
+        .limit(top_senders)
+        .all()
+    )
+    return {
+        "since": since.isoformat(),
+        "hours": hours,
+        "total": total,
+        "llm_fallback_rate": round(fallbacks / llm_calls, 4) if llm_calls else None,
+        "cost_usd": sum(item["cost_micros"] for item in branches.values()) / 1_000_000,
+        "branches": {
+            name: {
+                "count": item["count"],
+                "avg_latency_ms": round(item["latency_ms_total"] / item["count"]) if item["count"] else None,
+                "tokens": item["tokens"],
+                "cost_usd": item["cost_micros"] / 1_000_000,
+            }
+            for name, item in sorted(branches.items(), key=lambda pair: -pair[1]["count"])
+        },
+        "hourly": [{"bucket": bucket, "branches": counts} for bucket, counts in hourly.items()],
+        "top_senders": [
+            {
+                "sender": sender,
+                "count": count,
+                "cost_usd": (cost or 0) / 1_000_000,
+                "last_seen": _as_utc(last_seen).isoformat(),
+            }
+            for sender, count, cost, last_seen in senders
+        ],
+    }
+
+
+_summary_cache: dict[tuple[int, int], tuple[float, dict]] = {}
+_summary_lock = threading.Lock()
+
+
+def cached_stats_summary(db: Session, *, hours: int = 24, top_senders: int = 10) -> dict:
+    """``stats_summary`` memoized per process for ``STATS_CACHE_SECONDS``."""
+    key = (hours, top_senders)
+    now = time.monotonic()
+    with _summary_lock:
+        cached = _summary_cache.get(key)
+        if cached is not None and now - cached[0] < STATS_CACHE_SECONDS:
+            return cached[1]
+    summary = stats_summary(db, hours=hours, top_senders=top_senders)
+    with _summary_lock:
+        _summary_cache[key] = (now, summary)
+    return summary
+
+
+def rebuild_rollups(db: Session) -> int:
+    """Recompute both rollup tables from ``conversations`` (one full scan)."""
+    bucket = func.date_trunc("hour", Conversation.created_at)
+    hourly = (
+        db.query(
+            bucket,
+            func.coalesce(Conversation.branch, UNKNOWN_BRANCH),
+            func.count(),
+            func.coalesce(func.sum(Conversation.latency_ms), 0),
+            func.coalesce(func.sum(Conversation.prompt_tokens), 0),
+            func.coalesce(func.sum(Conversation.completion_tokens), 0),
+            func.coalesce(func.sum(Conversation.cost_micros), 0),
+        )
+        .group_by(bucket, func.coalesce(Conversation.branch, UNKNOWN_BRANCH))
+        .all()
+    )
+    senders = (
+        db.query(
+            func.coalesce(Conversation.sender, ""),
+            func.count(),
+            func.coalesce(func.sum(Conversation.cost_micros), 0),
+            func.min(Conversation.created_at),
+            func.max(Conversation.created_at),
+        )
+        .group_by(func.coalesce(Conversation.sender, ""))
+        .all()
+    )
+    db.query(ConversationHourlyStat).delete()
+    db.query(SenderStat).delete()
+    db.add_all(
+        ConversationHourlyStat(
+            bucket=b,
+            branch=branch,
+            count=count,
+            latency_ms_total=latency,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost_micros=cost,
+        )
+        for b, branch, count, latency, prompt_tokens, completion_tokens, cost in hourly
+    )
+    db.add_all(
+        SenderStat(sender=sender, count=count, cost_micros=cost, first_seen=first, last_seen=last)
+        for sender, count, cost, first, last in senders
+    )
+    db.commit()
+    return sum(row[2] for row in hourly)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("Usage: python -m app.stats rebuild", file=sys.stderr)
+        raise SystemExit(2)
+    from app.database import ChatSessionLocal
+
+    with ChatSessionLocal() as session:
+        logger.info("Rollups rebuilt from %s conversations.", rebuild_rollups(session))
@@ -0,0 +1,43 @@
+"""Shared Jinja2 environment for the admin HTML pages.
+
+Templates are compiled once at startup (``precompile_templates``). The
+compiled bytecode is kept in a ``FileSystemBytecodeCache``, so the next
+process, or another worker, loads it instead of parsing the sources again.
+``auto_reload`` is off by default: a cached template is used without
+checking the file's mtime on every render. Set ``TEMPLATES_AUTO_RELOAD=True``
+while editing templates.
+"""
+
+from __future__ import annotations
+
+from decouple import config
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+TEMPLATE_DIR = "app/templates"
+TEMPLATES_AUTO_RELOAD = config("TEMPLATES_AUTO_RELOAD", cast=bool, default=False)
+# Empty: a per-user directory under the system temp dir.
+JINJA_BYTECODE_CACHE_DIR = config("JINJA_BYTECODE_CACHE_DIR", default="")
+
+
+def create_environment(
+    directory: str = TEMPLATE_DIR, *, cache_dir: str = JINJA_BYTECODE_CACHE_DIR
+) -> Environment:
+    return Environment(
+        loader=FileSystemLoader(directory),
+        bytecode_cache=FileSystemBytecodeCache(cache_dir or None),
+        autoescape=select_autoescape(["html"]),
+        auto_reload=TEMPLATES_AUTO_RELOAD,
+    )
+
+
+def precompile_templates(env: Environment) -> list[str]:
+    """Compile every HTML template into the environment's cache."""
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+environment = create_environment()
+templates = Jinja2Templates(env=environment)
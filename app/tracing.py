@@ -0,0 +1,226 @@
+"""OpenTelemetry tracing for the reply pipeline.
+
+With ``OTEL_ENABLED=True`` every webhook produces one trace:
+``reply`` → ``handle_message`` (branch, model) → Twilio media download, vision
+tiers (one span per model and attempt), the sales LLM, PDF generation,
+``send_message`` and every SQL statement on both engines.
+
+Exporters (``OTEL_EXPORTER``):
+
+* ``otlp``: OTLP/HTTP to ``OTEL_EXPORTER_OTLP_ENDPOINT`` (a local collector by
+  default).
+* ``file``: one JSON span per line in ``OTEL_TRACES_FILE``, for offline
+  inspection.
+* ``console``: pretty-printed spans on stdout.
+
+``OTEL_TRACES_SAMPLER_RATIO`` samples whole traces (children follow their
+root). Requires ``opentelemetry-sdk`` (see ``requirements-optional.txt``);
+without it, or with tracing disabled, the helpers here are no-ops.
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor,
+        ConsoleSpanExporter,
+        SpanExporter,
+        SpanExportResult,
+    )
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:  # pragma: no cover - optional dependency
+    trace = None
+    SpanExporter = object
+
+OTEL_ENABLED = config("OTEL_ENABLED", cast=bool, default=False)
+OTEL_EXPORTER = config("OTEL_EXPORTER", default="otlp")
+OTEL_TRACES_FILE = config("OTEL_TRACES_FILE", default="traces.jsonl")
+OTEL_TRACES_SAMPLER_RATIO = config("OTEL_TRACES_SAMPLER_RATIO", cast=float, default=1.0)
+OTEL_SERVICE_NAME = config("OTEL_SERVICE_NAME", default="whatsapp-bot")
+
+_STATEMENT_LIMIT = 500
+
+logger = logging.getLogger(__name__)
+
+_tracer = None
+_provider = None
+
+
+def tracing_available() -> bool:
+    return trace is not None
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Append finished spans to a file, one JSON document per line."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence["ReadableSpan"]) -> "SpanExportResult":
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+                handle.write(lines)
+        except OSError as exc:
+            logger.warning("Could not write spans to %s: %s", self.path, exc)
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+def _make_exporter(kind: str) -> "SpanExporter":
+    if kind == "file":
+        return JsonLinesSpanExporter(OTEL_TRACES_FILE)
+    if kind == "console":
+        return ConsoleSpanExporter()
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return OTLPSpanExporter()
+    raise ValueError(f"Unknown OTEL_EXPORTER {kind!r}; use otlp, file or console")
+
+
+def configure_tracing(
+    *, exporter: Optional["SpanExporter"] = None, processor=None, ratio: Optional[float] = None
+) -> bool:
+    """Install the tracer provider once; returns whether tracing is active.
+
+    ``processor`` overrides the default batch processor (tests pass a simple
+    one so spans are exported synchronously).
+    """
+    global _tracer, _provider
+    if _tracer is not None:
+        return True
+    if not tracing_available():
+        logger.warning("OTEL_ENABLED is set but opentelemetry-sdk is not installed; tracing off.")
+        return False
+    sampler = ParentBased(TraceIdRatioBased(OTEL_TRACES_SAMPLER_RATIO if ratio is None else ratio))
+    provider = TracerProvider(
+        sampler=sampler, resource=Resource.create({"service.name": OTEL_SERVICE_NAME})
+    )
+    provider.add_span_processor(processor or BatchSpanProcessor(exporter or _make_exporter(OTEL_EXPORTER)))
+    _provider = provider
+    _tracer = provider.get_tracer("app")
+    logger.info("Tracing enabled (exporter=%s, ratio=%s).", OTEL_EXPORTER, sampler.get_description())
+    return True
+
+
+def shutdown_tracing() -> None:
+    global _tracer, _provider
+    if _provider is not None:
+        _provider.shutdown()
+    _tracer = _provider = None
+
+
+def _clean(attributes: dict[str, Any]) -> dict[str, Any]:
+    """``model=..``, ``attempt=..`` → ``app.model``, ``app.attempt``; None values are dropped."""
+    return {f"app.{key}": value for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Child span of the current one; yields None when tracing is off."""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=_clean(attributes)) as current:
+        yield current
+
+
+def set_span_attributes(**attributes: Any) -> None:
+    """Annotate the current span (e.g. with the reply branch once it is known)."""
+    if _tracer is None:
+        return
+    current = trace.get_current_span()
+    if current.is_recording():
+        current.set_attributes(_clean(attributes))
+
+
+def current_trace_ids() -> Optional[tuple[str, str]]:
+    """Hex (trace_id, span_id) of the current recording span, for log correlation."""
+    if _tracer is None:
+        return None
+    context = trace.get_current_span().get_span_context()
+    if not context.is_valid:
+        return None
+    return format(context.trace_id, "032x"), format(context.span_id, "016x")
+
+
+def traced(name: Optional[str] = None, **attributes: Any) -> Callable:
+    """Decorator wrapping sync or async functions in a span named after them."""
+
+    def decorate(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, **attributes):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attributes):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def instrument_engine(engine: Engine, db_name: str) -> None:
+    """Emit one ``db.<name>`` span per statement executed on ``engine``."""
+    if _tracer is None or getattr(engine, "_otel_instrumented", False):
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is None or _tracer is None:
+            return
+        context._otel_span = _tracer.start_span(
+            f"db.{db_name}",
+            attributes={
+                "db.system": engine.dialect.name,
+                "db.name": db_name,
+                "db.statement": statement[:_STATEMENT_LIMIT],
+            },
+        )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        current = getattr(context, "_otel_span", None)
+        if current is not None:
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                current.set_attribute("db.rowcount", cursor.rowcount)
+            current.end()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        current = getattr(exception_context.execution_context, "_otel_span", None)
+        if current is not None:
+            current.record_exception(exception_context.original_exception)
+            current.set_status(Status(StatusCode.ERROR))
+            current.end()
+
+    engine._otel_instrumented = True
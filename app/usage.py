@@ -0,0 +1,222 @@
+"""OpenAI token and cost accounting, and budget-aware routing.
+
+Every chat/responses call reports its ``usage`` here. The tokens are:
+
+* summed per handled message (``track_usage`` scope) and stored on the
+  conversation row, so spend can be broken down by branch and sender;
+* aggregated per process and flushed to the shared state backend every
+  ``USAGE_FLUSH_SECONDS`` as hourly and daily spend counters (one
+  ``incr`` per window, not one per call).
+
+``current_policy()`` compares that spend with ``OPENAI_BUDGET_HOURLY_USD`` /
+``OPENAI_BUDGET_DAILY_USD``. At ``BUDGET_PRESSURE_AT`` of either budget, vision
+stops escalating low-confidence answers to gpt-5 and replies use
+``OPENAI_MAX_TOKENS_UNDER_PRESSURE``. Once a budget is spent, vision is
+nano-only.
+"""
+
+from __future__ import annotations
+
+import functools
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, NamedTuple, Optional
+
+from decouple import config
+
+from app.state import get_state_backend
+from app.utils import logger
+
+# USD per 1M tokens (input, output), OpenAI list prices.
+MODEL_PRICES: dict[str, tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-5-nano": (0.05, 0.40),
+    "gpt-5-mini": (0.25, 2.00),
+    "gpt-5": (1.25, 10.00),
+}
+
+OPENAI_BUDGET_HOURLY_USD = config("OPENAI_BUDGET_HOURLY_USD", cast=float, default=0.0)
+OPENAI_BUDGET_DAILY_USD = config("OPENAI_BUDGET_DAILY_USD", cast=float, default=0.0)
+BUDGET_PRESSURE_AT = config("BUDGET_PRESSURE_AT", cast=float, default=0.8)
+OPENAI_MAX_TOKENS_UNDER_PRESSURE = config("OPENAI_MAX_TOKENS_UNDER_PRESSURE", cast=int, default=96)
+USAGE_FLUSH_SECONDS = config("USAGE_FLUSH_SECONDS", cast=float, default=10.0)
+
+
+class Usage(NamedTuple):
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+
+    @property
+    def cost_micros(self) -> int:
+        """Cost in millionths of a USD (integer, so counters stay exact)."""
+        input_price, output_price = MODEL_PRICES.get(self.model, (0.0, 0.0))
+        return round(self.prompt_tokens * input_price + self.completion_tokens * output_price)
+
+
+class BudgetPolicy(NamedTuple):
+    level: str  # "normal", "pressure" or "exhausted"
+    allow_escalation: bool  # gpt-5 for low-confidence nano answers
+    allow_gpt5: bool  # gpt-5 at all (also as failover)
+    max_tokens: Optional[int]  # cap for sales replies, None = default
+
+
+NORMAL = BudgetPolicy("normal", True, True, None)
+
+
+def _count(value: Any) -> int:
+    return value if isinstance(value, int) else 0
+
+
+def usage_from_response(model: str, response: Any) -> Usage:
+    """Read token counts from a chat.completions or responses result."""
+    usage = getattr(response, "usage", None)
+    prompt = _count(getattr(usage, "prompt_tokens", None)) or _count(getattr(usage, "input_tokens", None))
+    completion = _count(getattr(usage, "completion_tokens", None)) or _count(
+        getattr(usage, "output_tokens", None)
+    )
+    return Usage(model, prompt, completion)
+
+
+_message_usage: ContextVar[Optional[list[Usage]]] = ContextVar("message_usage", default=None)
+
+
+def track_usage(func: Callable) -> Callable:
+    """Collect the usage of every call made while ``func`` runs (one message)."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _message_usage.set([])
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _message_usage.reset(token)
+
+    return wrapper
+
+
+def message_usage() -> Optional[dict[str, int]]:
+    """Token and cost totals of the current message, or None if no call was made."""
+    calls = _message_usage.get()
+    if not calls:
+        return None
+    return {
+        "prompt_tokens": sum(call.prompt_tokens for call in calls),
+        "completion_tokens": sum(call.completion_tokens for call in calls),
+        "cost_micros": sum(call.cost_micros for call in calls),
+    }
+
+
+def _windows(now: float) -> tuple[str, str]:
+    moment = datetime.fromtimestamp(now, timezone.utc)
+    return f"usage:cost:h:{moment:%Y%m%d%H}", f"usage:cost:d:{moment:%Y%m%d}"
+
+
+class UsageLedger:
+    """Process-local totals plus the spend not yet flushed to the state backend."""
+
+    def __init__(self, flush_seconds: float = USAGE_FLUSH_SECONDS) -> None:
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._models: dict[str, dict[str, int]] = {}
+        self._pending: dict[str, int] = {}
+        self._shared: dict[str, int] = {}
+        self._flushed_at = time.monotonic()
+
+    def record(self, usage: Usage, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            totals = self._models.setdefault(
+                usage.model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_micros": 0}
+            )
+            totals["calls"] += 1
+            totals["prompt_tokens"] += usage.prompt_tokens
+            totals["completion_tokens"] += usage.completion_tokens
+            totals["cost_micros"] += usage.cost_micros
+            for key in _windows(now):
+                self._pending[key] = self._pending.get(key, 0) + usage.cost_micros
+        if time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self.flush(now)
+
+    def flush(self, now: Optional[float] = None) -> None:
+        """Push pending spend to the shared counters and refresh their values."""
+        now = time.time() if now is None else now
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        backend = get_state_backend()
+        hour_key, day_key = _windows(now)
+        shared = {}
+        try:
+            for key in {hour_key, day_key} | set(pending):
+                ttl = 2 * 3600 if ":h:" in key else 2 * 86400
+                shared[key] = backend.incr(key, pending.get(key, 0), ttl=ttl)
+        except Exception as exc:
+            logger.warning("Usage flush failed, keeping spend local: %s", exc)
+            with self._lock:
+                for key, micros in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + micros
+            return
+        with self._lock:
+            self._shared = shared
+
+    def spent_micros(self, now: Optional[float] = None) -> tuple[int, int]:
+        """(this hour, today) spend across workers as of the last flush, plus local pending."""
+        hour_key, day_key = _windows(time.time() if now is None else now)
+        with self._lock:
+            return (
+                self._shared.get(hour_key, 0) + self._pending.get(hour_key, 0),
+                self._shared.get(day_key, 0) + self._pending.get(day_key, 0),
+            )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {model: dict(totals) for model, totals in self._models.items()}
+
+
+_ledger = UsageLedger()
+
+
+def get_usage_ledger() -> UsageLedger:
+    return _ledger
+
+
+def record_usage(model: str, response: Any) -> Usage:
+    usage = usage_from_response(model, response)
+    calls = _message_usage.get()
+    if calls is not None:
+        calls.append(usage)
+    _ledger.record(usage)
+    return usage
+
+
+def budget_ratio(now: Optional[float] = None) -> float:
+    """Largest fraction of the hourly/daily budget already spent (0 when unbudgeted)."""
+    hour, day = _ledger.spent_micros(now)
+    ratios = [0.0]
+    if OPENAI_BUDGET_HOURLY_USD > 0:
+        ratios.append(hour / (OPENAI_BUDGET_HOURLY_USD * 1_000_000))
+    if OPENAI_BUDGET_DAILY_USD > 0:
+        ratios.append(day / (OPENAI_BUDGET_DAILY_USD * 1_000_000))
+    return max(ratios)
+
+
+def current_policy(now: Optional[float] = None) -> BudgetPolicy:
+    ratio = budget_ratio(now)
+    if ratio >= 1.0:
+        return BudgetPolicy("exhausted", False, False, OPENAI_MAX_TOKENS_UNDER_PRESSURE)
+    if ratio >= BUDGET_PRESSURE_AT:
+        return BudgetPolicy("pressure", False, True, OPENAI_MAX_TOKENS_UNDER_PRESSURE)
+    return NORMAL
+
+
+def usage_summary() -> dict:
+    hour, day = _ledger.spent_micros()
+    return {
+        "policy": current_policy()._asdict(),
+        "spent_usd": {"hour": hour / 1_000_000, "day": day / 1_000_000},
+        "budget_usd": {"hour": OPENAI_BUDGET_HOURLY_USD or None, "day": OPENAI_BUDGET_DAILY_USD or None},
+        "models": _ledger.snapshot(),
+    }
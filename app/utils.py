@@ -1,8 +1,8 @@
+import hashlib
 import json
 import logging
 import os
 import time
-import uuid
 from functools import lru_cache
 from typing import List, Optional
 
@@ -11,7 +11,10 @@ from decouple import config
 from twilio.base.exceptions import TwilioRestException
 from twilio.rest import Client
 
-logging.basicConfig(level=logging.INFO)
+from app.logging_config import configure_logging
+from app.tracing import set_span_attributes, traced
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -59,6 +62,7 @@ def _wa(number: str) -> str:
     return number if number.startswith("whatsapp:") else f"whatsapp:{number}"
 
 
+@traced()
 def send_message(
     to_number: str,
     body_text: Optional[str] = None,
@@ -75,6 +79,7 @@ def send_message(
     recipient = _wa(to_number)
 
     for attempt in range(1, max_retries + 1):
+        set_span_attributes(attempt=attempt, template=use_template)
         try:
             if use_template:
                 sid = template_sid or _default_content_sid()
@@ -122,21 +127,39 @@ def send_message(
                 raise
 
 
-def download_twilio_media_to_public(
-    media_url: str, out_dir: str = "public"
-) -> tuple[str, str, Optional[str]]:
+def write_content_addressed(data: bytes, out_dir: str, suffix: str, prefix: str = "") -> tuple[str, str]:
+    """Save ``data`` as ``<prefix><sha256[:32]><suffix>``; identical bytes share one file.
+
+    The name changes whenever the bytes do, so ``/public`` can serve these
+    files with immutable cache headers.
+    """
+    filename = f"{prefix}{hashlib.sha256(data).hexdigest()[:32]}{suffix}"
+    return write_file_atomic(data, out_dir, filename), filename
+
+
+def write_file_atomic(data: bytes, out_dir: str, filename: str) -> str:
+    """Write ``out_dir/filename`` unless it exists; readers never see a partial file."""
     os.makedirs(out_dir, exist_ok=True)
-    filename = f"{uuid.uuid4().hex}.jpg"
     file_path = os.path.join(out_dir, filename)
+    if not os.path.exists(file_path):
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as handle:
+            handle.write(data)
+        os.replace(tmp_path, file_path)
+    return file_path
+
 
+@traced()
+def download_twilio_media_to_public(
+    media_url: str, out_dir: str = "public"
+) -> tuple[str, str, Optional[str]]:
     response = requests.get(
         media_url,
         auth=(_twilio_account_sid(), _twilio_auth_token()),
         timeout=20,
     )
     response.raise_for_status()
-    with open(file_path, "wb") as handle:
-        handle.write(response.content)
+    file_path, filename = write_content_addressed(response.content, out_dir, ".jpg")
 
     public_base = _public_base_url()
     public_url = f"{public_base}/public/{filename}" if public_base else None
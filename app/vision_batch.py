@@ -0,0 +1,608 @@
+"""Batch image classification for catalog ingestion.
+
+Classifies a directory of images or a manifest and appends one JSON line per
+image to a results file. A manifest is CSV or JSON lines with ``image`` (path
+relative to the manifest, or URL), an optional ``id``/``sku`` and optionally
+the ``anchor`` the supplier claims. The claimed anchor is checked against the
+classified one.
+
+Two modes:
+
+* ``direct``: the tiered ``llm_classify_image`` (local gate → gpt-5-nano →
+  gpt-5), with at most ``--concurrency`` images in flight.
+* ``batch``: the OpenAI Batch API. Requests are uploaded as JSONL and
+  completed within 24 h at half price, with one model per batch (no
+  escalation). Re-run low-confidence ids with ``--model gpt-5 --retry-below``.
+
+The results file is the checkpoint. A rerun skips every id whose last line is
+a success, so an interrupted run resumes where it stopped. In batch mode the
+submitted batch id is kept next to the results (``*.batch.json``). A restart
+polls that batch rather than submitting it again.
+
+Usage::
+
+    python -m app.vision_batch SOURCE RESULTS.jsonl [--mode direct|batch] [--concurrency 8]
+        [--model gpt-5-nano] [--retry-below 0.5] [--local]
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from decouple import config
+
+from app.catalog_sync import detect_format
+from app.llm_logic import (
+    _parse_strict_json,
+    _to_data_url,
+    get_openai_client,
+    llm_classify_image,
+    vision_request_body,
+)
+from app.state import get_state_backend
+from app.utils import logger
+
+VISION_BATCH_DIR = config("VISION_BATCH_DIR", default="batches")
+VISION_BATCH_CONCURRENCY = config("VISION_BATCH_CONCURRENCY", cast=int, default=8)
+VISION_BATCH_POLL_SECONDS = config("VISION_BATCH_POLL_SECONDS", cast=float, default=60.0)
+VISION_BATCH_HEARTBEAT_SECONDS = config("VISION_BATCH_HEARTBEAT_SECONDS", cast=float, default=30.0)
+
+IMAGE_SUFFIXES = frozenset({".jpg", ".jpeg", ".png", ".webp", ".gif"})
+BATCH_ENDPOINT = "/v1/responses"
+# OpenAI limits: 50k requests and 200 MB per batch input file.
+_BATCH_MAX_REQUESTS = 50_000
+_BATCH_MAX_BYTES = 190 * 1024 * 1024
+_TERMINAL = frozenset({"completed", "failed", "expired", "cancelled"})
+# Admin jobs are claimed and reported in the shared state backend. A claim
+# outlives a few missed heartbeats, so a job whose worker died can be restarted.
+_CLAIM_TTL_HEARTBEATS = 4
+_STATUS_TTL = 7 * 24 * 3600
+
+
+class BatchItem(NamedTuple):
+    custom_id: str
+    image: str  # local path or URL
+    expected_anchor: Optional[str] = None
+
+
+def _is_remote(image: str) -> bool:
+    return "://" in image or image.startswith("data:")
+
+
+def iter_directory(root: str) -> Iterator[BatchItem]:
+    base = Path(root)
+    for path in sorted(base.rglob("*")):
+        if path.is_file() and path.suffix.lower() in IMAGE_SUFFIXES:
+            yield BatchItem(path.relative_to(base).as_posix(), str(path))
+
+
+def iter_manifest(path: str) -> Iterator[BatchItem]:
+    manifest = Path(path)
+    with manifest.open(encoding="utf-8", newline="") as handle:
+        if detect_format(path) == "csv":
+            records: Iterable[dict] = csv.DictReader(handle)
+        else:
+            records = (json.loads(line) for line in handle if line.strip())
+        for number, record in enumerate(records, start=1):
+            image = str(record.get("image") or record.get("image_url") or "").strip()
+            if not image:
+                logger.warning("Manifest record %s has no image; skipped", number)
+                continue
+            if not _is_remote(image):
+                image = str(manifest.parent / image)
+            custom_id = str(record.get("id") or record.get("sku") or image).strip()
+            anchor = str(record.get("anchor") or "").strip().lower() or None
+            yield BatchItem(custom_id, image, anchor)
+
+
+def iter_source(source: str) -> Iterator[BatchItem]:
+    return iter_directory(source) if Path(source).is_dir() else iter_manifest(source)
+
+
+def _cut_torn_line(path: Path) -> None:
+    """Drop a partial last line left by a crash mid-write."""
+    data = path.read_bytes()
+    if data and not data.endswith(b"\n"):
+        with path.open("rb+") as handle:
+            handle.truncate(data.rfind(b"\n") + 1)
+
+
+def completed_ids(path: Path, *, retry_below: float = 0.0) -> set[str]:
+    """Ids whose last result line is a success (with at least ``retry_below`` confidence)."""
+    done: set[str] = set()
+    if not path.exists():
+        return done
+    _cut_torn_line(path)
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            record = json.loads(line)
+            if "error" in record or record.get("confidence", 0.0) < retry_below:
+                done.discard(record["custom_id"])
+            else:
+                done.add(record["custom_id"])
+    return done
+
+
+class ResultWriter:
+    """Appends result lines (flushed one by one) and counts progress."""
+
+    def __init__(self, path: str | Path, *, retry_below: float = 0.0) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.done = completed_ids(self.path, retry_below=retry_below)
+        self.skipped = self.ok = self.failed = 0
+        self._lock = threading.Lock()
+        self._handle = self.path.open("a", encoding="utf-8")
+
+    def pending(self, items: Iterable[BatchItem]) -> Iterator[BatchItem]:
+        for item in items:
+            if item.custom_id in self.done:
+                self.skipped += 1
+            else:
+                yield item
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._handle.write(line)
+            self._handle.flush()
+            if "error" in record:
+                self.failed += 1
+            else:
+                self.ok += 1
+
+    def counts(self) -> dict[str, int]:
+        return {"ok": self.ok, "failed": self.failed, "skipped": self.skipped}
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+def _record(item: BatchItem, result: Optional[dict] = None, *, error: Any = None) -> dict:
+    record: dict[str, Any] = {"custom_id": item.custom_id, "image": item.image}
+    if error is not None:
+        record["error"] = error
+        return record
+    record.update(result or {})
+    if item.expected_anchor is not None:
+        record["expected_anchor"] = item.expected_anchor
+        record["anchor_match"] = record.get("anchor") == item.expected_anchor
+    return record
+
+
+def classify_direct(
+    items: Iterable[BatchItem],
+    writer: ResultWriter,
+    *,
+    concurrency: int = VISION_BATCH_CONCURRENCY,
+    detail: str = "low",
+    classify: Optional[Callable[..., dict]] = None,
+) -> None:
+    """Tiered classification per image, ``concurrency`` at a time."""
+    classify = classify or llm_classify_image
+    slots = threading.BoundedSemaphore(concurrency * 2)  # bounds queued items too
+
+    def one(item: BatchItem) -> None:
+        try:
+            result = classify(item.image, force_detail=detail)
+            if result.get("model") is None:
+                writer.write(_record(item, error="no vision tier answered"))
+            else:
+                writer.write(_record(item, result))
+        except Exception as exc:
+            logger.warning("Vision batch item %s failed: %s", item.custom_id, exc)
+            writer.write(_record(item, error=str(exc)))
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="vision-batch") as pool:
+        for item in items:
+            slots.acquire()
+            pool.submit(one, item)
+
+
+def _request_line(item: BatchItem, model: str, detail: str) -> bytes:
+    image_ref = item.image if _is_remote(item.image) else _to_data_url(item.image)
+    line = {
+        "custom_id": item.custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": vision_request_body(model, image_ref, detail=detail),
+    }
+    return (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _chunks(
+    items: Iterable[BatchItem], writer: ResultWriter, model: str, detail: str
+) -> Iterator[tuple[Any, dict[str, BatchItem]]]:
+    """Spool request lines to temp files, one per Batch API input file."""
+    spool, chunk, size = None, {}, 0
+    for item in items:
+        if item.custom_id in chunk:
+            logger.warning("Duplicate id %r in vision batch source; skipped", item.custom_id)
+            continue
+        try:
+            line = _request_line(item, model, detail)
+        except OSError as exc:
+            writer.write(_record(item, error=str(exc)))
+            continue
+        if chunk and (len(chunk) >= _BATCH_MAX_REQUESTS or size + len(line) > _BATCH_MAX_BYTES):
+            spool.seek(0)
+            yield spool, chunk
+            spool.close()
+            spool, chunk, size = None, {}, 0
+        if spool is None:
+            spool = tempfile.TemporaryFile()
+        spool.write(line)
+        chunk[item.custom_id] = item
+        size += len(line)
+    if chunk:
+        spool.seek(0)
+        yield spool, chunk
+        spool.close()
+
+
+def _output_text(body: dict) -> str:
+    return "".join(
+        part.get("text", "")
+        for entry in body.get("output") or []
+        if entry.get("type") == "message"
+        for part in entry.get("content") or []
+        if part.get("type") == "output_text"
+    )
+
+
+def _batch_record(item: BatchItem, line: dict, model: str) -> dict:
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        error = line.get("error") or body.get("error") or f"HTTP {response.get('status_code')}"
+        return _record(item, error=error)
+    try:
+        result = _parse_strict_json(_output_text(body))
+    except ValueError as exc:
+        return _record(item, error=f"unparseable output: {exc}")
+    result["model"] = model
+    return _record(item, result)
+
+
+def _collect(
+    client,
+    batch_id: str,
+    items: dict[str, BatchItem],
+    writer: ResultWriter,
+    model: str,
+    *,
+    poll_seconds: float,
+    sleep: Callable[[float], None],
+) -> None:
+    """Wait for a batch and write the result of every item it answered."""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in _TERMINAL:
+            break
+        counts = getattr(batch, "request_counts", None)
+        logger.info(
+            "Vision batch %s %s (%s/%s done)",
+            batch_id,
+            batch.status,
+            getattr(counts, "completed", "?"),
+            getattr(counts, "total", "?"),
+        )
+        sleep(poll_seconds)
+
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for raw in client.files.content(file_id).text.splitlines():
+            line = json.loads(raw)
+            item = items.pop(line.get("custom_id"), None)
+            if item is not None:
+                writer.write(_batch_record(item, line, model))
+    if batch.status != "completed":
+        # Expired batches keep their finished lines; the rest stay pending for a rerun.
+        raise RuntimeError(f"Vision batch {batch_id} {batch.status}: {getattr(batch, 'errors', None)}")
+
+
+def classify_with_batch_api(
+    items: Iterable[BatchItem],
+    writer: ResultWriter,
+    *,
+    client=None,
+    model: str = "gpt-5-nano",
+    detail: str = "low",
+    poll_seconds: float = VISION_BATCH_POLL_SECONDS,
+    sleep: Callable[[float], None] = time.sleep,
+) -> None:
+    """Submit pending items as Batch API jobs (one at a time) and write their results."""
+    client = client or get_openai_client()
+    state_path = writer.path.with_name(writer.path.stem + ".batch.json")
+    if state_path.exists():
+        state = json.loads(state_path.read_text())
+        pending = {item.custom_id: item for item in items}
+        logger.info("Resuming vision batch %s", state["batch_id"])
+        try:
+            _collect(
+                client,
+                state["batch_id"],
+                pending,
+                writer,
+                state["model"],
+                poll_seconds=poll_seconds,
+                sleep=sleep,
+            )
+        finally:
+            state_path.unlink()
+        items = pending.values()
+
+    for spool, chunk in _chunks(items, writer, model, detail):
+        uploaded = client.files.create(file=("vision_batch.jsonl", spool), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+            metadata={"source": "app.vision_batch"},
+        )
+        state_path.write_text(json.dumps({"batch_id": batch.id, "model": model}))
+        logger.info("Submitted vision batch %s with %s images", batch.id, len(chunk))
+        try:
+            _collect(client, batch.id, chunk, writer, model, poll_seconds=poll_seconds, sleep=sleep)
+        finally:
+            state_path.unlink()
+
+
+def _responses_handler(body: dict) -> dict:
+    return get_openai_client().responses.create(**body).model_dump()
+
+
+class LocalBatchClient:
+    """In-process stand-in for the OpenAI Files and Batches APIs.
+
+    Creating a batch runs every request line through ``handler(body)`` right
+    away and completes it. Tests use a fake handler; the default one sends
+    each request to the Responses API, for dry runs of the batch path.
+    """
+
+    def __init__(self, handler: Optional[Callable[[dict], dict]] = None, *, concurrency: int = 4) -> None:
+        self.handler = handler or _responses_handler
+        self.concurrency = concurrency
+        self._files: dict[str, str] = {}
+        self._batches: dict[str, SimpleNamespace] = {}
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._batches.__getitem__)
+
+    def _add_file(self, text: str) -> str:
+        file_id = f"file-local-{len(self._files) + 1}"
+        self._files[file_id] = text
+        return file_id
+
+    def _create_file(self, *, file, purpose: str) -> SimpleNamespace:
+        handle = file[1] if isinstance(file, tuple) else file
+        return SimpleNamespace(id=self._add_file(handle.read().decode("utf-8")), purpose=purpose)
+
+    def _file_content(self, file_id: str) -> SimpleNamespace:
+        return SimpleNamespace(text=self._files[file_id])
+
+    def _run(self, request: dict) -> tuple[bool, dict]:
+        try:
+            body = self.handler(request["body"])
+        except Exception as exc:
+            error = {"code": type(exc).__name__, "message": str(exc)}
+            return False, {"custom_id": request["custom_id"], "response": None, "error": error}
+        response = {"status_code": 200, "request_id": "", "body": body}
+        return True, {"custom_id": request["custom_id"], "response": response, "error": None}
+
+    def _create_batch(self, *, input_file_id: str, endpoint: str, completion_window: str, metadata=None):
+        requests = [json.loads(line) for line in self._files[input_file_id].splitlines() if line]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = list(pool.map(self._run, requests))
+        output = [json.dumps(line) for ok, line in results if ok]
+        errors = [json.dumps(line) for ok, line in results if not ok]
+        batch = SimpleNamespace(
+            id=f"batch-local-{len(self._batches) + 1}",
+            status="completed",
+            endpoint=endpoint,
+            output_file_id=self._add_file("\n".join(output)) if output else None,
+            error_file_id=self._add_file("\n".join(errors)) if errors else None,
+            request_counts=SimpleNamespace(total=len(results), completed=len(output), failed=len(errors)),
+            errors=None,
+        )
+        self._batches[batch.id] = batch
+        return batch
+
+
+def run_batch(
+    source: str,
+    writer: ResultWriter,
+    *,
+    mode: str = "direct",
+    concurrency: int = VISION_BATCH_CONCURRENCY,
+    model: str = "gpt-5-nano",
+    detail: str = "low",
+    client=None,
+) -> None:
+    items = writer.pending(iter_source(source))
+    if mode == "direct":
+        classify_direct(items, writer, concurrency=concurrency, detail=detail)
+    elif mode == "batch":
+        classify_with_batch_api(items, writer, client=client, model=model, detail=detail)
+    else:
+        raise ValueError(f"Unknown vision batch mode {mode!r}; use direct or batch")
+
+
+class BatchJob:
+    """A ``run_batch`` started from the admin API, running on its own thread.
+
+    Its status is published to the state backend on every heartbeat, so any
+    worker can report it.
+    """
+
+    def __init__(self, name: str, source: str, mode: str) -> None:
+        self.name = name
+        self.source = source
+        self.mode = mode
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.writer: Optional[ResultWriter] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "source": self.source,
+            "mode": self.mode,
+            "status": self.status,
+            "error": self.error,
+            "started": self.started,
+            "finished": self.finished,
+            **(self.writer.counts() if self.writer else {"ok": 0, "failed": 0, "skipped": 0}),
+        }
+
+    def publish(self) -> None:
+        """Store the status for other workers; renew the claim while running, else release it."""
+        backend = get_state_backend()
+        backend.set(_status_key(self.name), json.dumps(self.as_dict()), ttl=_STATUS_TTL)
+        if self.status == "running":
+            claim_ttl = VISION_BATCH_HEARTBEAT_SECONDS * _CLAIM_TTL_HEARTBEATS
+            backend.set(_claim_key(self.name), "1", ttl=claim_ttl)
+        else:
+            backend.delete(_claim_key(self.name))
+
+
+_jobs: dict[str, BatchJob] = {}  # jobs running in this worker
+_jobs_lock = threading.Lock()
+
+
+def _claim_key(name: str) -> str:
+    return f"vision_batch:{name}"
+
+
+def _status_key(name: str) -> str:
+    return f"vision_batch:{name}:status"
+
+
+def results_path(name: str) -> Path:
+    return Path(VISION_BATCH_DIR) / f"{name}.results.jsonl"
+
+
+def resolve_source(source: str) -> Path:
+    """``source`` inside ``VISION_BATCH_DIR``; raises ValueError otherwise."""
+    base = Path(VISION_BATCH_DIR).resolve()
+    path = (base / source).resolve()
+    if base not in path.parents or not path.exists():
+        raise ValueError(f"{source!r} is not a directory or manifest under {VISION_BATCH_DIR}")
+    return path
+
+
+def start_batch_job(
+    name: str,
+    source: str,
+    *,
+    mode: str = "direct",
+    concurrency: int = VISION_BATCH_CONCURRENCY,
+    model: str = "gpt-5-nano",
+    retry_below: float = 0.0,
+) -> Optional[BatchJob]:
+    """Start (or resume) job ``name`` in the background; None if it runs in any worker."""
+    path = resolve_source(source)
+    claim_ttl = VISION_BATCH_HEARTBEAT_SECONDS * _CLAIM_TTL_HEARTBEATS
+    if not get_state_backend().add_if_absent(_claim_key(name), ttl=claim_ttl):
+        return None
+    job = BatchJob(name, source, mode)
+    with _jobs_lock:
+        _jobs[name] = job
+    job.publish()
+    stopped = threading.Event()
+
+    def heartbeat() -> None:
+        while not stopped.wait(VISION_BATCH_HEARTBEAT_SECONDS):
+            job.publish()
+
+    def work() -> None:
+        threading.Thread(target=heartbeat, name=f"vision-batch-{name}-heartbeat", daemon=True).start()
+        try:
+            job.writer = ResultWriter(results_path(name), retry_below=retry_below)
+            run_batch(str(path), job.writer, mode=mode, concurrency=concurrency, model=model)
+            job.status = "finished"
+        except Exception as exc:
+            logger.exception("Vision batch job %s failed", name)
+            job.status, job.error = "failed", str(exc)
+        finally:
+            if job.writer is not None:
+                job.writer.close()
+            job.finished = time.time()
+            stopped.set()
+            job.publish()
+
+    job.thread = threading.Thread(target=work, name=f"vision-batch-{name}", daemon=True)
+    job.thread.start()
+    return job
+
+
+def get_batch_job(name: str) -> Optional[BatchJob]:
+    """Job ``name`` if it was started by this worker."""
+    with _jobs_lock:
+        return _jobs.get(name)
+
+
+def batch_job_status(name: str) -> Optional[dict]:
+    """Status of job ``name`` from whichever worker runs it; live if it is this one."""
+    job = get_batch_job(name)
+    if job is not None:
+        return job.as_dict()
+    stored = get_state_backend().get(_status_key(name))
+    return None if stored is None else json.loads(stored)
+
+
+def _main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.vision_batch", description=__doc__.split("\n")[0])
+    parser.add_argument("source", help="Image directory, or CSV / JSON-lines manifest")
+    parser.add_argument("results", help="JSON-lines results file (appended; also the checkpoint)")
+    parser.add_argument("--mode", choices=("direct", "batch"), default="direct")
+    parser.add_argument("--concurrency", type=int, default=VISION_BATCH_CONCURRENCY)
+    parser.add_argument("--model", default="gpt-5-nano", help="Batch mode only")
+    parser.add_argument("--detail", choices=("low", "high", "auto"), default="low")
+    parser.add_argument(
+        "--retry-below", type=float, default=0.0, help="Also redo ids classified below this confidence"
+    )
+    parser.add_argument(
+        "--local", action="store_true", help="Batch mode: run the batch in-process instead of uploading it"
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    writer = ResultWriter(args.results, retry_below=args.retry_below)
+    try:
+        run_batch(
+            args.source,
+            writer,
+            mode=args.mode,
+            concurrency=args.concurrency,
+            model=args.model,
+            detail=args.detail,
+            client=LocalBatchClient(concurrency=args.concurrency) if args.local else None,
+        )
+    finally:
+        writer.close()
+    counts = writer.counts()
+    print(
+        f"ok={counts['ok']} failed={counts['failed']} skipped={counts['skipped']} "
+        f"in {time.perf_counter() - started:.1f}s → {args.results}"
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main(sys.argv[1:]))
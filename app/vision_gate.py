@@ -0,0 +1,255 @@
+"""CPU-only pre-filter that screens images before any remote vision call.
+
+A 64×64 thumbnail is reduced to a handful of image statistics. Obvious
+non-products (blank frames, screenshots) are rejected locally, and everything
+else is sent to gpt-5-nano as before. If a model trained from past
+classifications is configured (``VISION_GATE_MODEL_PATH``), its logistic
+score can reject images as well. Skin-toned frames are only rejected as
+selfies when that model also scores them low: wood, copper, cork and
+cardboard share the same hues.
+
+Requires Pillow (see ``requirements-optional.txt``); without it the gate
+passes every image through.
+
+Train a model from logged samples::
+
+    python -m app.vision_gate train samples.jsonl vision_gate.json
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+
+from decouple import config
+
+try:
+    from PIL import Image, ImageFilter, ImageStat
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+_THUMB_SIZE = (64, 64)
+
+FEATURE_NAMES = (
+    "luma_std",
+    "luma_mean",
+    "colorfulness",
+    "edge_density",
+    "color_diversity",
+    "dominant_ratio",
+    "skin_ratio",
+    "aspect",
+)
+
+# Conservative thresholds: a false reject loses a sale, a false pass costs one nano call.
+_BLANK_LUMA_STD = 6.0
+_SCREENSHOT_DOMINANT_RATIO = 0.55
+_SCREENSHOT_COLOR_DIVERSITY = 0.08
+_SELFIE_SKIN_RATIO = 0.45
+_SELFIE_REJECT_BELOW = 0.5  # model score under which a skin-toned frame is a selfie
+
+
+class GateDecision(NamedTuple):
+    verdict: str  # "reject" or "ambiguous"
+    reason: str
+    product_score: float
+
+
+def gate_available() -> bool:
+    return Image is not None
+
+
+@lru_cache
+def vision_gate_enabled() -> bool:
+    return gate_available() and config("VISION_GATE_ENABLED", cast=bool, default=False)
+
+
+@lru_cache
+def _reject_below() -> float:
+    return config("VISION_GATE_REJECT_BELOW", cast=float, default=0.1)
+
+
+def _is_skin(r: int, g: int, b: int) -> bool:
+    return (
+        r > 95 and g > 40 and b > 20 and r > g and r > b and r - min(g, b) > 15 and abs(r - g) > 15
+    )
+
+
+def image_features(path: str) -> Optional[dict[str, float]]:
+    """Feature vector for ``path``, or None if Pillow is missing or the file is unreadable."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            thumb = img.convert("RGB")
+            thumb.thumbnail(_THUMB_SIZE)
+    except Exception:
+        return None
+
+    raw = thumb.tobytes()
+    pixels = zip(raw[0::3], raw[1::3], raw[2::3])
+    count = (len(raw) // 3) or 1
+    luma = thumb.convert("L")
+    luma_stat = ImageStat.Stat(luma)
+
+    rg_sum = yb_sum = rg_sq = yb_sq = 0.0
+    skin = 0
+    buckets: dict[tuple[int, int, int], int] = {}
+    for r, g, b in pixels:
+        rg = r - g
+        yb = 0.5 * (r + g) - b
+        rg_sum += rg
+        yb_sum += yb
+        rg_sq += rg * rg
+        yb_sq += yb * yb
+        if _is_skin(r, g, b):
+            skin += 1
+        key = (r >> 3, g >> 3, b >> 3)
+        buckets[key] = buckets.get(key, 0) + 1
+
+    rg_mean, yb_mean = rg_sum / count, yb_sum / count
+    rg_std = math.sqrt(max(rg_sq / count - rg_mean**2, 0.0))
+    yb_std = math.sqrt(max(yb_sq / count - yb_mean**2, 0.0))
+    colorfulness = math.hypot(rg_std, yb_std) + 0.3 * math.hypot(rg_mean, yb_mean)
+
+    edges = luma.filter(ImageFilter.FIND_EDGES).tobytes()
+    edge_density = sum(1 for value in edges if value > 32) / count
+
+    return {
+        "luma_std": luma_stat.stddev[0],
+        "luma_mean": luma_stat.mean[0],
+        "colorfulness": colorfulness,
+        "edge_density": edge_density,
+        "color_diversity": len(buckets) / count,
+        "dominant_ratio": max(buckets.values()) / count,
+        "skin_ratio": skin / count,
+        "aspect": width / height if height else 1.0,
+    }
+
+
+class GateModel(NamedTuple):
+    """Standardized logistic regression over ``FEATURE_NAMES``."""
+
+    weights: tuple[float, ...]
+    bias: float
+    means: tuple[float, ...]
+    scales: tuple[float, ...]
+
+    def score(self, features: dict[str, float]) -> float:
+        z = self.bias
+        for name, weight, mean, scale in zip(FEATURE_NAMES, self.weights, self.means, self.scales):
+            z += weight * (features.get(name, 0.0) - mean) / scale
+        return 1.0 / (1.0 + math.exp(-max(min(z, 30.0), -30.0)))
+
+    def to_json(self) -> dict:
+        return {"features": list(FEATURE_NAMES), **self._asdict()}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "GateModel":
+        if tuple(data.get("features", ())) != FEATURE_NAMES:
+            raise ValueError("Gate model was trained on a different feature set")
+        return cls(
+            tuple(data["weights"]), float(data["bias"]), tuple(data["means"]), tuple(data["scales"])
+        )
+
+
+@lru_cache
+def load_gate_model() -> Optional[GateModel]:
+    path = config("VISION_GATE_MODEL_PATH", default="")
+    if not path or not Path(path).is_file():
+        return None
+    return GateModel.from_json(json.loads(Path(path).read_text()))
+
+
+def prefilter(features: dict[str, float], model: Optional[GateModel] = None) -> GateDecision:
+    if features["luma_std"] < _BLANK_LUMA_STD:
+        return GateDecision("reject", "blank", 0.0)
+    if (
+        features["dominant_ratio"] > _SCREENSHOT_DOMINANT_RATIO
+        and features["color_diversity"] < _SCREENSHOT_COLOR_DIVERSITY
+    ):
+        return GateDecision("reject", "screenshot", 0.0)
+    skin_toned = features["skin_ratio"] > _SELFIE_SKIN_RATIO
+    if model is not None:
+        score = model.score(features)
+        if score < _reject_below():
+            return GateDecision("reject", "model", score)
+        if skin_toned and score < _SELFIE_REJECT_BELOW:
+            return GateDecision("reject", "selfie", score)
+        return GateDecision("ambiguous", "model", score)
+    return GateDecision("ambiguous", "skin" if skin_toned else "heuristics", 0.5)
+
+
+def is_product_sample(sample: dict) -> bool:
+    return bool(sample.get("anchor")) and float(sample.get("confidence", 0.0)) >= 0.5
+
+
+def train_gate_model(
+    samples: Iterable[dict], *, epochs: int = 400, learning_rate: float = 0.5, l2: float = 1e-3
+) -> GateModel:
+    """Fit the gate from logged ``{"features", "anchor", "confidence"}`` samples."""
+    rows: list[list[float]] = []
+    labels: list[float] = []
+    for sample in samples:
+        features = sample.get("features")
+        if not features:
+            continue
+        rows.append([float(features.get(name, 0.0)) for name in FEATURE_NAMES])
+        labels.append(1.0 if is_product_sample(sample) else 0.0)
+    if not rows:
+        raise ValueError("No samples with features to train on")
+
+    n, dims = len(rows), len(FEATURE_NAMES)
+    means = [sum(row[i] for row in rows) / n for i in range(dims)]
+    scales = [
+        math.sqrt(sum((row[i] - means[i]) ** 2 for row in rows) / n) or 1.0 for i in range(dims)
+    ]
+    x = [[(row[i] - means[i]) / scales[i] for i in range(dims)] for row in rows]
+
+    weights = [0.0] * dims
+    bias = 0.0
+    for _ in range(epochs):
+        grad_w = [0.0] * dims
+        grad_b = 0.0
+        for xi, yi in zip(x, labels):
+            z = bias + sum(w * v for w, v in zip(weights, xi))
+            error = 1.0 / (1.0 + math.exp(-max(min(z, 30.0), -30.0))) - yi
+            grad_b += error
+            for i in range(dims):
+                grad_w[i] += error * xi[i]
+        bias -= learning_rate * grad_b / n
+        weights = [w - learning_rate * (g / n + l2 * w) for w, g in zip(weights, grad_w)]
+    return GateModel(tuple(weights), bias, tuple(means), tuple(scales))
+
+
+def append_sample(path: str, features: dict[str, float], result: dict) -> None:
+    record = {
+        "features": features,
+        "anchor": result.get("anchor"),
+        "confidence": result.get("confidence", 0.0),
+        "model": result.get("model"),
+    }
+    with open(path, "a", encoding="utf-8") as handle:
+        handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _main(argv: list[str]) -> int:
+    if len(argv) != 3 or argv[0] != "train":
+        print("usage: python -m app.vision_gate train SAMPLES.jsonl MODEL.json", file=sys.stderr)
+        return 2
+    with open(argv[1], encoding="utf-8") as handle:
+        samples = [json.loads(line) for line in handle if line.strip()]
+    model = train_gate_model(samples)
+    Path(argv[2]).write_text(json.dumps(model.to_json(), indent=2))
+    positives = sum(1 for sample in samples if is_product_sample(sample))
+    print(f"Trained on {len(samples)} samples ({positives} product) -> {argv[2]}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main(sys.argv[1:]))
@@ -0,0 +1,33 @@
+"""products table
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.migrations import create_table_if_missing
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_table_if_missing(
+        "products",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("anchor", sa.String, nullable=False),
+        sa.Column("name", sa.String, nullable=False),
+        sa.Column("price_cents", sa.Integer, nullable=False),
+        sa.Column("stock", sa.Integer, nullable=False),
+        sa.Column("image_url", sa.String, nullable=True),
+    )
+    op.create_index("ix_products_anchor", "products", ["anchor"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_table("products")
@@ -0,0 +1,36 @@
+"""SKU key and catalog version for feed imports
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+The unique SKU index is built concurrently, so a live catalog keeps serving
+reads and writes while it builds. It carries the name ``create_all`` gave the
+unique constraint, so databases that already have it skip the step.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.migrations import add_column_if_missing, create_index_online, create_table_if_missing
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    add_column_if_missing("products", sa.Column("sku", sa.String(64), nullable=True))
+    create_table_if_missing(
+        "catalog_meta",
+        sa.Column("key", sa.String(64), primary_key=True),
+        sa.Column("value", sa.BigInteger, nullable=False),
+    )
+    create_index_online("products_sku_key", "products", ["sku"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("products_sku_key", table_name="products")
+    op.drop_table("catalog_meta")
+    op.drop_column("products", "sku")
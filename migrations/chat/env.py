@@ -0,0 +1,3 @@
+from app.migrations import run_environment
+
+run_environment("chat")
@@ -0,0 +1,57 @@
+"""conversations table with routing metadata
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+Baseline. A database created by ``create_all`` before conversations had
+timestamps and routing metadata gets the missing columns instead.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.database import CONVERSATION_PARTITIONING
+from app.migrations import add_column_if_missing, create_index_online, create_table_if_missing
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _metadata_columns() -> list[sa.Column]:
+    return [
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("branch", sa.String(32), nullable=True),
+        sa.Column("model", sa.String(64), nullable=True),
+        sa.Column("prompt_tokens", sa.Integer, nullable=True),
+        sa.Column("completion_tokens", sa.Integer, nullable=True),
+        sa.Column("latency_ms", sa.Integer, nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    # Partitioned tables need the partition key in the primary key.
+    primary_key = ("id", "created_at") if CONVERSATION_PARTITIONING else ("id",)
+    create_table_if_missing(
+        "conversations",
+        sa.Column("id", sa.Integer, nullable=False, autoincrement=True),
+        sa.Column("sender", sa.String),
+        sa.Column("message", sa.String),
+        sa.Column("response", sa.String),
+        *_metadata_columns(),
+        sa.PrimaryKeyConstraint(*primary_key),
+        postgresql_partition_by="RANGE (created_at)" if CONVERSATION_PARTITIONING else None,
+    )
+    for column in _metadata_columns():
+        add_column_if_missing("conversations", column)
+
+    # A create_all-era table may already be large: build the indexes without blocking webhook inserts.
+    create_index_online("ix_conversations_id", "conversations", ["id"])
+    create_index_online("ix_conversations_created_at", "conversations", ["created_at"])
+    create_index_online("ix_conversations_sender_created_at", "conversations", ["sender", "created_at"])
+    create_index_online("ix_conversations_branch_created_at", "conversations", ["branch", "created_at"])
+
+def downgrade() -> None:
+    op.drop_table("conversations")
@@ -0,0 +1,40 @@
+"""hourly and per-sender conversation rollups
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.migrations import create_table_if_missing
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_table_if_missing(
+        "conversation_hourly_stats",
+        sa.Column("bucket", sa.DateTime(timezone=True), primary_key=True),
+        sa.Column("branch", sa.String(32), primary_key=True),
+        sa.Column("count", sa.BigInteger, nullable=False),
+        sa.Column("latency_ms_total", sa.BigInteger, nullable=False),
+    )
+    create_table_if_missing(
+        "sender_stats",
+        sa.Column("sender", sa.String, primary_key=True),
+        sa.Column("count", sa.BigInteger, nullable=False),
+        sa.Column("first_seen", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_seen", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_sender_stats_count", "sender_stats", ["count"], if_not_exists=True)
+    op.create_index("ix_sender_stats_last_seen", "sender_stats", ["last_seen"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_table("sender_stats")
+    op.drop_table("conversation_hourly_stats")
@@ -0,0 +1,36 @@
+"""OpenAI token and cost columns
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.migrations import add_column_if_missing
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+_ROLLUP_COLUMNS = ("prompt_tokens", "completion_tokens", "cost_micros")
+
+
+def upgrade() -> None:
+    add_column_if_missing("conversations", sa.Column("cost_micros", sa.BigInteger, nullable=True))
+    for name in _ROLLUP_COLUMNS:
+        add_column_if_missing(
+            "conversation_hourly_stats", sa.Column(name, sa.BigInteger, nullable=False, server_default="0")
+        )
+    add_column_if_missing(
+        "sender_stats", sa.Column("cost_micros", sa.BigInteger, nullable=False, server_default="0")
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("sender_stats", "cost_micros")
+    for name in _ROLLUP_COLUMNS:
+        op.drop_column("conversation_hourly_stats", name)
+    op.drop_column("conversations", "cost_micros")
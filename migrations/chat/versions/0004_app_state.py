@@ -0,0 +1,31 @@
+"""shared key/value state table for STATE_BACKEND=postgres
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+Older releases created it at runtime on first use, so it may already exist.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.migrations import create_table_if_missing
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_table_if_missing(
+        "app_state",
+        sa.Column("key", sa.String(255), primary_key=True),
+        sa.Column("value", sa.Text, nullable=False),
+        sa.Column("expires_at", sa.Double, nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("app_state")
@@ -0,0 +1,106 @@
+"""Benchmark: per-request overhead of the body-size middleware.
+
+Compares the previous ``BaseHTTPMiddleware`` implementation with the pure ASGI
+``LimitBodySizeMiddleware`` by driving a minimal app directly over ASGI.
+
+Usage:
+    python scripts/bench_body_limit.py [requests]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from starlette.applications import Starlette  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from starlette.responses import JSONResponse, PlainTextResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+from app.security import LimitBodySizeMiddleware  # noqa: E402
+
+BODY = b"Body=hola&From=whatsapp%3A%2B15550001111&To=whatsapp%3A%2B15550002222"
+
+
+class LegacyLimitBodySizeMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, max_bytes: int) -> None:
+        super().__init__(app)
+        self.max_bytes = max_bytes
+
+    async def dispatch(self, request: Request, call_next):
+        if request.method in {"POST", "PUT", "PATCH"}:
+            content_length = request.headers.get("content-length")
+            if content_length is not None:
+                try:
+                    if int(content_length) > self.max_bytes:
+                        return JSONResponse(status_code=413, content={"detail": "Request body too large"})
+                except ValueError:
+                    pass
+        return await call_next(request)
+
+
+async def endpoint(request: Request):
+    await request.body()
+    return PlainTextResponse("ok")
+
+
+def build(middleware=None, **kwargs):
+    inner = Starlette(routes=[Route("/message", endpoint, methods=["POST"])])
+    return inner if middleware is None else middleware(inner, **kwargs)
+
+
+async def drive(app, count: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/message",
+        "raw_path": b"/message",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/x-www-form-urlencoded"),
+            (b"content-length", str(len(BODY)).encode()),
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(count):
+        messages = iter([{"type": "http.request", "body": BODY, "more_body": False}])
+
+        async def receive():
+            return next(messages, {"type": "http.disconnect"})
+
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    variants = {
+        "no middleware": build(),
+        "BaseHTTPMiddleware (old)": build(LegacyLimitBodySizeMiddleware, max_bytes=1_048_576),
+        "pure ASGI (new)": build(LimitBodySizeMiddleware, max_bytes=1_048_576),
+    }
+    baseline = None
+    for name, app in variants.items():
+        elapsed = min(asyncio.run(drive(app, count)) for _ in range(3))
+        per_request = elapsed / count * 1e6
+        baseline = per_request if baseline is None else baseline
+        print(f"{name:<26} {per_request:8.2f} µs/request  (+{per_request - baseline:6.2f} µs)")
+
+
+if __name__ == "__main__":
+    main()
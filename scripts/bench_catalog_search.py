@@ -0,0 +1,89 @@
+"""Benchmark: catalog search index on a synthetic 100k-product catalog.
+
+Usage:
+    python scripts/bench_catalog_search.py [products]
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+for key in ("DB_USER", "DB_PASSWORD", "DB_CATALOG_USER", "DB_CATALOG_PASSWORD"):
+    os.environ.setdefault(key, "bench")
+
+from app.catalog import HARDWARE_ANCHORS  # noqa: E402
+from app.search import CatalogEntry, CatalogSearchIndex  # noqa: E402
+
+BRANDS = ["DeWalt", "Truper", "Stanley", "Bosch", "Makita", "Pretul", "Urrea", "Sika", "Comex", "3M"]
+KINDS = ["percutor", "inalámbrico", "profesional", "industrial", "transparente", "reforzado",
+         "galvanizado", "eléctrico", "de uña", "de impacto", "multiuso", "para concreto"]  # fmt: skip
+SIZES = ['1/4"', '3/8"', '1/2"', "10 mm", "20 m", "1 L", "4 L", "300 ml", "18V", "20V", "#8", "#10"]
+QUERIES = [
+    "taladro percutor dewalt",
+    "silicon transparente",
+    "precio de martillo de uña truper",
+    "broca para concreto 3/8",
+    "pintura comex 4 l",
+    "cinta aislante 3m",
+    "destornilador stanley",
+    "manguera reforzada 20 m",
+    "escalera",
+    "multimetro profesional",
+]
+
+
+def synthetic_catalog(size: int, seed: int = 7) -> list[CatalogEntry]:
+    rng = random.Random(seed)
+    anchors = sorted(HARDWARE_ANCHORS)
+    entries = []
+    for product_id in range(1, size + 1):
+        anchor = rng.choice(anchors)
+        name = f"{anchor.capitalize()} {rng.choice(KINDS)} {rng.choice(BRANDS)} {rng.choice(SIZES)}"
+        entries.append(
+            CatalogEntry(product_id, anchor, name, rng.randrange(100, 500_000), rng.randrange(0, 500), None)
+        )
+    return entries
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    entries = synthetic_catalog(size)
+
+    index = CatalogSearchIndex()
+    start = time.perf_counter()
+    index.rebuild(entries)
+    print(f"build: {len(index)} products in {time.perf_counter() - start:.2f} s")
+
+    for query in QUERIES:  # warm per-term impact caches, as in steady state
+        index.search(query)
+
+    timings = []
+    for _ in range(50):
+        for query in QUERIES:
+            start = time.perf_counter()
+            index.search(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(
+        f"query: p50={statistics.median(timings):.3f} ms "
+        f"p95={timings[int(len(timings) * 0.95)]:.3f} ms max={timings[-1]:.3f} ms"
+    )
+
+    start = time.perf_counter()
+    for entry in entries[:1000]:
+        index.upsert(entry._replace(stock=entry.stock + 1))
+    print(f"incremental: 1000 stock updates in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for query in QUERIES[:3]:
+        hits = index.search(query, limit=3)
+        print(f"  {query!r}: " + "; ".join(f"{hit.entry.name} ({hit.score:.1f})" for hit in hits))
+
+
+if __name__ == "__main__":
+    main()
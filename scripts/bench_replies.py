@@ -0,0 +1,64 @@
+"""Microbenchmark: f-string replies vs the compiled reply registry, and cold template loads.
+
+Usage:
+    python scripts/bench_replies.py [iterations]
+"""
+
+from __future__ import annotations
+
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from jinja2 import Environment, FileSystemLoader  # noqa: E402
+
+from app.replies import get_reply_registry  # noqa: E402
+from app.templating import TEMPLATE_DIR, create_environment, precompile_templates  # noqa: E402
+
+PRODUCT = SimpleNamespace(name="Martillo Stanley 16 oz", price_cents=1250, stock=3)
+MENU = "¿Qué necesitas? Ejemplos: martillos, taladros, brocas, lijas, tornillos, pintura."
+
+
+def fstring_price() -> str:
+    price_usd = PRODUCT.price_cents / 100.0
+    return f"El {PRODUCT.name} cuesta ${price_usd:.2f} y hay {PRODUCT.stock} en stock."
+
+
+def fstring_unknown() -> str:
+    return "Gracias por la imagen. No identifiqué un producto de ferretería de nuestro catálogo. " + MENU
+
+
+def _cold_load_ms(make_env) -> float:
+    started = time.perf_counter()
+    precompile_templates(make_env())
+    return (time.perf_counter() - started) * 1000
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    replies = get_reply_registry()
+    cases = (
+        ("f-string price", fstring_price),
+        ("registry price", lambda: replies.render("price", key="whatsapp:+1", product=PRODUCT)),
+        ("f-string constant", fstring_unknown),
+        ("registry constant", lambda: replies.render("image_unknown", key="whatsapp:+1")),
+    )
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=iterations, repeat=5))
+        print(f"{name:<20} {best / iterations * 1e6:8.2f} µs/reply")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        parse_ms = _cold_load_ms(lambda: Environment(loader=FileSystemLoader(TEMPLATE_DIR)))
+        _cold_load_ms(lambda: create_environment(cache_dir=cache_dir))  # fill the bytecode cache
+        cached_ms = _cold_load_ms(lambda: create_environment(cache_dir=cache_dir))
+    print(f"{'parse templates':<20} {parse_ms:8.2f} ms")
+    print(f"{'bytecode cache':<20} {cached_ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
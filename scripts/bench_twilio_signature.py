@@ -0,0 +1,63 @@
+"""Microbenchmark: per-request RequestValidator vs the cached signature verifier.
+
+Usage:
+    python scripts/bench_twilio_signature.py [iterations]
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import timeit
+from pathlib import Path
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "bench-token")
+os.environ.setdefault("PUBLIC_BASE_URL", "https://example.ngrok.app")
+
+from decouple import config  # noqa: E402
+from starlette.datastructures import FormData  # noqa: E402
+from twilio.request_validator import RequestValidator  # noqa: E402
+
+from app.security import get_signature_verifier  # noqa: E402
+
+URL = "https://example.ngrok.app/message"
+PARAMS = {
+    "SmsMessageSid": "SM" + "0" * 32,
+    "NumMedia": "1",
+    "ProfileName": "Cliente",
+    "Body": "Hola, ¿tienen taladro percutor y silicón transparente? precio por favor",
+    "To": "whatsapp:+14155238886",
+    "From": "whatsapp:+5215550001111",
+    "MediaContentType0": "image/jpeg",
+    "MediaUrl0": "https://api.twilio.com/2010-04-01/Accounts/AC/Messages/MM/Media/ME",
+    "AccountSid": "AC" + "0" * 32,
+    "ApiVersion": "2010-04-01",
+}
+BODY = urlencode(PARAMS).encode()
+FORM = FormData(list(PARAMS.items()))
+SIGNATURE = RequestValidator("bench-token").compute_signature(URL, PARAMS)
+
+
+def legacy() -> bool:
+    token = config("TWILIO_AUTH_TOKEN", default="")
+    public_base = config("PUBLIC_BASE_URL", default="").strip().rstrip("/")
+    params = {key: str(value) for key, value in FORM.items()}
+    return RequestValidator(token).validate(f"{public_base}/message", params, SIGNATURE)
+
+
+def cached() -> bool:
+    return get_signature_verifier().verify(URL, BODY, SIGNATURE)
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    assert legacy() and cached()
+    for name, func in (("legacy RequestValidator", legacy), ("cached verifier", cached)):
+        best = min(timeit.repeat(func, number=iterations, repeat=5))
+        print(f"{name:<24} {best / iterations * 1e6:8.2f} µs/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,20 +13,65 @@ os.environ.setdefault("ADMIN_PASSWORD", "secret")
 os.environ.setdefault("TWILIO_VALIDATE_SIGNATURE", "false")
 os.environ.setdefault("PUBLIC_BASE_URL", "http://testserver")
 
+import uuid
+
 import pytest
 
 
 @pytest.fixture(autouse=True)
 def reset_clients():
     import app.llm_logic as llm_logic
+    import app.media as media
+    import app.search as search
+    import app.security as security
+    import app.state as state
+    import app.stats as stats
+    import app.tracing as tracing
+    import app.usage as usage
+    import app.vision_gate as vision_gate
     import app.utils as utils
 
     llm_logic._openai_client = None
+    llm_logic._gate_failed = False
+    media._manager = None
     utils._twilio_client = None
+    state._state_backend = None
+    search._catalog_index = None
+    stats._summary_cache.clear()
+    usage._ledger = usage.UsageLedger()
     utils._twilio_account_sid.cache_clear()
     utils._twilio_auth_token.cache_clear()
     utils._twilio_from_number.cache_clear()
     utils._default_content_sid.cache_clear()
     utils._twilio_use_template.cache_clear()
     utils._public_base_url.cache_clear()
-    yield
\ No newline at end of file
+    security._twilio_auth_tokens.cache_clear()
+    security._public_base_url.cache_clear()
+    security.twilio_signature_enabled.cache_clear()
+    vision_gate.vision_gate_enabled.cache_clear()
+    vision_gate.load_gate_model.cache_clear()
+    vision_gate._reject_below.cache_clear()
+    yield
+    tracing.shutdown_tracing()
+
+
+@pytest.fixture
+def postgres_engine():
+    """Engine on a throwaway schema of ``TEST_POSTGRES_URL``; skipped when unset."""
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL not set")
+    from sqlalchemy import create_engine, text
+
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
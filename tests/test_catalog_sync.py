@@ -0,0 +1,107 @@
+import csv
+import io
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import text
+
+from app import search
+from app.catalog_sync import FeedReader, FeedRow, import_feed, staging_csv
+from app.database import CatalogBase
+from app.search import CatalogEntry
+
+CSV_FEED = """sku,anchor,name,price,stock,image_url
+TRU-MAR-16, Martillo ,Martillo de uña Truper 16 oz,159.00,12,
+DW-TAL-12,taladro,Taladro percutor DeWalt 1/2 pulg,"$1,899.50",4,https://img/1.jpg
+BAD-1,broca,Broca sin precio,abc,3,
+,broca,Broca sin SKU,45,3,
+"""
+
+
+def test_csv_feed_is_normalized_and_bad_rows_rejected():
+    reader = FeedReader(io.StringIO(CSV_FEED), "csv")
+    rows = list(reader)
+    assert rows[0] == FeedRow("TRU-MAR-16", "martillo", "Martillo de uña Truper 16 oz", 15900, 12, None)
+    assert rows[1].price_cents == 189950 and rows[1].image_url == "https://img/1.jpg"
+    assert (reader.read, reader.rejected, len(rows)) == (4, 2, 2)
+
+
+def test_jsonl_feed_accepts_price_cents():
+    feed = '{"sku": "A", "anchor": "cinta", "name": "Cinta 3M", "price_cents": 1250, "stock": 5}\n\n'
+    rows = list(FeedReader(io.StringIO(feed), "jsonl"))
+    assert rows == [FeedRow("A", "cinta", "Cinta 3M", 1250, 5, None)]
+
+
+def test_staging_csv_round_trips_quotes_and_nulls():
+    row = FeedRow("DW-1", "taladro", 'Taladro 1/2", "pro"', 189900, 4, None)
+    parsed = next(csv.reader(staging_csv([row])))
+    assert parsed == ["DW-1", "taladro", 'Taladro 1/2", "pro"', "189900", "4", ""]
+
+
+def test_import_copies_batches_and_bumps_version_on_change():
+    raw = MagicMock()
+    cursor = raw.cursor.return_value
+    cursor.fetchone.side_effect = [(2, 0), (0, 1), (7,)]
+    engine = MagicMock(raw_connection=MagicMock(return_value=raw))
+    feed = "\n".join(
+        f'{{"sku": "S{i}", "anchor": "cinta", "name": "Cinta {i}", "price": "1.{i}0", "stock": {i}}}'
+        for i in range(3)
+    )
+
+    stats = import_feed(engine, FeedReader(io.StringIO(feed), "jsonl"), batch_size=2)
+
+    assert cursor.copy_expert.call_count == 2
+    assert (stats.inserted, stats.updated, stats.unchanged, stats.version) == (2, 1, 0, 7)
+    raw.commit.assert_called_once()
+
+
+def test_import_without_changes_keeps_version():
+    raw = MagicMock()
+    raw.cursor.return_value.fetchone.return_value = (0, 0)
+    engine = MagicMock(raw_connection=MagicMock(return_value=raw))
+    feed = '{"sku": "A", "anchor": "cinta", "name": "Cinta 3M", "price": "12.50", "stock": 5}'
+
+    stats = import_feed(engine, FeedReader(io.StringIO(feed), "jsonl"))
+
+    assert (stats.unchanged, stats.version) == (1, None)
+    executed = " ".join(call.args[0] for call in raw.cursor.return_value.execute.call_args_list)
+    assert "catalog_meta" not in executed
+
+
+def _import(engine, feed, **kw):
+    stats = import_feed(engine, FeedReader(io.StringIO(feed), "csv"), batch_size=2, **kw)
+    return stats.inserted, stats.updated, stats.unchanged, stats.deleted, stats.version
+
+
+def test_import_runs_copy_and_diffing_upsert_on_postgres(postgres_engine):
+    CatalogBase.metadata.create_all(postgres_engine)
+    header = "sku,anchor,name,price,stock,image_url\n"
+    feed = header + "A,cinta,Cinta 3M,12.50,5,\nB,broca,Broca 1/4,45,3,\nC,sierra,Sierra,99,1,\n"
+
+    assert _import(postgres_engine, feed) == (3, 0, 0, 0, 1)
+    assert _import(postgres_engine, feed) == (0, 0, 3, 0, None)  # no change, no version bump
+
+    # B's stock changes; the second C row in the same feed wins over the first.
+    changed = feed.replace("45,3", "45,0") + "C,sierra,Sierra,89,1,\n"
+    assert _import(postgres_engine, changed) == (0, 2, 2, 0, 2)
+    assert _import(postgres_engine, header + "A,cinta,Cinta 3M,12.50,5,\n", delete_missing=True) == (0, 0, 1, 2, 3)
+
+    with postgres_engine.connect() as conn:
+        rows = conn.execute(text("SELECT sku, price_cents, stock FROM products")).all()
+        version = conn.execute(text("SELECT value FROM catalog_meta WHERE key = 'version'")).scalar()
+    assert [tuple(row) for row in rows] == [("A", 1250, 5)]
+    assert version == 3
+
+
+def test_index_resyncs_when_catalog_version_changes(monkeypatch):
+    monkeypatch.setenv("CATALOG_VERSION_POLL_SECONDS", "0")
+    before = [CatalogEntry(1, "cinta", "Cinta 3M", 1250, 5, None)]
+    after = [before[0]._replace(stock=0)]
+    with patch("app.search.catalog_version", side_effect=[1, 1, 2]), patch(
+        "app.search.load_catalog_entries", side_effect=[before, after]
+    ) as load:
+        index = search.get_catalog_index(MagicMock())
+        search.get_catalog_index(MagicMock())  # same version: no reload
+        assert load.call_count == 1
+        search.get_catalog_index(MagicMock())
+    assert load.call_count == 2
+    assert index.get(1).stock == 0
@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+from app.grounding import estimate_tokens, format_catalog_context
+from app.llm_logic import llm_sales_reply
+from app.main import app
+from app.search import CatalogEntry, CatalogSearchIndex
+
+ENTRIES = tuple(
+    CatalogEntry(i, "cinta", f"Cinta de aislar 3M modelo {i}", 1250 + i, i, None) for i in range(1, 30)
+)
+
+
+def test_context_respects_token_budget():
+    context = format_catalog_context(ENTRIES, 60)
+    lines = context.splitlines()
+    assert lines[1] == "Cinta de aislar 3M modelo 1 | 12.51 | 1"
+    assert 1 < len(lines) < len(ENTRIES)
+    assert sum(estimate_tokens(line) + 1 for line in lines) <= 61
+    assert format_catalog_context(ENTRIES, 5) == ""
+
+
+def test_context_is_cached_per_product_set():
+    format_catalog_context.cache_clear()
+    format_catalog_context(ENTRIES[:3], 160)
+    format_catalog_context(ENTRIES[:3], 160)
+    assert format_catalog_context.cache_info().hits == 1
+
+
+def test_sales_reply_sends_catalog_context_as_system_message():
+    client = MagicMock()
+    client.chat.completions.create.return_value.choices = [
+        MagicMock(message=MagicMock(content="Cuesta $12.51"))
+    ]
+    with patch("app.llm_logic.get_openai_client", return_value=client):
+        assert llm_sales_reply("cinta?", catalog_context="Catálogo: cinta | 12.51 | 1") == "Cuesta $12.51"
+    messages = client.chat.completions.create.call_args.kwargs["messages"]
+    assert [m["role"] for m in messages] == ["system", "system", "user"]
+    assert "12.51" in messages[1]["content"]
+
+
+@patch("app.main.send_message")
+@patch("app.main.llm_sales_reply", return_value="Sí, la cinta 3M cuesta $12.51")
+def test_llm_branch_is_grounded_in_catalog(mock_llm, mock_send):
+    index = CatalogSearchIndex()
+    index.rebuild(ENTRIES[:2])
+    with patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal"), patch(
+        "app.grounding.get_catalog_index", return_value=index
+    ):
+        TestClient(app).post("/message", data={"Body": "me sirve la cinta 3m?", "From": "whatsapp:+1"})
+    context = mock_llm.call_args.kwargs["catalog_context"]
+    assert "Cinta de aislar 3M modelo 1 | 12.51 | 1" in context
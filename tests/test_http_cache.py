@@ -0,0 +1,111 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.http_cache import IMMUTABLE_CACHE_CONTROL, CachedStaticFiles, CompressionMiddleware
+from app.main import _store, app, get_chat_db
+from app.models import Conversation, ConversationHourlyStat, SenderStat
+from app.services.pdf import generate_pdf
+from app.utils import write_content_addressed
+
+AUTH = ("admin", "secret")
+
+
+@pytest.fixture
+def client():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    tables = [Conversation.__table__, ConversationHourlyStat.__table__, SenderStat.__table__]
+    Conversation.metadata.create_all(engine, tables=tables)
+    with sessionmaker(bind=engine)() as session:
+        app.dependency_overrides[get_chat_db] = lambda: session
+        try:
+            yield TestClient(app), session
+        finally:
+            app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("path", ["/api/conversations", "/conversations"])
+def test_conversation_views_answer_304_until_a_new_row(client, path):
+    http, db = client
+    _store(db, "whatsapp:+1", "hola", "respuesta " * 100, branch="llm")
+    first = http.get(path, auth=AUTH)
+    etag = first.headers["etag"]
+    assert etag == 'W/"conversations-1"' and "last-modified" in first.headers
+
+    cached = http.get(path, auth=AUTH, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+    since = http.get(path, auth=AUTH, headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert since.status_code == 304
+
+    _store(db, "whatsapp:+1", "otra", "respuesta", branch="llm")
+    assert http.get(path, auth=AUTH, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_json_is_gzipped_when_accepted(client):
+    http, db = client
+    _store(db, "whatsapp:+1", "hola", "respuesta " * 100, branch="llm")
+    response = http.get("/api/conversations", auth=AUTH, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json()["total"] == 1  # httpx decodes transparently
+
+    plain = http.get("/api/conversations", auth=AUTH, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+
+def test_content_addressed_files_are_immutable(tmp_path):
+    path, name = write_content_addressed(b"%PDF-1.3 demo", str(tmp_path), ".pdf", prefix="cotizacion_")
+    assert write_content_addressed(b"%PDF-1.3 demo", str(tmp_path), ".pdf", prefix="cotizacion_")[1] == name
+    (tmp_path / "logo.png").write_bytes(b"png")
+
+    static = FastAPI()
+    static.add_middleware(CompressionMiddleware, minimum_size=1)
+    static.mount("/public", CachedStaticFiles(directory=str(tmp_path)), name="public")
+    http = TestClient(static)
+
+    response = http.get(f"/public/{name}", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert "content-encoding" not in response.headers  # PDFs pass through untouched
+    assert http.get("/public/logo.png").headers["cache-control"] == "public, max-age=300"
+    assert len(list(tmp_path.glob("cotizacion_*.pdf"))) == 1
+
+
+def test_same_quote_is_one_file(tmp_path, monkeypatch):
+    path, name = generate_pdf("Martillo x2", out_dir=str(tmp_path))
+    data = (tmp_path / name).read_bytes()
+    assert b"/CreationDate" in data and b"/Title (Cotizacion)" in data  # metadata kept
+    assert generate_pdf("Martillo x2", out_dir=str(tmp_path)) == (path, name)
+
+    (tmp_path / name).unlink()  # e.g. another host renders it later
+    monkeypatch.setattr("fpdf.fpdf.datetime", MagicMock(now=lambda: datetime(2030, 1, 1)))
+    assert generate_pdf("Martillo x2", out_dir=str(tmp_path)) == (path, name)
+    assert (tmp_path / name).read_bytes() != data  # new creation date, same URL
+    assert len(list(tmp_path.glob("cotizacion_*.pdf"))) == 1
+
+
+def test_small_and_binary_bodies_are_not_compressed():
+    inner = FastAPI()
+
+    @inner.get("/tiny")
+    def tiny():
+        return {"ok": True}
+
+    inner.add_middleware(CompressionMiddleware, minimum_size=500)
+    response = TestClient(inner).get("/tiny", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"ok": True}
+
+
+def test_brotli_preferred_when_available(client):
+    pytest.importorskip("brotli")
+    http, db = client
+    _store(db, "whatsapp:+1", "hola", "respuesta " * 100, branch="llm")
+    response = http.get("/api/conversations", auth=AUTH, headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.json()["total"] == 1
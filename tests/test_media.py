@@ -0,0 +1,137 @@
+import io
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import media
+from app.http_cache import IMMUTABLE_CACHE_CONTROL, CachedStaticFiles
+from app.main import app
+from app.media import MediaError, MediaManager, optimize_image
+from app.services.pdf import generate_pdf
+from app.state import MemoryStateBackend
+
+Image = pytest.importorskip("PIL.Image")
+
+BASE = "http://testserver"
+
+
+def _image(fmt, size, mode="RGB"):
+    out = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)).save(out, fmt)
+    return out.getvalue()
+
+
+def _manager(tmp_path, state=None):
+    return MediaManager(state or MemoryStateBackend(), out_dir=str(tmp_path), public_base=BASE)
+
+
+def test_optimize_downscales_flattens_and_keeps_small_originals():
+    data, suffix = optimize_image(_image("PNG", (3000, 1500), "RGBA"), max_dimension=800)
+    assert suffix == ".jpg"
+    with Image.open(io.BytesIO(data)) as image:
+        assert (image.format, image.size, image.mode) == ("JPEG", (800, 400), "RGB")
+
+    out = io.BytesIO()
+    Image.effect_noise((40, 40), 80).convert("RGB").save(out, "JPEG", quality=50, optimize=True)
+    small = out.getvalue()
+    assert optimize_image(small) == (small, ".jpg")
+    with pytest.raises(MediaError):
+        optimize_image(b"<html>not found</html>")
+
+
+def test_prepared_images_get_one_hashed_url_shared_across_workers(tmp_path):
+    (tmp_path / "martillo.png").write_bytes(_image("PNG", (2400, 2400)))
+    (tmp_path / "broken.png").write_bytes(b"<html>")
+    source, broken = f"{BASE}/public/martillo.png", f"{BASE}/public/broken.png"
+    state = MemoryStateBackend()
+    manager = _manager(tmp_path, state)
+
+    stats = manager.warm([source, source, broken, ""])
+    assert stats == media.WarmStats(ready=0, prepared=1, failed=1)
+    url = manager.outbound_url(source)
+    assert url.startswith(f"{BASE}/public/product_") and url.endswith(".jpg")
+    assert manager.outbound_url(broken) is None  # sent without media instead of failing
+
+    other = _manager(tmp_path, state)  # another worker, same state backend
+    assert other.outbound_url(source) == url
+    assert other.warm([source, broken]) == media.WarmStats(ready=1, prepared=0, failed=0)
+
+
+def test_unprepared_source_goes_out_as_is_and_is_prepared_in_background(tmp_path, monkeypatch):
+    calls = []
+
+    class Response:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, size):
+            yield _image("JPEG", (100, 100))
+
+    monkeypatch.setattr(media.requests, "get", lambda url, **kw: calls.append(url) or Response())
+    manager = _manager(tmp_path)
+    source = "https://supplier.example/sierra.jpg"
+
+    assert manager.outbound_url(source) == source
+    manager._executor.shutdown(wait=True)
+    assert calls == [source]
+    assert manager.outbound_url(source).startswith(f"{BASE}/public/product_")
+    assert manager.stats()["sends"] == 1
+
+
+def test_remote_sources_over_the_size_cap_are_rejected(tmp_path, monkeypatch):
+    class Response:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, size):
+            while True:
+                yield b"\0" * size
+
+    monkeypatch.setattr(media.requests, "get", lambda url, **kw: Response())
+    manager = MediaManager(MemoryStateBackend(), out_dir=str(tmp_path), public_base=BASE, max_source_bytes=1000)
+    with pytest.raises(MediaError, match="larger"):
+        manager.prepare("https://supplier.example/huge.jpg")
+    assert manager.lookup("https://supplier.example/huge.jpg").startswith("!")
+
+
+def test_public_fetches_and_revalidations_are_counted(tmp_path):
+    manager = _manager(tmp_path)
+    (tmp_path / "martillo.jpg").write_bytes(_image("JPEG", (64, 64)))
+    name = manager.prepare(f"{BASE}/public/martillo.jpg")
+    static = FastAPI()
+    static.mount("/public", CachedStaticFiles(directory=str(tmp_path), on_response=manager.record_fetch))
+    client = TestClient(static)
+
+    first = client.get(f"/public/{name}")
+    assert first.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    client.get(f"/public/{name}", headers={"If-None-Match": first.headers["etag"]})
+    manager.public_url(name)
+    [row] = [row for row in manager.stats()["files"] if row["file"] == name]
+    assert row == {"file": name, "sends": 1, "fetches": 1, "revalidations": 1}
+
+
+def test_media_stats_route_requires_auth():
+    client = TestClient(app)
+    assert client.get("/api/media/stats").status_code == 401
+    assert client.get("/api/media/stats", auth=("admin", "secret")).json()["sends"] == 0
+
+
+def test_same_quote_text_gives_the_same_pdf_url(tmp_path, monkeypatch):
+    first = generate_pdf("Martillo x2", out_dir=str(tmp_path))
+    with monkeypatch.context() as patched:
+        patched.setattr("app.services.pdf.FPDF.output", lambda *args, **kwargs: pytest.fail("re-rendered"))
+        assert generate_pdf("Martillo x2", out_dir=str(tmp_path)) == first
+    assert generate_pdf("Martillo x3", out_dir=str(tmp_path)) != first
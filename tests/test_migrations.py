@@ -0,0 +1,140 @@
+import sqlalchemy as sa
+
+from app import migrations
+from app.database import CatalogBase, ChatBase
+from app.state import PostgresStateBackend
+
+
+def _engines(tmp_path):
+    return {name: sa.create_engine(f"sqlite:///{tmp_path / name}.db") for name in migrations.DATABASES}
+
+
+def _upgrade_all(engines):
+    for name, engine in engines.items():
+        migrations.upgrade(name, engine=engine)
+
+
+def _columns(engine):
+    inspector = sa.inspect(engine)
+    return {
+        table: {column["name"] for column in inspector.get_columns(table)}
+        for table in inspector.get_table_names()
+        if table != "alembic_version"
+    }
+
+
+def test_fresh_databases_match_models_and_verify(tmp_path):
+    engines = _engines(tmp_path)
+    assert not migrations.verify_schema(engines=engines)
+    assert migrations.current_revision(engines["chat"]) is None
+
+    _upgrade_all(engines)
+    _upgrade_all(engines)  # already at head: no-op
+
+    for name, base in (("chat", ChatBase), ("catalog", CatalogBase)):
+        expected = {table.name: {column.name for column in table.columns} for table in base.metadata.tables.values()}
+        if name == "chat":
+            expected["app_state"] = {"key", "value", "expires_at"}  # STATE_BACKEND=postgres
+        assert _columns(engines[name]) == expected
+        assert migrations.current_revision(engines[name]) == migrations.head_revision(name)
+    assert migrations.verify_schema(engines=engines)
+    indexes = {index["name"] for index in sa.inspect(engines["catalog"]).get_indexes("products")}
+    assert {"ix_products_anchor", "products_sku_key"} <= indexes
+
+
+CONVERSATION_INDEXES = {
+    "ix_conversations_id",
+    "ix_conversations_created_at",
+    "ix_conversations_sender_created_at",
+    "ix_conversations_branch_created_at",
+}
+
+
+def _create_all_era_chat(engine):
+    with engine.begin() as conn:
+        conn.execute(
+            sa.text(
+                "CREATE TABLE conversations (id INTEGER PRIMARY KEY, created_at TIMESTAMP NOT NULL, "
+                "sender VARCHAR, message VARCHAR, response VARCHAR, branch VARCHAR(32), model VARCHAR(64), "
+                "prompt_tokens INTEGER, completion_tokens INTEGER, latency_ms INTEGER)"
+            )
+        )
+        conn.execute(
+            sa.text(
+                "CREATE TABLE conversation_hourly_stats (bucket TIMESTAMP, branch VARCHAR(32), "
+                "count BIGINT NOT NULL, latency_ms_total BIGINT NOT NULL, PRIMARY KEY (bucket, branch))"
+            )
+        )
+        conn.execute(
+            sa.text("INSERT INTO conversation_hourly_stats VALUES ('2026-10-19 10:00:00', 'llm', 3, 900)")
+        )
+
+
+def test_create_all_databases_are_brought_forward(tmp_path):
+    engines = _engines(tmp_path)
+    _create_all_era_chat(engines["chat"])
+    with engines["catalog"].begin() as conn:
+        conn.execute(
+            sa.text(
+                "CREATE TABLE products (id INTEGER PRIMARY KEY, anchor VARCHAR NOT NULL, name VARCHAR NOT NULL, "
+                "price_cents INTEGER NOT NULL, stock INTEGER NOT NULL, image_url VARCHAR)"
+            )
+        )
+        conn.execute(sa.text("INSERT INTO products VALUES (1, 'martillo', 'Martillo', 1000, 3, NULL)"))
+
+    _upgrade_all(engines)
+
+    assert migrations.verify_schema(engines=engines)
+    assert "cost_micros" in _columns(engines["chat"])["conversations"]
+    assert "sku" in _columns(engines["catalog"])["products"]
+    with engines["chat"].connect() as conn:
+        row = conn.execute(sa.text("SELECT count, cost_micros FROM conversation_hourly_stats")).one()
+    assert tuple(row) == (3, 0)
+    with engines["catalog"].connect() as conn:
+        assert conn.execute(sa.text("SELECT name FROM products")).scalar() == "Martillo"
+
+
+def test_create_all_era_conversations_gain_indexes(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    _create_all_era_chat(engine)
+    migrations.upgrade("chat", engine=engine)
+    assert CONVERSATION_INDEXES <= {index["name"] for index in sa.inspect(engine).get_indexes("conversations")}
+
+
+def test_create_all_era_conversations_gain_valid_indexes_on_postgres(postgres_engine):
+    _create_all_era_chat(postgres_engine)
+    migrations.upgrade("chat", engine=postgres_engine)
+    migrations.upgrade("chat", engine=postgres_engine)  # already at head: no-op
+
+    with postgres_engine.connect() as conn:
+        valid = dict(
+            conn.execute(
+                sa.text(
+                    "SELECT c.relname, i.indisvalid FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid "
+                    "JOIN pg_class t ON t.oid = i.indrelid "
+                    "WHERE t.relname = 'conversations' AND t.relnamespace = current_schema()::regnamespace"
+                )
+            ).all()
+        )
+    assert CONVERSATION_INDEXES <= set(valid)
+    assert all(valid[name] for name in CONVERSATION_INDEXES)
+
+
+def test_postgres_state_backend_uses_the_migrated_table(postgres_engine):
+    backend = PostgresStateBackend(postgres_engine)
+    assert not sa.inspect(postgres_engine).has_table("app_state")  # no runtime DDL
+
+    migrations.upgrade("chat", engine=postgres_engine)
+    assert backend.add_if_absent("twilio:sid:SM1", ttl=60)
+    assert not backend.add_if_absent("twilio:sid:SM1", ttl=60)
+    assert backend.incr("n", 2) == 2
+
+def test_ensure_schema_modes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(migrations, "upgrade", lambda name: calls.append(("upgrade", name)))
+    monkeypatch.setattr(migrations, "verify_schema", lambda: calls.append(("verify",)) or True)
+    migrations.ensure_schema("verify")
+    migrations.ensure_schema("migrate")
+    migrations.ensure_schema("off")
+    assert calls == [("verify",), ("upgrade", "chat"), ("upgrade", "catalog")]
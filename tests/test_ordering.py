@@ -0,0 +1,69 @@
+import asyncio
+
+from app.main import InboundMessage, _merge_burst
+from app.ordering import KeyedLocks, SenderDebouncer
+
+
+def test_keyed_locks_serialize_same_sender_and_parallelize_others():
+    locks = KeyedLocks()
+    events = []
+
+    async def handle(sender: str, label: str, delay: float):
+        async with locks.hold(sender):
+            events.append(("start", label))
+            await asyncio.sleep(delay)
+            events.append(("end", label))
+
+    async def scenario():
+        await asyncio.gather(
+            handle("+1", "a1", 0.05),
+            handle("+1", "a2", 0.0),
+            handle("+2", "b1", 0.0),
+        )
+
+    asyncio.run(scenario())
+    assert events.index(("end", "a1")) < events.index(("start", "a2"))
+    assert events.index(("end", "b1")) < events.index(("end", "a1"))
+    assert len(locks) == 0
+
+
+def test_debouncer_merges_burst_into_last_submitter():
+    debouncer = SenderDebouncer(0.05)
+
+    async def scenario():
+        first = asyncio.create_task(debouncer.submit("+1", "hola"))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(debouncer.submit("+1", "precio?"))
+        other = asyncio.create_task(debouncer.submit("+2", "taladro"))
+        return await asyncio.gather(first, second, other)
+
+    first, second, other = asyncio.run(scenario())
+    assert first is None
+    assert second == ["hola", "precio?"]
+    assert other == ["taladro"]
+
+
+def test_debouncer_flushes_after_max_wait():
+    debouncer = SenderDebouncer(0.03, max_wait=0.05)
+
+    async def scenario():
+        tasks = []
+        for text in ("a", "b", "c", "d"):
+            tasks.append(asyncio.create_task(debouncer.submit("+1", text)))
+            await asyncio.sleep(0.02)
+        return await asyncio.gather(*tasks)
+
+    results = [result for result in asyncio.run(scenario()) if result is not None]
+    assert [item for burst in results for item in burst] == ["a", "b", "c", "d"]
+    assert len(results) >= 2
+
+
+def test_debouncer_disabled_returns_each_item():
+    assert asyncio.run(SenderDebouncer(0).submit("+1", "hola")) == ["hola"]
+
+
+def test_merge_burst_keeps_images_and_joins_text():
+    photo = InboundMessage("", 1, "https://media/1", "image/jpeg")
+    burst = [InboundMessage("hola"), photo, InboundMessage("precio?")]
+    assert _merge_burst(burst) == [photo, InboundMessage("hola\nprecio?")]
+    assert _merge_burst([photo]) == [photo]
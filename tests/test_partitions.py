@@ -0,0 +1,67 @@
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from app.main import app
+from app.models import Conversation
+from app.partitions import (
+    add_months,
+    ensure_conversation_partitions,
+    expired_partitions,
+    partition_month,
+    partition_name,
+)
+
+
+def test_month_arithmetic_and_names():
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert partition_name(date(2026, 3, 1)) == "conversations_y2026m03"
+    assert partition_month("conversations_y2026m03") == date(2026, 3, 1)
+    assert partition_month("conversations_default") is None
+
+
+def test_ensure_partitions_creates_current_and_upcoming_months():
+    engine = MagicMock()
+    conn = engine.begin.return_value.__enter__.return_value
+    created = ensure_conversation_partitions(engine, months_ahead=2, today=date(2026, 12, 15))
+    assert created == ["conversations_y2026m12", "conversations_y2027m01", "conversations_y2027m02"]
+    statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+    assert "FROM ('2026-12-01') TO ('2027-01-01')" in statements[0]
+    assert statements[-1].endswith("PARTITION OF conversations DEFAULT")
+
+
+def test_retention_selects_whole_expired_months():
+    names = [
+        "conversations_y2026m01",
+        "conversations_y2026m04",
+        "conversations_y2026m05",
+        "conversations_default",
+    ]
+    assert expired_partitions(names, 6, today=date(2026, 10, 19)) == ["conversations_y2026m01"]
+
+
+def test_conversation_schema_has_time_indexes():
+    ddl = str(CreateTable(Conversation.__table__).compile(dialect=postgresql.dialect()))
+    assert "created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL" in ddl
+    index_columns = {
+        index.name: [column.name for column in index.columns]
+        for index in Conversation.__table__.indexes
+    }
+    assert index_columns["ix_conversations_sender_created_at"] == ["sender", "created_at"]
+
+
+@patch("app.main.send_message")
+@patch("app.main.llm_sales_reply", return_value="")
+def test_store_records_branch_model_and_latency(mock_llm, mock_send):
+    with patch("app.main.ChatSessionLocal") as mock_session_local, patch(
+        "app.main.CatalogSessionLocal"
+    ):
+        TestClient(app).post("/message", data={"Body": "hola", "From": "whatsapp:+1"})
+        stored = mock_session_local.return_value.add.call_args.args[0]
+    assert stored.branch == "llm_fallback"
+    assert stored.model == "gpt-4o-mini"
+    assert stored.latency_ms >= 0
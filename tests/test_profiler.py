@@ -0,0 +1,114 @@
+import io
+import json
+import logging
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import profiler
+from app.logging_config import configure_logging, stop_logging
+from app.main import app
+from app.profiler import SamplingProfiler
+
+AUTH = ("admin", "secret")
+
+
+def _busy_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def _with_busy_thread(func):
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,), name="busy")
+    worker.start()
+    try:
+        return func()
+    finally:
+        stop.set()
+        worker.join()
+
+
+def test_profiler_samples_running_threads():
+    sampler = SamplingProfiler(interval=0.002)
+
+    def run():
+        assert sampler.start(5)
+        assert not sampler.start(5)
+        time.sleep(0.1)
+        return sampler.stop()
+
+    profile = _with_busy_thread(run)
+    assert profile.sample_count > 0
+    busy = [stack for stack in profile.samples if stack[0][0] == "thread:busy"]
+    assert busy and any(frame[0] == "_busy_loop" for frame in busy[0])
+
+    collapsed = profile.to_collapsed()
+    assert collapsed.startswith("thread:") and "_busy_loop (test_profiler.py:" in collapsed
+    speedscope = profile.to_speedscope()
+    assert speedscope["profiles"][0]["type"] == "sampled"
+    assert len(speedscope["profiles"][0]["samples"]) == len(profile.samples)
+
+
+def test_profile_endpoints(monkeypatch):
+    monkeypatch.setattr(profiler, "_profiler", SamplingProfiler(interval=0.002))
+    client = TestClient(app)
+    assert client.post("/api/profile/start").status_code == 401
+    assert client.get("/api/profile", auth=AUTH).status_code == 404
+
+    def run():
+        assert client.post("/api/profile/start?seconds=5", auth=AUTH).json()["running"]
+        assert client.post("/api/profile/start", auth=AUTH).status_code == 409
+        assert client.get("/api/profile", auth=AUTH).status_code == 409
+        time.sleep(0.05)
+        return client.post("/api/profile/stop", auth=AUTH)
+
+    response = _with_busy_thread(run)
+    assert response.status_code == 200
+    assert "speedscope" in response.headers["content-disposition"]
+    assert response.json()["shared"]["frames"]
+    collapsed = client.get("/api/profile?format=collapsed", auth=AUTH)
+    assert collapsed.headers["content-type"].startswith("text/plain")
+
+
+def test_finished_profile_is_read_without_stopping(monkeypatch):
+    sampler = SamplingProfiler(interval=0.002)
+    monkeypatch.setattr(profiler, "_profiler", sampler)
+    monkeypatch.setattr(sampler, "stop", lambda: pytest.fail("GET must not stop the profiler"))
+    client = TestClient(app)
+
+    def run():
+        assert client.post("/api/profile/start?seconds=1", auth=AUTH).json()["running"]
+        sampler._thread.join()
+        return client.get("/api/profile", auth=AUTH)
+
+    response = _with_busy_thread(run)
+    assert response.status_code == 200 and response.json()["shared"]["frames"]
+    assert client.get("/api/profile", auth=AUTH).json() == response.json()
+
+
+def test_logging_is_queued_and_structured():
+    stream = io.StringIO()
+    configure_logging(level="INFO", fmt="json", stream=stream)
+    seen: list[logging.LogRecord] = []
+    sibling = logging.Handler()
+    sibling.emit = seen.append
+    logging.getLogger().addHandler(sibling)  # runs after the queue handler
+    try:
+        logger = logging.getLogger("app.test")
+        logger.info("Stored %s rows", 3, extra={"branch": "llm"})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Failed")
+    finally:
+        logging.getLogger().removeHandler(sibling)
+        stop_logging()
+        configure_logging()
+    assert (seen[0].msg, seen[0].args) == ("Stored %s rows", (3,))
+    assert seen[1].exc_info is not None and seen[1].exc_info[0] is ValueError
+    first, second = (json.loads(line) for line in stream.getvalue().splitlines())
+    assert first["message"] == "Stored 3 rows" and first["branch"] == "llm" and first["level"] == "INFO"
+    assert second["level"] == "ERROR" and "ValueError: boom" in second["exc"]
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from jinja2 import UndefinedError
+
+from app.main import app
+from app.replies import ReplyRegistry, get_reply_registry, load_catalogs
+from app.templating import create_environment, precompile_templates
+
+PRODUCT = SimpleNamespace(name="Martillo Stanley", price_cents=1250, stock=3, image_url=None)
+
+
+def test_spanish_replies_keep_their_wording():
+    replies = get_reply_registry()
+    assert replies.render("price", product=PRODUCT) == "El Martillo Stanley cuesta $12.50 y hay 3 en stock."
+    assert replies.render(
+        "catalog_search", items=[PRODUCT, SimpleNamespace(name="Lija 120", price_cents=99, stock=40)]
+    ) == (
+        "Encontré en catálogo:\n• Martillo Stanley: $12.50, stock 3\n• Lija 120: $0.99, stock 40\n"
+        "¿Deseas una cotización?"
+    )
+    assert replies.render("dont_know").startswith("Puedo ayudarte con productos de ferretería. ¿Qué necesitas?")
+
+
+def test_constant_replies_are_prerendered():
+    replies = get_reply_registry()
+    assert isinstance(replies._replies["es"]["image_unknown"][0], str)
+    assert replies._replies["es"]["image_unknown"][0].endswith(replies.render("hardware_menu"))
+    assert set(replies.locales()) >= {"es", "en"}
+    assert set(load_catalogs()["en"]) == set(load_catalogs()["es"])
+
+
+def test_variants_locales_and_errors():
+    replies = ReplyRegistry(
+        {
+            "es": {"greet": ["Hola", "Buenas", "Qué tal"], "price": "${{ cents | money }}"},
+            "en": {"greet": "Hi"},
+        },
+        "es",
+    )
+    picks = {replies.render("greet", key="whatsapp:+1") for _ in range(5)}
+    assert len(picks) == 1
+    assert {replies.render("greet", key=f"whatsapp:+{n}") for n in range(30)} == {"Hola", "Buenas", "Qué tal"}
+    assert replies.render("greet", locale="en") == "Hi"
+    assert replies.render("price", locale="en", cents=300) == "$3.00"  # falls back to es
+    with pytest.raises(KeyError):
+        replies.render("nope")
+    with pytest.raises(UndefinedError):
+        replies.render("price")
+
+
+def test_page_templates_precompile_into_bytecode_cache(tmp_path):
+    names = precompile_templates(create_environment(cache_dir=str(tmp_path)))
+    assert {"base.html", "conversations.html", "stats.html"} <= set(names)
+    assert len(list(tmp_path.iterdir())) == len(names)
+
+    env = create_environment(cache_dir=str(tmp_path))
+    with patch.object(env, "compile", side_effect=AssertionError("recompiled")):
+        env.get_template("stats.html")
+
+
+def test_webhook_replies_come_from_registry():
+    product_query = SimpleNamespace(filter=lambda *_: SimpleNamespace(first=lambda: PRODUCT))
+    with patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal") as catalog, patch(
+        "app.main.send_message"
+    ) as send:
+        catalog.return_value.query.return_value = product_query
+        TestClient(app).post("/message", data={"Body": "precio del martillo", "From": "whatsapp:+1"})
+    assert send.call_args.args[1] == "El Martillo Stanley cuesta $12.50 y hay 3 en stock."
@@ -0,0 +1,103 @@
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.search import CatalogEntry, CatalogSearchIndex, fold, refresh_catalog_index
+
+CATALOG = [
+    CatalogEntry(1, "taladro", "Taladro percutor DeWalt 1/2\"", 189900, 4, "https://img/1.jpg"),
+    CatalogEntry(2, "taladro", "Taladro inalámbrico Bosch 18V", 245000, 2, None),
+    CatalogEntry(3, "silicón", "Silicón transparente Sika 300 ml", 8900, 40, None),
+    CatalogEntry(4, "martillo", "Martillo de uña Truper 16 oz", 15900, 12, None),
+    CatalogEntry(5, "broca", "Broca para concreto 3/8 Truper", 4500, 30, None),
+]
+
+
+def _index():
+    index = CatalogSearchIndex()
+    index.rebuild(CATALOG)
+    return index
+
+
+def test_fold_strips_accents():
+    assert fold("Silicón TRANSPARENTE") == "silicon transparente"
+
+
+def test_search_ranks_all_word_matches_first():
+    hits = _index().search("taladro percutor dewalt")
+    assert hits[0].entry.id == 1
+    assert {hit.entry.id for hit in hits} == {1, 2}
+
+
+def test_search_is_accent_and_typo_tolerant():
+    assert _index().search("silicon transparente")[0].entry.id == 3
+    assert _index().search("martiyo truper")[0].entry.id == 4
+
+
+def test_search_ignores_unknown_and_filler_words():
+    assert _index().search("hola buenas tardes") == []
+    assert _index().search("precio de la broca")[0].entry.id == 5
+
+
+def test_incremental_updates():
+    index = _index()
+    index.upsert(CATALOG[0]._replace(name="Rotomartillo DeWalt"))
+    assert index.search("percutor") == []
+    assert index.search("rotomartillo")[0].entry.id == 1
+    index.remove(3)
+    assert index.search("silicon") == []
+
+    changed = refresh_catalog_index(index, [CATALOG[0], CATALOG[1]._replace(stock=9)])
+    assert changed == 4  # product 1 renamed back, 2 restocked, 4 and 5 removed
+    assert index.get(2).stock == 9
+    assert len(index) == 2
+
+
+def test_scores_after_upserts_match_a_fresh_build():
+    index = _index()
+    queries = ("sika", "bosch", "taladro dewalt", "truper")
+    for query in queries:
+        index.search(query)  # warm the impact caches
+    added = CatalogEntry(6, "taladro", "Taladro Makita 13 mm con maletín y 5 brocas", 199900, 1, None)
+    index.upsert(added)
+    index.upsert(CATALOG[3]._replace(name="Martillo de bola Truper"))
+    index.remove(5)
+
+    fresh = CatalogSearchIndex()
+    fresh.rebuild([added, CATALOG[3]._replace(name="Martillo de bola Truper"), *CATALOG[:3]])
+    for query in queries:  # "sika" and "bosch" postings never changed, but their IDF did
+        assert index.search(query) == fresh.search(query)
+
+
+@patch("app.main.send_message")
+@patch("app.main.llm_sales_reply")
+def test_price_question_answered_from_catalog(mock_llm, mock_send):
+    with patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal"), patch(
+        "app.main.get_catalog_index", return_value=_index()
+    ):
+        response = TestClient(app).post(
+            "/message",
+            data={"Body": "¿precio del taladro percutor dewalt?", "From": "whatsapp:+1"},
+        )
+    assert response.status_code == 200
+    mock_llm.assert_not_called()
+    text = mock_send.call_args.args[1]
+    assert "Taladro percutor DeWalt" in text and "$1899.00" in text
+    assert mock_send.call_args.kwargs["media_urls"] == ["https://img/1.jpg"]
+
+
+@patch("app.main.send_message")
+@patch("app.main.llm_sales_reply", return_value="Con gusto")
+def test_catalog_search_needs_a_whole_query_word(mock_llm, mock_send):
+    index = _index()
+    with patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal"), patch(
+        "app.main.get_catalog_index", return_value=index
+    ):
+        client = TestClient(app)
+        # "equivale" contains "vale", but it is not a price question.
+        client.post("/message", data={"Body": "¿la broca de 3/8 equivale a 10 mm?", "From": "whatsapp:+1"})
+        mock_llm.assert_called_once()
+        client.post("/message", data={"Body": "¿Cuánto cuestan las brocas Truper?", "From": "whatsapp:+2"})
+        mock_llm.assert_called_once()
+    assert "Broca para concreto" in mock_send.call_args.args[1]
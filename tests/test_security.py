@@ -0,0 +1,151 @@
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+import pytest
+from fastapi import Body, FastAPI, Request
+from fastapi.testclient import TestClient
+from twilio.request_validator import RequestValidator
+
+from app import security
+from app.main import MAX_WEBHOOK_BODY_BYTES, app
+from app.security import LimitBodySizeMiddleware, TwilioSignatureVerifier
+
+client = TestClient(app)
+URL = "https://example.ngrok.app/message"
+PARAMS = {"Body": "hola", "From": "whatsapp:+15550001111", "To": "whatsapp:+15550002222"}
+
+
+@pytest.fixture
+def signed_webhooks(monkeypatch):
+    monkeypatch.setenv("TWILIO_VALIDATE_SIGNATURE", "true")
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "new-token")
+    monkeypatch.setenv("TWILIO_AUTH_TOKENS_PREVIOUS", "old-token")
+    monkeypatch.setenv("PUBLIC_BASE_URL", "https://example.ngrok.app")
+    security.twilio_signature_enabled.cache_clear()
+    security._twilio_auth_tokens.cache_clear()
+    security._public_base_url.cache_clear()
+    yield
+    security.twilio_signature_enabled.cache_clear()
+    security._twilio_auth_tokens.cache_clear()
+    security._public_base_url.cache_clear()
+
+
+def test_verifier_matches_twilio_request_validator():
+    signature = RequestValidator("tok").compute_signature(URL, PARAMS)
+    verifier = TwilioSignatureVerifier(["tok"])
+    assert verifier.verify(URL, urlencode(PARAMS).encode(), signature)
+    assert not verifier.verify(URL, urlencode({**PARAMS, "Body": "x"}).encode(), signature)
+
+
+def test_verifier_accepts_url_with_default_port():
+    signature = RequestValidator("tok").compute_signature("https://example.ngrok.app:443/message", PARAMS)
+    assert TwilioSignatureVerifier(["tok"]).verify(URL, urlencode(PARAMS).encode(), signature)
+
+
+def test_verifier_accepts_any_rotated_token():
+    body = urlencode(PARAMS).encode()
+    verifier = TwilioSignatureVerifier(["new", "old"])
+    assert verifier.verify(URL, body, RequestValidator("old").compute_signature(URL, PARAMS))
+    assert not verifier.verify(URL, body, RequestValidator("other").compute_signature(URL, PARAMS))
+
+
+def test_verifier_checks_body_hash_for_json():
+    body = b'{"Body": "hola"}'
+    validator = RequestValidator("tok")
+    url = f"{URL}?bodySHA256={validator.compute_hash(body.decode())}"
+    signature = validator.compute_signature(url, {})
+    verifier = TwilioSignatureVerifier(["tok"])
+    assert verifier.verify(url, body, signature, form_encoded=False)
+    assert not verifier.verify(url, b'{"Body": "adios"}', signature, form_encoded=False)
+
+
+@patch("app.main.send_message")
+@patch("app.main.llm_sales_reply", return_value="Respuesta demo")
+def test_webhook_accepts_previous_token(mock_llm, mock_send, signed_webhooks):
+    signature = RequestValidator("old-token").compute_signature(URL, PARAMS)
+    with patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal"):
+        response = client.post("/message", data=PARAMS, headers={"X-Twilio-Signature": signature})
+    assert response.status_code == 200
+    mock_llm.assert_called_once()
+
+
+@patch("app.main.llm_sales_reply")
+def test_webhook_rejects_bad_signature(mock_llm, signed_webhooks):
+    with patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal"):
+        response = client.post("/message", data=PARAMS, headers={"X-Twilio-Signature": "bogus"})
+    assert response.status_code == 403
+    mock_llm.assert_not_called()
+
+
+def test_webhook_rejects_multipart_before_reading_body(signed_webhooks):
+    with patch("starlette.requests.Request.body") as mock_body:
+        response = client.post(
+            "/message",
+            data=PARAMS,
+            files={"upload": ("big.bin", b"x" * 4096)},
+            headers={"X-Twilio-Signature": "c2lnbmF0dXJl"},
+        )
+    assert response.status_code == 403
+    mock_body.assert_not_called()
+
+
+def _echo_app(**limits) -> TestClient:
+    echo = FastAPI()
+    echo.add_middleware(LimitBodySizeMiddleware, **limits)
+
+    @echo.post("/{path:path}")
+    async def read_all(request: Request):
+        return {"size": len(await request.body())}
+
+    return TestClient(echo)
+
+
+def _chunks(total: int, size: int = 1024):
+    for _ in range(total // size):
+        yield b"x" * size
+
+
+def test_body_limit_aborts_chunked_upload_without_content_length():
+    echo = _echo_app(max_bytes=4096)
+    response = echo.post("/upload", content=_chunks(64 * 1024))
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large"}
+
+
+def test_body_limit_allows_chunked_upload_under_cap():
+    echo = _echo_app(max_bytes=4096)
+    response = echo.post("/upload", content=_chunks(4096))
+    assert response.status_code == 200
+    assert response.json() == {"size": 4096}
+
+
+def test_body_limit_uses_longest_route_prefix():
+    echo = _echo_app(max_bytes=1024, route_limits={"/api/": 8192, "/api/small": 16})
+    assert echo.post("/api/upload", content=b"x" * 4096).status_code == 200
+    assert echo.post("/api/small", content=b"x" * 32).status_code == 413
+    assert echo.post("/other", content=b"x" * 4096).status_code == 413
+
+
+def test_body_limit_replaces_fastapi_body_parsing_error():
+    echo = FastAPI()
+    echo.add_middleware(LimitBodySizeMiddleware, max_bytes=64)
+
+    @echo.post("/items")
+    async def create(item: dict = Body(...)):
+        return item
+
+    response = TestClient(echo).post("/items", content=(b'{"a": "' + b"x" * 32 for _ in range(4)))
+    assert response.status_code == 413  # not FastAPI's 400 "error parsing the body"
+
+
+@patch("app.main.llm_sales_reply")
+def test_oversized_chunked_webhook_gets_413_from_the_app(mock_llm):
+    response = client.post(
+        "/message",
+        content=_chunks(MAX_WEBHOOK_BODY_BYTES + 64 * 1024, 64 * 1024),
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large"}
+    assert response.headers["connection"] == "close"
+    mock_llm.assert_not_called()
@@ -0,0 +1,137 @@
+import asyncio
+import multiprocessing
+import os
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import state
+from app.ordering import SenderDebouncer
+from app.state import MemoryStateBackend, SQLiteStateBackend
+
+WORKERS = 4
+SIDS = [f"SM{i:032d}" for i in range(40)]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateBackend()
+    return SQLiteStateBackend(str(tmp_path / "state.sqlite3"))
+
+
+def test_add_if_absent_claims_once(backend):
+    assert backend.add_if_absent("sid:1")
+    assert not backend.add_if_absent("sid:1")
+    assert backend.get("sid:1") == "1"
+
+
+def test_expired_keys_can_be_reclaimed(backend):
+    with patch("app.state.time.time", return_value=1_000.0):
+        assert backend.add_if_absent("sid:1", ttl=10)
+        assert backend.incr("hits", ttl=10) == 1
+    with patch("app.state.time.time", return_value=1_011.0):
+        assert backend.get("sid:1") is None
+        assert backend.add_if_absent("sid:1", ttl=10)
+        assert backend.incr("hits", 5, ttl=10) == 5
+
+
+def test_set_incr_delete(backend):
+    backend.set("k", "v")
+    assert backend.get("k") == "v"
+    backend.delete("k")
+    assert backend.get("k") is None
+    assert backend.incr("n") == 1
+    assert backend.incr("n", 2) == 3
+
+
+def test_get_state_backend_from_config(monkeypatch, tmp_path):
+    monkeypatch.setenv("STATE_BACKEND", "sqlite")
+    monkeypatch.setenv("STATE_SQLITE_PATH", str(tmp_path / "shared.sqlite3"))
+    assert isinstance(state.get_state_backend(), SQLiteStateBackend)
+    assert state.get_state_backend() is state.get_state_backend()
+
+
+def _webhook_worker(db_path: str, sids: list[str]) -> int:
+    """One uvicorn-style worker process replaying the same Twilio deliveries."""
+    os.environ["STATE_BACKEND"] = "sqlite"
+    os.environ["STATE_SQLITE_PATH"] = db_path
+    from app.main import app
+
+    with patch("app.main.send_message"), patch(
+        "app.main.llm_sales_reply", return_value="ok"
+    ) as mock_llm, patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal"):
+        client = TestClient(app)
+        for sid in sids:
+            response = client.post(
+                "/message",
+                data={"Body": "hola", "From": "whatsapp:+1", "To": "whatsapp:+2", "MessageSid": sid},
+            )
+            assert response.status_code == 200
+    return mock_llm.call_count
+
+
+def test_concurrent_workers_handle_each_webhook_once(tmp_path):
+    db_path = str(tmp_path / "state.sqlite3")
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(WORKERS) as pool:
+        handled = pool.starmap(_webhook_worker, [(db_path, SIDS)] * WORKERS)
+    assert sum(handled) == len(SIDS)
+
+
+@patch("app.main.send_message")
+@patch("app.main.llm_sales_reply", return_value="ok")
+def test_duplicate_message_sid_is_ignored(mock_llm, mock_send):
+    from app.main import app
+
+    client = TestClient(app)
+    data = {"Body": "hola", "From": "whatsapp:+1", "To": "whatsapp:+2", "MessageSid": "SM1"}
+    with patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal"):
+        assert client.post("/message", data=data).json() == {"ok": True}
+        assert client.post("/message", data=data).json() == {"ok": True, "duplicate": True}
+    mock_llm.assert_called_once()
+
+
+@patch("app.main._store")
+@patch("app.main.send_message", side_effect=RuntimeError("twilio down"))
+@patch("app.main.llm_sales_reply", return_value="ok")
+def test_failed_send_is_stored_and_acknowledged(mock_llm, mock_send, mock_store):
+    from app.main import app
+
+    client = TestClient(app)
+    data = {"Body": "hola", "From": "whatsapp:+1", "To": "whatsapp:+2", "MessageSid": "SM2"}
+    with patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal"):
+        assert client.post("/message", data=data).json() == {"ok": True}
+        assert client.post("/message", data=data).json() == {"ok": True, "duplicate": True}
+    mock_store.assert_called_once()
+    assert mock_store.call_args.args[1:4] == ("whatsapp:+1", "hola", "ok")
+    assert mock_store.call_args.kwargs["branch"] == "send_error"
+
+
+@patch("app.main.send_message")
+@patch("app.main.llm_sales_reply", side_effect=RuntimeError("openai down"))
+def test_failed_burst_releases_every_merged_message_sid(mock_llm, mock_send, monkeypatch):
+    from app import main
+
+    monkeypatch.setattr(main, "sender_debouncer", SenderDebouncer(0.05))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            first = asyncio.create_task(
+                client.post("/message", data={"Body": "hola", "From": "whatsapp:+1", "MessageSid": "SM3"})
+            )
+            await asyncio.sleep(0.01)
+            second = await client.post(
+                "/message", data={"Body": "precio?", "From": "whatsapp:+1", "MessageSid": "SM4"}
+            )
+            return (await first).json(), second.status_code
+
+    with patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal"):
+        follower, leader = asyncio.run(scenario())
+    assert (follower, leader) == ({"ok": True, "merged": True}, 500)
+    assert mock_llm.call_args.args[0] == "hola\nprecio?"
+    backend = state.get_state_backend()
+    assert backend.get("twilio:sid:SM3") is None and backend.get("twilio:sid:SM4") is None
@@ -0,0 +1,98 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import stats
+from app.main import _store, app, get_chat_db
+from app.models import Conversation, ConversationHourlyStat, SenderStat
+from app.stats import hour_bucket, stats_summary
+
+NOW = datetime(2026, 3, 10, 15, 40, tzinfo=timezone.utc)
+AUTH = ("admin", "secret")
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    tables = [Conversation.__table__, ConversationHourlyStat.__table__, SenderStat.__table__]
+    Conversation.metadata.create_all(engine, tables=tables)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+def _conversation(db, sender, branch, hour, latency_ms=100, **usage):
+    _store(
+        db,
+        sender,
+        "hola",
+        "respuesta",
+        branch=branch,
+        latency_ms=latency_ms,
+        created_at=NOW.replace(hour=hour, minute=5),
+        **usage,
+    )
+
+
+def test_hour_bucket_truncates_in_utc():
+    assert hour_bucket(datetime(2026, 3, 10, 15, 59, 59)) == datetime(2026, 3, 10, 15, tzinfo=timezone.utc)
+
+
+def test_rollups_are_maintained_on_store(db):
+    _conversation(
+        db, "whatsapp:+1", "llm", 14, latency_ms=900, prompt_tokens=300, completion_tokens=40, cost_micros=69
+    )
+    _conversation(db, "whatsapp:+1", "llm_fallback", 15, latency_ms=300)
+    _conversation(db, "whatsapp:+2", "llm", 15, latency_ms=500)
+    _conversation(db, "whatsapp:+1", "price", 15, latency_ms=20)
+    _conversation(db, "whatsapp:+3", "price", 3)  # outside a 3-hour window
+
+    summary = stats_summary(db, hours=3, now=NOW)
+
+    assert summary["total"] == 4
+    assert summary["llm_fallback_rate"] == round(1 / 3, 4)
+    assert summary["branches"]["llm"] == {
+        "count": 2,
+        "avg_latency_ms": 700,
+        "tokens": 340,
+        "cost_usd": 0.000069,
+    }
+    assert summary["cost_usd"] == 0.000069
+    assert [row["branches"] for row in summary["hourly"]] == [
+        {"llm": 1},
+        {"llm_fallback": 1, "llm": 1, "price": 1},
+    ]
+    assert summary["top_senders"][0]["sender"] == "whatsapp:+1"
+    assert summary["top_senders"][0]["count"] == 3
+    assert summary["top_senders"][0]["cost_usd"] == 0.000069
+    assert db.query(ConversationHourlyStat).count() == 5
+
+
+def test_api_stats_is_cached_and_requires_auth(db):
+    app.dependency_overrides[get_chat_db] = lambda: db
+    try:
+        client = TestClient(app)
+        assert client.get("/api/stats").status_code == 401
+        _store(db, "whatsapp:+1", "precio martillo", "$159.00", branch="price")
+        with patch("app.stats.stats_summary", wraps=stats.stats_summary) as summary:
+            first = client.get("/api/stats", auth=AUTH).json()
+            client.get("/api/stats", auth=AUTH)
+            assert summary.call_count == 1
+        assert first["total"] == 1
+        page = client.get("/stats", auth=AUTH)
+        assert page.status_code == 200 and "whatsapp:+1" in page.text
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_store_records_rollups_in_same_transaction():
+    db = MagicMock()
+    _store(db, "whatsapp:+1", "hola", "respuesta", branch="price")
+    assert db.execute.call_count == 2
+    db.commit.assert_called_once()
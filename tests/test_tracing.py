@@ -0,0 +1,83 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+pytest.importorskip("opentelemetry.sdk")
+
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor  # noqa: E402
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter  # noqa: E402
+
+from app import tracing  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture
+def spans():
+    exporter = InMemorySpanExporter()
+    assert tracing.configure_tracing(processor=SimpleSpanProcessor(exporter), ratio=1.0)
+    return exporter
+
+
+def _openai_client(content):
+    client = MagicMock()
+    client.chat.completions.create.return_value.choices = [MagicMock(message=MagicMock(content=content))]
+    return client
+
+
+def test_webhook_trace_covers_llm_and_send(spans):
+    with patch("app.main.ChatSessionLocal"), patch("app.main.CatalogSessionLocal"), patch(
+        "app.llm_logic.get_openai_client", return_value=_openai_client("Tenemos brochas.")
+    ), patch("app.utils.get_twilio_client") as twilio:
+        twilio.return_value.messages.create.return_value.sid = "SM1"
+        TestClient(app).post("/message", data={"Body": "hola, venden brochas?", "From": "whatsapp:+1"})
+
+    by_name = {span.name: span for span in spans.get_finished_spans()}
+    assert {"reply", "handle_message", "llm_sales_reply", "openai.chat.completions", "send_message"} <= set(
+        by_name
+    )
+    assert len({span.context.trace_id for span in by_name.values()}) == 1
+    assert by_name["handle_message"].parent.span_id == by_name["reply"].context.span_id
+    assert by_name["handle_message"].attributes["app.branch"] == "llm"
+    assert by_name["openai.chat.completions"].attributes["app.attempt"] == 1
+    assert by_name["openai.chat.completions"].attributes["app.model"] == "gpt-4o-mini"
+    assert by_name["send_message"].attributes["app.attempt"] == 1
+
+
+def test_sql_statements_become_spans(spans):
+    engine = create_engine("sqlite://")
+    tracing.instrument_engine(engine, "chat")
+    with tracing.span("parent"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    sql = [span for span in spans.get_finished_spans() if span.name == "db.chat"]
+    assert sql and sql[0].attributes["db.statement"] == "SELECT 1"
+    assert sql[0].attributes["db.system"] == "sqlite"
+
+
+def test_sampling_ratio_zero_records_nothing():
+    exporter = InMemorySpanExporter()
+    tracing.configure_tracing(processor=SimpleSpanProcessor(exporter), ratio=0.0)
+    with tracing.span("reply"):
+        tracing.set_span_attributes(branch="llm")
+    assert exporter.get_finished_spans() == ()
+
+
+def test_file_exporter_writes_json_lines(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure_tracing(
+        processor=SimpleSpanProcessor(tracing.JsonLinesSpanExporter(str(path))), ratio=1.0
+    )
+    with tracing.span("generate_pdf", attempt=2):
+        pass
+    record = json.loads(path.read_text().splitlines()[0])
+    assert record["name"] == "generate_pdf"
+    assert record["attributes"]["app.attempt"] == 2
+
+
+def test_helpers_are_noops_when_disabled():
+    with tracing.span("reply") as current:
+        tracing.set_span_attributes(branch="llm")
+    assert current is None
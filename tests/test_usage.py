@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+from app import llm_logic, usage
+from app.main import app
+from app.state import MemoryStateBackend
+from app.usage import Usage, current_policy, usage_from_response
+
+NOW = 1_780_000_000.0  # fixed epoch second for window keys
+
+
+def _response(text, **counts):
+    return SimpleNamespace(output_text=text, usage=SimpleNamespace(**counts))
+
+
+def test_usage_is_read_from_both_apis_and_priced():
+    chat = usage_from_response("gpt-4o-mini", _response("", prompt_tokens=200, completion_tokens=30))
+    assert chat == Usage("gpt-4o-mini", 200, 30)
+    responses = usage_from_response("gpt-5", _response("", input_tokens=1000, output_tokens=100))
+    assert responses.cost_micros == 1250 + 1000
+    assert usage_from_response("gpt-5", MagicMock()).prompt_tokens == 0
+
+
+def test_conversation_stores_tokens_of_its_calls():
+    client = MagicMock()
+    client.chat.completions.create.return_value = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="Sí, tenemos."))],
+        usage=SimpleNamespace(prompt_tokens=250, completion_tokens=12),
+    )
+    with patch("app.main.ChatSessionLocal") as sessions, patch("app.main.CatalogSessionLocal"), patch(
+        "app.llm_logic.get_openai_client", return_value=client
+    ), patch("app.main.send_message"):
+        TestClient(app).post("/message", data={"Body": "venden brochas?", "From": "whatsapp:+1"})
+    conversation = sessions.return_value.add.call_args.args[0]
+    assert (conversation.prompt_tokens, conversation.completion_tokens) == (250, 12)
+    assert conversation.cost_micros == round(250 * 0.15 + 12 * 0.60)
+
+
+def test_ledger_flushes_windows_to_shared_state():
+    backend = MemoryStateBackend()
+    ledger = usage.UsageLedger(flush_seconds=3600)
+    with patch("app.usage.get_state_backend", return_value=backend):
+        ledger.record(Usage("gpt-5", 1000, 100), now=NOW)
+        assert backend.get(usage._windows(NOW)[0]) is None  # not flushed yet
+        assert ledger.spent_micros(NOW) == (2250, 2250)
+        ledger.flush(NOW)
+    hour_key, day_key = usage._windows(NOW)
+    assert backend.get(hour_key) == "2250" and backend.get(day_key) == "2250"
+    assert ledger.spent_micros(NOW) == (2250, 2250)
+
+
+def test_budget_pressure_disables_vision_escalation(monkeypatch):
+    monkeypatch.setattr(usage, "OPENAI_BUDGET_HOURLY_USD", 0.01)  # 10_000 micros
+    usage._ledger.record(Usage("gpt-5", 6000, 300))  # 10_500 micros: exhausted
+    assert current_policy().level == "exhausted"
+
+    nano = MagicMock(return_value=_response('{"anchor": "martillo", "description": "x", "confidence": 0.2}'))
+    gpt5 = MagicMock()
+    with patch.object(llm_logic, "_responses_call_image_gpt5nano", nano), patch.object(
+        llm_logic, "_responses_call_image_gpt5", gpt5
+    ):
+        result = llm_logic.llm_classify_image("https://example.com/a.jpg")
+    assert result["model"] == "gpt-5-nano"
+    gpt5.assert_not_called()
+
+
+def test_budget_pressure_lowers_reply_tokens(monkeypatch):
+    monkeypatch.setattr(usage, "OPENAI_BUDGET_DAILY_USD", 0.01)
+    usage._ledger.record(Usage("gpt-4o-mini", 60_000, 0))  # 9_000 micros = 90 %
+    client = MagicMock()
+    client.chat.completions.create.return_value.choices = [MagicMock(message=MagicMock(content="Ok"))]
+    with patch("app.llm_logic.get_openai_client", return_value=client):
+        llm_logic.llm_sales_reply("hola")
+    assert current_policy().level == "pressure"
+    assert client.chat.completions.create.call_args.kwargs["max_tokens"] == usage.OPENAI_MAX_TOKENS_UNDER_PRESSURE
+
+
+def test_usage_endpoint_requires_auth():
+    client = TestClient(app)
+    assert client.get("/api/usage").status_code == 401
+    body = client.get("/api/usage", auth=("admin", "secret")).json()
+    assert body["policy"]["level"] == "normal"
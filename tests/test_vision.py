@@ -0,0 +1,153 @@
+import json
+import random
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from app import llm_logic, vision_gate
+from app.vision_gate import GateModel, prefilter, train_gate_model
+
+
+def _response(anchor, confidence):
+    payload = {"anchor": anchor, "description": "algo", "confidence": confidence}
+    return SimpleNamespace(output_text=json.dumps(payload))
+
+
+@pytest.fixture
+def gate_enabled(monkeypatch):
+    pytest.importorskip("PIL")
+    monkeypatch.setenv("VISION_GATE_ENABLED", "true")
+    vision_gate.vision_gate_enabled.cache_clear()
+    yield
+    vision_gate.vision_gate_enabled.cache_clear()
+
+
+def _save_image(path, pixels):
+    from PIL import Image
+
+    img = Image.new("RGB", (80, 80))
+    img.putdata(pixels)
+    img.save(path)
+    return str(path)
+
+
+def _noise(seed=0):
+    rng = random.Random(seed)
+    return [(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(80 * 80)]
+
+
+def test_blank_image_rejected_locally(tmp_path, gate_enabled):
+    path = _save_image(tmp_path / "blank.png", [(250, 250, 250)] * (80 * 80))
+    with patch("app.llm_logic._responses_call_image_gpt5nano") as nano:
+        result = llm_logic.llm_classify_image(path)
+    nano.assert_not_called()
+    assert result["anchor"] is None
+    assert result["model"] == "local"
+    assert "local" in llm_logic.vision_tier_stats()["tiers"]
+
+
+def test_textured_image_goes_to_nano(tmp_path, gate_enabled):
+    path = _save_image(tmp_path / "noise.png", _noise())
+    with patch(
+        "app.llm_logic._responses_call_image_gpt5nano", return_value=_response("taladro", 0.9)
+    ) as nano, patch("app.llm_logic._responses_call_image_gpt5") as full:
+        result = llm_logic.llm_classify_image(path)
+    nano.assert_called_once()
+    full.assert_not_called()
+    assert result["anchor"] == "taladro"
+    assert result["model"] == "gpt-5-nano"
+
+
+def _wood(seed=0):
+    rng = random.Random(seed)
+    pixels = []
+    for _ in range(80):
+        for x in range(80):
+            grain = 30 if (x + rng.randrange(3)) % 9 < 3 else 0
+            pixels.append(
+                (190 - grain + rng.randrange(-8, 9), 120 - grain + rng.randrange(-8, 9), 60 - grain // 2)
+            )
+    return pixels
+
+
+def test_wooden_product_is_not_rejected_as_a_selfie(tmp_path, gate_enabled):
+    path = _save_image(tmp_path / "mango.png", _wood())
+    assert vision_gate.image_features(path)["skin_ratio"] > 0.9  # every pixel is "skin" toned
+    with patch(
+        "app.llm_logic._responses_call_image_gpt5nano", return_value=_response("martillo", 0.9)
+    ) as nano:
+        result = llm_logic.llm_classify_image(path)
+    nano.assert_called_once()
+    assert result["anchor"] == "martillo"
+
+
+def test_unreadable_gate_model_falls_through_to_nano(tmp_path, gate_enabled, monkeypatch, caplog):
+    model_path = tmp_path / "vision_gate.json"
+    model_path.write_text('{"features": ["luma_std"], "weights": [1.0]}')  # trained on other features
+    monkeypatch.setenv("VISION_GATE_MODEL_PATH", str(model_path))
+    path = _save_image(tmp_path / "noise.png", _noise())
+    with patch(
+        "app.llm_logic._responses_call_image_gpt5nano", return_value=_response("taladro", 0.9)
+    ) as nano:
+        results = [llm_logic.llm_classify_image(path) for _ in range(2)]
+    assert nano.call_count == 2
+    assert [result["anchor"] for result in results] == ["taladro", "taladro"]
+    assert sum("Vision gate failed" in record.getMessage() for record in caplog.records) == 1
+
+
+def test_low_confidence_nano_escalates_to_gpt5():
+    with patch(
+        "app.llm_logic._responses_call_image_gpt5nano", return_value=_response("broca", 0.2)
+    ), patch("app.llm_logic._responses_call_image_gpt5", return_value=_response("taladro", 0.8)):
+        result = llm_logic.llm_classify_image("https://example.com/a.jpg")
+    assert result["anchor"] == "taladro"
+    assert result["model"] == "gpt-5"
+
+
+def test_escalation_keeps_nano_when_gpt5_fails():
+    with patch(
+        "app.llm_logic._responses_call_image_gpt5nano", return_value=_response("broca", 0.2)
+    ), patch("app.llm_logic._responses_call_image_gpt5", side_effect=RuntimeError("down")):
+        result = llm_logic.llm_classify_image("https://example.com/a.jpg", max_retries=1)
+    assert result["anchor"] == "broca"
+    assert result["model"] == "gpt-5-nano"
+
+
+def test_prefilter_heuristics():
+    base = {
+        "luma_std": 40.0,
+        "luma_mean": 120.0,
+        "colorfulness": 30.0,
+        "edge_density": 0.2,
+        "color_diversity": 0.5,
+        "dominant_ratio": 0.05,
+        "skin_ratio": 0.0,
+        "aspect": 1.0,
+    }
+    assert prefilter(base).verdict == "ambiguous"
+    assert prefilter({**base, "luma_std": 1.0}).reason == "blank"
+    assert prefilter({**base, "dominant_ratio": 0.8, "color_diversity": 0.01}).reason == "screenshot"
+    skin_toned = {**base, "skin_ratio": 0.7}
+    assert prefilter(skin_toned) == ("ambiguous", "skin", 0.5)  # could be wood or copper
+    dims = len(vision_gate.FEATURE_NAMES)
+    model = GateModel((0.0,) * dims, 0.0, (0.0,) * dims, (1.0,) * dims)
+    assert prefilter(skin_toned, model._replace(bias=-1.0)).reason == "selfie"
+    assert prefilter(skin_toned, model._replace(bias=1.0)).verdict == "ambiguous"
+
+
+def test_train_gate_model_separates_logged_samples():
+    rng = random.Random(1)
+    samples = []
+    for _ in range(60):
+        product = rng.random() < 0.5
+        features = {name: rng.random() for name in vision_gate.FEATURE_NAMES}
+        features["edge_density"] = rng.uniform(0.3, 0.6) if product else rng.uniform(0.0, 0.1)
+        samples.append(
+            {"features": features, "anchor": "taladro" if product else None, "confidence": 0.9}
+        )
+    model = train_gate_model(samples)
+    restored = GateModel.from_json(json.loads(json.dumps(model.to_json())))
+    hit = {**samples[0]["features"], "edge_density": 0.5}
+    miss = {**samples[0]["features"], "edge_density": 0.02}
+    assert restored.score(hit) > 0.8 > 0.2 > restored.score(miss)
@@ -0,0 +1,204 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import vision_batch
+from app.main import app
+from app.state import get_state_backend
+from app.vision_batch import LocalBatchClient, ResultWriter, run_batch
+
+
+def _images(root, names):
+    root.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        (root / name).write_bytes(b"\xff\xd8fake-jpeg")
+    (root / "notes.txt").write_text("not an image")
+    return root
+
+
+def _lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def _responses_body(anchor, confidence):
+    text = json.dumps({"anchor": anchor, "description": "algo", "confidence": confidence})
+    return {"output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}]}
+
+
+def test_direct_mode_bounds_concurrency_and_resumes(tmp_path, monkeypatch):
+    source = _images(tmp_path / "imgs", [f"{n}.jpg" for n in range(12)])
+    active, peak, lock = [0], [0], threading.Lock()
+    calls = []
+
+    def classify(image, *, force_detail):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            calls.append(image)
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        if image.endswith("3.jpg"):
+            return {"anchor": None, "description": "", "confidence": 0.0, "model": None}
+        return {"anchor": "martillo", "description": "x", "confidence": 0.9, "model": "gpt-5-nano"}
+
+    monkeypatch.setattr(vision_batch, "llm_classify_image", classify)
+    out = tmp_path / "out.jsonl"
+    writer = ResultWriter(out)
+    run_batch(str(source), writer, concurrency=3)
+    writer.close()
+    assert peak[0] <= 3
+    assert writer.counts() == {"ok": 11, "failed": 1, "skipped": 0}
+    assert {line["custom_id"] for line in _lines(out)} == {f"{n}.jpg" for n in range(12)}
+
+    with out.open("a") as handle:
+        handle.write('{"custom_id": "7.jp')  # crash mid-write
+    calls.clear()
+    writer = ResultWriter(out)
+    run_batch(str(source), writer, concurrency=3)
+    writer.close()
+    assert sorted(calls) == [str(source / "3.jpg")]
+    assert writer.skipped == 11
+    assert _lines(out)[-1]["custom_id"] == "3.jpg"  # torn line was cut off
+
+
+def test_manifest_checks_claimed_anchor(tmp_path):
+    _images(tmp_path, ["a.jpg"])
+    manifest = tmp_path / "feed.csv"
+    manifest.write_text(
+        "sku,image,anchor\nSKU-1,a.jpg,Martillo\nSKU-2,https://cdn.example/b.png,taladro\n,,\n"
+    )
+    items = list(vision_batch.iter_source(str(manifest)))
+    claimed = [(item.custom_id, item.expected_anchor) for item in items]
+    assert claimed == [("SKU-1", "martillo"), ("SKU-2", "taladro")]
+    assert items[0].image == str(tmp_path / "a.jpg")
+
+    writer = ResultWriter(tmp_path / "out.jsonl")
+    answers = {"SKU-1": "martillo", "SKU-2": "sierra"}
+    vision_batch.classify_direct(
+        iter(items),
+        writer,
+        concurrency=2,
+        classify=lambda image, force_detail: {
+            "anchor": answers["SKU-1" if image.endswith("a.jpg") else "SKU-2"],
+            "confidence": 0.8,
+            "model": "gpt-5-nano",
+        },
+    )
+    writer.close()
+    matches = {line["custom_id"]: line["anchor_match"] for line in _lines(writer.path)}
+    assert matches == {"SKU-1": True, "SKU-2": False}
+
+
+def test_batch_api_format_and_error_lines(tmp_path):
+    _images(tmp_path, ["a.jpg"])
+    manifest = tmp_path / "feed.jsonl"
+    manifest.write_text('{"id": "a", "image": "a.jpg"}\n{"id": "b", "image": "https://x/b.jpg"}\n')
+    bodies = []
+
+    def handler(body):
+        bodies.append(body)
+        if body["input"][1]["content"][1]["image_url"] == "https://x/b.jpg":
+            raise RuntimeError("boom")
+        return _responses_body("martillo", 0.7)
+
+    writer = ResultWriter(tmp_path / "out.jsonl")
+    run_batch(str(manifest), writer, mode="batch", client=LocalBatchClient(handler))
+    writer.close()
+
+    assert {body["model"] for body in bodies} == {"gpt-5-nano"}
+    images = sorted(body["input"][1]["content"][1]["image_url"] for body in bodies)
+    assert images[0].startswith("data:image/jpeg;base64,")  # local file inlined
+    lines = {line["custom_id"]: line for line in _lines(writer.path)}
+    assert lines["a"]["anchor"] == "martillo" and lines["a"]["model"] == "gpt-5-nano"
+    assert lines["b"]["error"]["code"] == "RuntimeError"
+    assert not (tmp_path / "out.batch.json").exists()
+
+
+def test_batch_resume_polls_submitted_batch(tmp_path):
+    source = _images(tmp_path / "imgs", ["a.jpg", "b.jpg"])
+    client = LocalBatchClient(lambda body: _responses_body("sierra", 0.6))
+    # A previous run submitted a gpt-5 batch for a.jpg, then died while waiting.
+    line = vision_batch._request_line(vision_batch.BatchItem("a.jpg", str(source / "a.jpg")), "gpt-5", "low")
+    uploaded = client.files.create(file=("in.jsonl", io.BytesIO(line)), purpose="batch")
+    submitted = client.batches.create(
+        input_file_id=uploaded.id, endpoint="/v1/responses", completion_window="24h"
+    )
+    out = tmp_path / "out.jsonl"
+    out.with_name("out.batch.json").write_text(json.dumps({"batch_id": submitted.id, "model": "gpt-5"}))
+
+    writer = ResultWriter(out)
+    run_batch(str(source), writer, mode="batch", client=client)
+    writer.close()
+    lines = {line["custom_id"]: line for line in _lines(out)}
+    assert lines["a.jpg"]["model"] == "gpt-5"  # collected from the old batch
+    assert lines["b.jpg"]["model"] == "gpt-5-nano"  # submitted fresh
+    assert len(client._batches) == 2
+
+
+def test_admin_api_runs_job_and_streams_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(vision_batch, "VISION_BATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        vision_batch,
+        "llm_classify_image",
+        lambda image, force_detail: {"anchor": "brocha", "confidence": 0.9, "model": "gpt-5-nano"},
+    )
+    _images(tmp_path / "supplier", ["a.jpg", "b.jpg"])
+    client = TestClient(app)
+    auth = ("admin", "secret")
+
+    assert client.post("/api/vision/batch?name=s1&source=supplier").status_code == 401
+    assert client.post("/api/vision/batch?name=s1&source=../etc", auth=auth).status_code == 400
+
+    started = client.post("/api/vision/batch?name=s1&source=supplier&concurrency=2", auth=auth)
+    assert started.status_code == 202
+    vision_batch.get_batch_job("s1").thread.join(5)
+
+    status = client.get("/api/vision/batch/s1", auth=auth).json()
+    assert (status["status"], status["ok"], status["failed"]) == ("finished", 2, 0)
+    results = client.get("/api/vision/batch/s1/results", auth=auth)
+    assert results.headers["content-type"].startswith("application/x-ndjson")
+    assert sorted(json.loads(line)["custom_id"] for line in results.text.splitlines()) == ["a.jpg", "b.jpg"]
+    assert client.get("/api/vision/batch/nope", auth=auth).status_code == 404
+
+
+
+def test_admin_jobs_are_claimed_and_reported_across_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(vision_batch, "VISION_BATCH_DIR", str(tmp_path))
+    release = threading.Event()
+
+    def classify(image, force_detail):
+        release.wait(5)
+        return {"anchor": "brocha", "confidence": 0.9, "model": "gpt-5-nano"}
+
+    monkeypatch.setattr(vision_batch, "llm_classify_image", classify)
+    _images(tmp_path / "supplier", ["a.jpg"])
+    client = TestClient(app)
+    auth = ("admin", "secret")
+
+    # Another worker holds the claim: this one must not start the job too.
+    get_state_backend().add_if_absent("vision_batch:s2")
+    assert client.post("/api/vision/batch?name=s2&source=supplier", auth=auth).status_code == 409
+    get_state_backend().delete("vision_batch:s2")
+
+    assert client.post("/api/vision/batch?name=s2&source=supplier", auth=auth).status_code == 202
+    job = vision_batch.get_batch_job("s2")
+    with monkeypatch.context() as other_worker:
+        other_worker.setattr(vision_batch, "_jobs", {})
+        assert client.get("/api/vision/batch/s2", auth=auth).json()["status"] == "running"
+        assert client.post("/api/vision/batch?name=s2&source=supplier", auth=auth).status_code == 409
+        release.set()
+        job.thread.join(5)
+        status = client.get("/api/vision/batch/s2", auth=auth).json()
+        assert (status["status"], status["ok"]) == ("finished", 1)
+    assert get_state_backend().get("vision_batch:s2") is None  # claim released
+
+
+@pytest.fixture(autouse=True)
+def _clear_jobs():
+    yield
+    vision_batch._jobs.clear()